@@ -0,0 +1,73 @@
+# Measure passage-range retrieval throughput of the memory-mapped verse store
+#
+# A synthetic translation the size of a real Bible (about 31,000 verses) is generated and imported,
+# then random ranges are read back; an indexed SQLite table is timed alongside for comparison.
+# Usage: python benchmarks/bench_bible.py [--lookups 100000] [--max-range 10]
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_block.bible import BOOKS, BibleVersion, write_version
+
+
+# Define a function to generate verses for every book with realistic chapter and verse counts
+def synthetic_verses(rng):
+    for book in range(1, len(BOOKS) + 1):
+        for chapter in range(1, rng.randint(1, 50) + 1):
+            for verse in range(1, rng.randint(10, 35) + 1):
+                yield book, chapter, verse, f'{BOOKS[book - 1]} {chapter}:{verse} ' + 'lorem ipsum dolor ' * rng.randint(2, 8)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--max-range', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    verses = list(synthetic_verses(rng))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.bbl')
+        begin = time.perf_counter()
+        write_version(path, verses)
+        print(f'imported {len(verses)} verses in {time.perf_counter() - begin:.2f} s '
+              f'({os.path.getsize(path) / 1e6:.1f} MB)')
+
+        chapters = sorted({(b, c) for b, c, _, _ in verses})
+        counts = {}
+        for b, c, v, _ in verses:
+            counts[(b, c)] = max(counts.get((b, c), 0), v)
+        queries = []
+        for _ in range(args.lookups):
+            b, c = rng.choice(chapters)
+            start = rng.randint(1, counts[(b, c)])
+            queries.append((b, c, start, min(counts[(b, c)], start + rng.randint(0, args.max_range - 1))))
+
+        bible = BibleVersion(path)
+        begin = time.perf_counter()
+        returned = sum(len(bible.passage(b, c, s, c, e)) for b, c, s, e in queries)
+        elapsed = time.perf_counter() - begin
+        print(f'  mmap store: {args.lookups / elapsed:10.0f} passages/s, {returned / elapsed:10.0f} verses/s')
+        bible.close()
+
+        conn = sqlite3.connect(os.path.join(tmp, 'baseline.db'))
+        conn.execute('CREATE TABLE verse (book INTEGER, chapter INTEGER, verse INTEGER, text TEXT, '
+                     'PRIMARY KEY (book, chapter, verse)) WITHOUT ROWID')
+        conn.executemany('INSERT INTO verse VALUES (?, ?, ?, ?)', verses)
+        conn.commit()
+        begin = time.perf_counter()
+        returned = sum(len(conn.execute('SELECT verse, text FROM verse WHERE book = ? AND chapter = ? '
+                                        'AND verse BETWEEN ? AND ?', query).fetchall()) for query in queries)
+        elapsed = time.perf_counter() - begin
+        print(f'sqlite table: {args.lookups / elapsed:10.0f} passages/s, {returned / elapsed:10.0f} verses/s')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Compare throughput under concurrent connections across the servers `flask serve` supports
+#
+# Seeds a throwaway database, then starts each installed server in turn as a subprocess and hits the
+# feed, post, user and search pages from many client threads at once. The development server that
+# run.py starts is the baseline. Servers that are not installed are skipped.
+# Usage: python benchmarks/bench_concurrency.py [--connections 1,16,64] [--seconds 5] [--workers 4] [--threads 8]
+import argparse
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('PAGE_CACHE_TYPE', 'null')
+
+from flask_block import app, db
+from flask_block.seed import seed_database
+from flask_block.server import available
+
+
+# Define a function to start `flask serve` in a subprocess and wait until it accepts connections
+def start_server(server, port, workers, threads):
+    command = [sys.executable, '-m', 'flask', '--app', 'flask_block', 'serve', '--server', server,
+               '--port', str(port), '--workers', str(workers), '--threads', str(threads)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{server} did not start')
+
+
+# Define a function keeping `connections` clients busy for `seconds`, returning (requests/s, p50 ms, p99 ms, errors)
+def load(port, paths, connections, seconds):
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        local, failed = [], 0
+        while time.perf_counter() < stop:
+            begin = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                conn.request('GET', rng.choice(paths))
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                if response.status != 200:
+                    failed += 1
+            except OSError:
+                failed += 1
+            local.append((time.perf_counter() - begin) * 1000)
+        with lock:
+            samples.extend(local)
+            errors.append(failed)
+
+    begin = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+
+    samples.sort()
+    return (len(samples) / elapsed, samples[len(samples) // 2],
+            samples[min(len(samples) - 1, int(len(samples) * 0.99))], sum(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', default='1,16,64')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed_database(users=200, posts=args.posts)
+        post_ids = [row[0] for row in db.session.execute(db.text('SELECT id FROM post ORDER BY id DESC LIMIT 500'))]
+    paths = ['/', '/home', '/about', '/search?q=grace'] + [f'/post/{i}' for i in post_ids[:50]] + \
+            [f'/user/seed{i}' for i in range(1, 51)]
+
+    # (label, server, workers, threads); the first two are what run.py's development server offers
+    setups = [
+        ('dev server, 1 thread', 'werkzeug', 1, 1),
+        ('dev server, threaded (run.py)', 'werkzeug', 1, args.threads),
+        (f'waitress, {args.threads} threads', 'waitress', 1, args.threads),
+        (f'gunicorn, {args.workers}x{args.threads} gthread', 'gunicorn', args.workers, args.threads),
+        (f'uvicorn, {args.workers}x{args.threads} a2wsgi threads', 'uvicorn', args.workers, args.threads),
+    ]
+    levels = [int(n) for n in args.connections.split(',')]
+    print(f'{"setup":42} {"conns":>5} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>6}')
+    for label, server, workers, threads in setups:
+        if not available(server):
+            print(f'{label:42} skipped: {server} is not installed')
+            continue
+        process = start_server(server, args.port, workers, threads)
+        try:
+            load(args.port, paths, 4, 1)  # warm up every worker
+            for connections in levels:
+                rate, p50, p99, errors = load(args.port, paths, connections, args.seconds)
+                print(f'{label:42} {connections:5} {rate:8.1f} {p50:8.2f} {p99:8.2f} {errors:6}')
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    main()
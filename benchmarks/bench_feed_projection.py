@@ -0,0 +1,90 @@
+# Compare feed queries loading whole posts with the card projection, on long posts
+#
+# Runs against a throwaway database, so site.db is left untouched.
+# Usage: python benchmarks/bench_feed_projection.py [--posts 20000] [--words 3000]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['PAGE_CACHE_TYPE'] = 'null'
+
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload
+from flask_block import app, db
+from flask_block.modules import User, Post, summarize_content
+from flask_block.routes import card_query
+
+WORDS = 'grace faith hope love mercy psalm gospel covenant spirit prayer light shepherd kingdom'.split()
+
+
+# Define a function to time a callable, returning the median latency in milliseconds
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - begin) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=3000, help='words per post body')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [{'id': 1, 'username': 'bench', 'email': 'bench@demo.com',
+                                           'password': 'x'}])
+        start = datetime(2020, 1, 1)
+        rows = []
+        for i in range(args.posts):
+            content = ' '.join(rng.choices(WORDS, k=args.words)) + ' See John 3:16.'
+            rows.append(dict(title=f'Study {i}', content=content, user_id=1,
+                             date_posted=start + timedelta(minutes=i), **summarize_content(content)))
+            if len(rows) == 1000:
+                db.session.execute(insert(Post), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(Post), rows)
+        db.session.commit()
+
+        full_query = Post.query.options(joinedload(Post.author)).order_by(Post.date_posted.desc()).limit(5)
+        card = card_query().order_by(Post.date_posted.desc()).limit(5)
+
+        def fetched_bytes(query):
+            rows = db.session.connection().execute(query.statement).fetchall()
+            return sum(len(str(value)) for row in rows for value in row)
+
+        def load(query):
+            db.session.expunge_all()
+            query.all()
+
+        print(f'{args.posts} posts of {args.words} words, one feed page of 5:')
+        print(f'  full rows: {timed(lambda: load(full_query), args.repeat):7.2f} ms, '
+              f'{fetched_bytes(full_query):>8} bytes fetched')
+        print(f'  card rows: {timed(lambda: load(card), args.repeat):7.2f} ms, '
+              f'{fetched_bytes(card):>8} bytes fetched')
+
+        full_bytes = sum(len(p.content.encode('utf-8')) for p in full_query)
+
+    client = app.test_client()
+    response = client.get('/')
+    render_ms = timed(lambda: client.get('/'), args.repeat)
+    print(f'  home page:  {len(response.data)} bytes, {render_ms:.2f} ms '
+          f'(the five full bodies alone would add {full_bytes} bytes)')
+
+
+if __name__ == '__main__':
+    main()
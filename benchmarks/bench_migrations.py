@@ -0,0 +1,109 @@
+# Measure how long `flask db-upgrade` takes on a large pre-migration database, and how long a
+# concurrent writer waits while it runs, with batched backfills and with one transaction per step
+#
+# Each run starts from a copy of the schema as first shipped (migration 0001) filled with posts,
+# applies the remaining migrations, and adds one post every few milliseconds from another thread.
+# Usage: python benchmarks/bench_migrations.py [--posts 200000] [--batch-sizes 1000,100000000]
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import create_engine
+from flask_block import app
+from flask_block.database import sqlite_engine_options, configure_sqlite_engine
+from flask_block.migrations import upgrade
+from flask_block.seed import make_body
+
+
+# Define a function to build a database at the first migration, filled with users and posts
+def build_baseline(path, users, posts):
+    engine = make_engine(path)
+    upgrade(engine, target=1)
+    engine.dispose()
+    rng = random.Random(1)
+    bodies = [make_body(rng) for _ in range(200)]
+    start = datetime(2020, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO user (id, username, email, image_file, password) VALUES (?, ?, ?, 'default.jpg', 'x')",
+                     [(i, f'user{i}', f'user{i}@demo.com') for i in range(1, users + 1)])
+    conn.executemany("INSERT INTO post (title, date_posted, content, user_id) VALUES (?, ?, ?, ?)",
+                     [(f'Post {i}', (start + timedelta(minutes=i)).isoformat(' '), bodies[i % len(bodies)],
+                       i % users + 1) for i in range(posts)])
+    conn.commit()
+    conn.close()
+
+
+# Define a function to create an engine the way the app does
+def make_engine(path):
+    engine = create_engine('sqlite:///' + path, **sqlite_engine_options(app.config))
+    configure_sqlite_engine(engine, app.config)
+    return engine
+
+
+# Define a writer process adding a post every `interval` seconds until stopped, reporting how long each insert took
+def writer(path, interval, stop, results):
+    conn = sqlite3.connect(path, timeout=60)
+    waits = []
+    while not stop.is_set():
+        begin = time.perf_counter()
+        conn.execute("INSERT INTO post (title, date_posted, content, user_id) VALUES ('Live', ?, 'Live post', 1)",
+                     (datetime.utcnow().isoformat(' '),))
+        conn.commit()
+        waits.append(time.perf_counter() - begin)
+        time.sleep(interval)
+    conn.close()
+    results.put(waits)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--batch-sizes', default='1000,100000000')
+    parser.add_argument('--pause', type=float, default=0.0)
+    parser.add_argument('--interval', type=float, default=0.005)
+    args = parser.parse_args()
+
+    template = os.path.join(tempfile.mkdtemp(), 'baseline.db')
+    build_baseline(template, args.users, args.posts)
+    with open(template, 'rb') as f:
+        baseline = f.read()
+
+    print(f'{"batch size":>11} {"upgrade s":>10} {"writes":>7} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>9}')
+    for batch_size in [int(n) for n in args.batch_sizes.split(',')]:
+        path = os.path.join(tempfile.mkdtemp(), 'migrate.db')
+        with open(path, 'wb') as f:
+            f.write(baseline)
+        engine = make_engine(path)
+        # Switch to WAL before the writer starts, as the app's first connection would
+        engine.connect().close()
+
+        # The writer runs in its own process, like another app worker would
+        stop, results = multiprocessing.Event(), multiprocessing.Queue()
+        process = multiprocessing.Process(target=writer, args=(path, args.interval, stop, results))
+        process.start()
+        begin = time.perf_counter()
+        upgrade(engine, batch_size=batch_size, pause=args.pause)
+        elapsed = time.perf_counter() - begin
+        stop.set()
+        waits = results.get()
+        process.join()
+        engine.dispose()
+
+        waits.sort()
+        print(f'{batch_size:11} {elapsed:10.2f} {len(waits):7} {waits[len(waits) // 2] * 1000:8.2f} '
+              f'{waits[int(len(waits) * 0.99)] * 1000:8.2f} {waits[-1] * 1000:9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Compare anonymous page throughput with the rendered page cache disabled and enabled
+#
+# Usage: python benchmarks/bench_page_cache.py [--requests 500] [--threads 4]
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from flask_block import app, page_cache
+from flask_block.cache import LRUBackend
+from flask_block.modules import Post
+
+
+# Define a function to pick a representative set of public URLs from the database
+def public_urls():
+    with app.app_context():
+        post = Post.query.order_by(Post.date_posted.desc()).first()
+        return ['/', '/home', f'/post/{post.id}', f'/user/{post.author.username}']
+
+
+# Define a function to drive the URLs from several threads, returning per-request latencies
+def run(urls, requests, threads):
+    def worker(count):
+        client = app.test_client()
+        latencies = []
+        for i in range(count):
+            begin = time.perf_counter()
+            assert client.get(urls[i % len(urls)]).status_code == 200
+            latencies.append(time.perf_counter() - begin)
+        return latencies
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(worker, [requests // threads] * threads))
+    elapsed = time.perf_counter() - begin
+    latencies = sorted(l for chunk in results for l in chunk)
+    return len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    urls = public_urls()
+    print(f"{'mode':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode in ('null', 'simple'):
+        page_cache.backend = None if mode == 'null' else LRUBackend(1024, 300)
+        page_cache.hits = page_cache.misses = 0
+        throughput, p50, p99 = run(urls, args.requests, args.threads)
+        print(f'{mode:>8} {throughput:>9.1f} {p50:>8.2f} {p99:>8.2f}')
+    print('cache stats:', page_cache.stats())
+
+
+if __name__ == '__main__':
+    main()
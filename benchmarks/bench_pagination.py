@@ -0,0 +1,93 @@
+# Benchmark offset pagination against keyset (cursor) pagination on a large post table
+#
+# Usage: python benchmarks/bench_pagination.py [--rows 1000000 2000000] [--depths 1 100 10000]
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from flask_block import db
+from flask_block.modules import Post
+from flask_block.pagination import keyset_paginate, encode_cursor
+
+PER_PAGE = 5
+
+
+# Define a function to bulk-load a fresh database with the given number of posts
+def build_database(path, rows):
+    engine = create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine)
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO user (id, username, email, image_file, password) "
+                 "VALUES (1, 'bench', 'bench@demo.com', 'default.jpg', 'x')")
+    start = datetime(2020, 1, 1)
+    batch = []
+    for i in range(1, rows + 1):
+        batch.append((i, f'Post {i}', (start + timedelta(seconds=i)).isoformat(' '), 'Lorem ipsum', 1))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO post (id, title, date_posted, content, user_id) VALUES (?, ?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO post (id, title, date_posted, content, user_id) VALUES (?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+    return engine
+
+
+# Define a function to time a callable, returning the median latency in milliseconds
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - begin) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'page':>8} {'offset ms':>10} {'keyset ms':>10}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_database(os.path.join(tmp, 'bench.db'), rows)
+            with Session(engine) as session:
+                query = session.query(Post)
+                for depth in args.depths:
+                    offset = (depth - 1) * PER_PAGE
+                    if offset >= rows:
+                        continue
+
+                    # Offset mode pays for the skipped rows and a full count on every page
+                    def offset_page():
+                        query.order_by(Post.date_posted.desc()).limit(PER_PAGE).offset(offset).all()
+                        query.order_by(None).count()
+
+                    # Keyset mode seeks straight to the cursor left by the previous page
+                    cursor = None
+                    if offset:
+                        anchor = query.order_by(Post.date_posted.desc(), Post.id.desc()).offset(offset - 1).first()
+                        cursor = encode_cursor(anchor)
+
+                    def keyset_page():
+                        keyset_paginate(query, after=cursor, per_page=PER_PAGE)
+
+                    print(f"{rows:>10} {depth:>8} {timed(offset_page, args.repeat):>10.2f} "
+                          f"{timed(keyset_page, args.repeat):>10.2f}")
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
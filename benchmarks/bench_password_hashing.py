@@ -0,0 +1,64 @@
+# Measure bcrypt cost per work factor and how the app behaves under a burst of logins
+#
+# Runs against a throwaway database, so site.db is left untouched.
+# Usage: python benchmarks/bench_password_hashing.py [--burst 64] [--threads 32]
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from flask_block import app, db, bcrypt, password_hasher, rate_limiter
+from flask_block.modules import User
+
+
+# Define a function to fire a burst of login attempts at once, returning status counts and elapsed time
+def burst(attempts, threads, password):
+    def attempt(n):
+        return app.test_client().post('/login', data={'username': 'bench', 'password': password},
+                                      environ_base={'REMOTE_ADDR': f'10.0.{n // 250}.{n % 250}'}).status_code
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        codes = Counter(pool.map(attempt, range(attempts)))
+    return codes, time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--burst', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    print('cost per hash:')
+    for rounds in (10, 11, 12, 13):
+        begin = time.perf_counter()
+        bcrypt.generate_password_hash('benchmark', rounds)
+        print(f'  rounds {rounds}: {(time.perf_counter() - begin) * 1000:7.1f} ms')
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', email='bench@demo.com', password=password_hasher.hash('secret')))
+        db.session.commit()
+
+    # Distinct client addresses, so only the per-username bucket and the hashing queue push back
+    print(f'\n{args.burst} wrong-password logins from {args.threads} threads:')
+    rate_limiter.enabled = False
+    codes, elapsed = burst(args.burst, args.threads, 'wrong')
+    print(f'  queue limit only:  {dict(codes)} in {elapsed:.2f} s')
+
+    rate_limiter.enabled = True
+    rate_limiter.reset()
+    codes, elapsed = burst(args.burst, args.threads, 'wrong')
+    print(f'  with rate limiter: {dict(codes)} in {elapsed:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Measure sign-up throughput under concurrency, the queries each sign-up costs, and duplicate races
+#
+# Runs against a throwaway database, so site.db is left untouched. bcrypt runs at a low cost so the
+# numbers show the database work rather than the password hash.
+# Usage: python benchmarks/bench_registration.py [--signups 400] [--concurrency 8] [--bcrypt-rounds 4]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['PAGE_CACHE_TYPE'] = 'null'
+
+from sqlalchemy import event
+from flask_block import app, db, password_hasher, rate_limiter
+
+# Statements issued, by kind
+statements = {'SELECT': 0, 'INSERT': 0}
+lock = threading.Lock()
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    kind = statement.split(None, 1)[0].upper()
+    if kind in statements:
+        with lock:
+            statements[kind] += 1
+
+
+# Define a function to submit the sign-up form, returning the status code
+def sign_up(client, name, email=None):
+    response = client.post('/register', data={'username': name, 'email': email or f'{name}@demo.com',
+                                              'password': 'pw', 'confirm_password': 'pw'})
+    return response.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--signups', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    rate_limiter.enabled = False
+    password_hasher.rounds = args.bcrypt_rounds
+
+    with app.app_context():
+        db.create_all()
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+    clients = [app.test_client() for _ in range(args.concurrency)]
+
+    # Distinct sign-ups spread over the workers
+    def register_batch(worker):
+        codes = []
+        for i in range(worker, args.signups, args.concurrency):
+            codes.append(sign_up(clients[worker], f'user{i}'))
+        return codes
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        codes = [code for batch in pool.map(register_batch, range(args.concurrency)) for code in batch]
+    elapsed = time.perf_counter() - begin
+    created = codes.count(302)
+    print(f'{args.signups} sign-ups over {args.concurrency} threads: {created / elapsed:.1f} /s, '
+          f'{statements["SELECT"] / args.signups:.2f} SELECT + {statements["INSERT"] / args.signups:.2f} INSERT each, '
+          f'{len(codes) - created} failed')
+
+    # Every worker races to claim the same username; exactly one may win and nobody may see a 500
+    barrier = threading.Barrier(args.concurrency)
+
+    def race(worker):
+        barrier.wait()
+        return sign_up(clients[worker], 'contested', f'contested{worker}@demo.com')
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        codes = list(pool.map(race, range(args.concurrency)))
+    print(f'{args.concurrency} simultaneous sign-ups for one username: {codes.count(302)} created, '
+          f'{codes.count(200)} shown "taken", {sum(code >= 500 for code in codes)} server errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Measure password-reset response time with inline SMTP delivery versus the background queue
+#
+# A local stand-in SMTP server adds an artificial handshake delay like a remote relay would.
+# Usage: python benchmarks/bench_reset_email.py [--requests 10] [--smtp-delay 0.5] [--email test@demo.com]
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Define a minimal SMTP server that accepts and discards every message
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    delay = 0.5
+    received = 0
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        time.sleep(self.delay)
+        self.reply('220 localhost stand-in SMTP')
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    StandInSMTPHandler.received += 1
+                    self.reply('250 OK queued')
+                continue
+            verb = line.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'DATA':
+                in_data = True
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--smtp-delay', type=float, default=0.5)
+    parser.add_argument('--email', default='test@demo.com')
+    args = parser.parse_args()
+
+    StandInSMTPHandler.delay = args.smtp_delay
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StandInSMTPHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['MAIL_SERVER'] = '127.0.0.1'
+    os.environ['MAIL_PORT'] = str(server.server_address[1])
+    os.environ['MAIL_USE_TLS'] = '0'
+    os.environ['MAIL_QUEUE_PATH'] = os.path.join(tmp, 'mail_queue.db')
+
+    from flask_block import app, mail_queue
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    for mode in ('inline', 'queued'):
+        app.config['MAIL_QUEUE_ASYNC'] = mode == 'queued'
+        StandInSMTPHandler.received = 0
+        client = app.test_client()
+        latencies = []
+        for _ in range(args.requests):
+            begin = time.perf_counter()
+            response = client.post('/reset_password', data={'email': args.email})
+            latencies.append((time.perf_counter() - begin) * 1000)
+            assert response.status_code == 302, response.status_code
+
+        # Wait for the background workers to hand everything to the SMTP server
+        deadline = time.time() + 60
+        while StandInSMTPHandler.received < args.requests and time.time() < deadline:
+            time.sleep(0.05)
+        latencies.sort()
+        print(f'{mode:>7}: p50 {latencies[len(latencies) // 2]:8.2f} ms, max {latencies[-1]:8.2f} ms, '
+              f'{StandInSMTPHandler.received}/{args.requests} delivered')
+
+    mail_queue.stop(timeout=5)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Compare reset-token verification before and after caching decoded tokens and dropping the second user query
+#
+# Runs against a throwaway database, so site.db is left untouched.
+# Usage: python benchmarks/bench_reset_token.py [--verifications 20000] [--tokens 100]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key-of-a-sensible-length')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import jwt
+from sqlalchemy import event, insert
+from flask_block import app, db
+from flask_block.modules import User, _reset_tokens
+
+# Statements issued since the counter was last reset
+statements = []
+
+
+# Define the verification the reset page used to do: decode, open a new app context, then query the user twice
+def legacy_verify(token):
+    try:
+        user_id = jwt.decode(token, app.config['SECRET_KEY'], algorithms="HS256")['user_id']
+    except Exception:
+        return None
+    with app.app_context():
+        user = db.session.get(User, user_id)
+    return User.query.filter_by(id=user.id).first()
+
+
+# Define a function to run a verifier over tokens round-robin, returning (verifications per second, queries each)
+def measure(verify, tokens, count):
+    statements.clear()
+    begin = time.perf_counter()
+    for i in range(count):
+        assert verify(tokens[i % len(tokens)]) is not None
+        db.session.expunge_all()
+    elapsed = time.perf_counter() - begin
+    return count / elapsed, len(statements) / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--verifications', type=int, default=20000)
+    parser.add_argument('--tokens', type=int, default=100, help='distinct tokens in circulation')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'id': i, 'username': f'reset{i}', 'email': f'reset{i}@demo.com', 'password': f'$2b$12$hash{i:050d}'}
+            for i in range(1, args.tokens + 1)])
+        db.session.commit()
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+        users = User.query.order_by(User.id).all()
+        tokens = [user.get_reset_token() for user in users]
+
+        results = [('legacy decode + 2 queries', measure(legacy_verify, tokens, args.verifications))]
+        _reset_tokens.clear()
+        results.append(('cached decode + 1 query', measure(User.verify_reset_token, tokens, args.verifications)))
+
+        print(f'{args.verifications} verifications over {args.tokens} tokens:')
+        for name, (rate, queries) in results:
+            print(f'  {name:26} {rate:10.0f} /s  {queries:.1f} queries each')
+
+        # A token stops working as soon as the password it was issued against changes
+        user = db.session.get(User, 1)
+        token = tokens[0]
+        user.password = '$2b$12$' + 'changed'.ljust(53, 'x')
+        db.session.commit()
+        print(f'  token reusable after reset: {User.verify_reset_token(token) is not None}')
+
+
+if __name__ == '__main__':
+    main()
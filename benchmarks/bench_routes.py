@@ -0,0 +1,360 @@
+# Drive every route against a seeded database, in-process and over HTTP, and record latency and throughput
+#
+# Seeds a throwaway database (site.db is left untouched) unless --database points at an existing one,
+# and imports a synthetic translation into a throwaway Bible folder as the default version.
+# Each scenario runs --requests times spread over --concurrency workers, first through the Flask test
+# client and then through a local threaded WSGI server. Results are printed and written as JSON so
+# runs can be diffed against each other.
+# Metrics are collected as in production (--metrics 0 turns them off and skips the /metrics scenario).
+# Usage: python benchmarks/bench_routes.py [--users 500] [--posts 50000] [--requests 300]
+#                                          [--concurrency 8] [--modes client,server] [--output bench.json]
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('MAIL_QUEUE_PATH', os.path.join(tempfile.mkdtemp(), 'mail_queue.db'))
+os.environ['BIBLE_DATA_DIR'] = tempfile.mkdtemp()
+
+# Numbers for sign-ups, unique across workers and modes
+registrations = itertools.count()
+
+# Token the metrics scenario reads /metrics with
+METRICS_TOKEN = 'benchmark'
+
+# Archive the import scenario posts each time: a handful of posts, as a member restoring a backup might
+IMPORT_BODY = ''.join(json.dumps({'title': f'Imported post {n}', 'content': 'Imported notes. See Rom 8:28.'}) + '\n'
+                      for n in range(10))
+
+
+# Define a session driving the app in-process through the Flask test client
+class ClientSession:
+    def __init__(self, app, keep_cookies=True):
+        self.client = app.test_client(use_cookies=keep_cookies)
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.client.open(path, method=method, data=data, headers=headers)
+        response.close()
+        return response.status_code, response.get_data(as_text=True)
+
+
+# Define a session driving the app over HTTP, keeping its own cookies
+class HttpSession:
+    def __init__(self, host, port, keep_cookies=True):
+        self.host = host
+        self.port = port
+        self.keep_cookies = keep_cookies
+        self.cookies = {}
+
+    # Form data comes as a dict; a str is sent as it is, with the Content-Type given in `headers`
+    def request(self, method, path, data=None, headers=None):
+        headers = dict(headers or {})
+        body = data
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        if isinstance(data, dict):
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            text = response.read().decode('utf-8', 'replace')
+            for cookie in (response.headers.get_all('Set-Cookie') or []) if self.keep_cookies else []:
+                name, _, value = cookie.split(';', 1)[0].partition('=')
+                self.cookies[name] = value
+            return response.status, text
+        finally:
+            conn.close()
+
+
+# Define a function returning the value at a percentile of sorted samples (nearest rank)
+def percentile(samples, pct):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))]
+
+
+# Define a function to run one scenario across workers, returning its latency summary
+def run_scenario(sessions, scenario, total):
+    name, method, make_request, expected = scenario
+    per_worker = [total // len(sessions) + (i < total % len(sessions)) for i in range(len(sessions))]
+    samples = []
+    errors = []
+    lock = threading.Lock()
+
+    def work(worker):
+        session, state = sessions[worker]
+        local, failed = [], []
+        for i in range(per_worker[worker]):
+            request = make_request(state, i)
+            begin = time.perf_counter()
+            status, _ = session.request(method, *request)
+            local.append((time.perf_counter() - begin) * 1000)
+            if status not in expected:
+                failed.append(status)
+        with lock:
+            samples.extend(local)
+            errors.extend(failed)
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(work, range(len(sessions))))
+    wall = time.perf_counter() - begin
+
+    samples.sort()
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p90_ms': round(percentile(samples, 90), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(samples[-1], 3),
+        'throughput_rps': round(len(samples) / wall, 1),
+    }
+
+
+# Define a request function for the register scenario, signing up a new account each time
+def sign_up(state, i):
+    n = next(registrations)
+    return '/register', {'username': f'bench{n}', 'email': f'bench{n}@example.com',
+                         'password': 'password', 'confirm_password': 'password'}
+
+
+# Define a request function for the reset_token scenario; each reset spends its token, so a fresh one
+# is minted (outside the timing, like the emailed link) for every request
+def spend_reset_token(state, i):
+    return f'/reset_password/{state["new_reset_token"]()}', {'password': 'password',
+                                                              'confirm_password': 'password'}
+
+
+# Define a request function for the logout scenario, logging the session back in (untimed) first
+def log_out(state, i):
+    state['log_in']()
+    return '/logout', None
+
+
+# Define the scenarios: (name, method, function of (worker state, i) -> (path, form data or body[, headers]),
+# expected statuses)
+def build_scenarios(fixture):
+    rng = random.Random(7)
+    post_ids = fixture['post_ids']
+    usernames = fixture['usernames']
+    chapters = fixture['chapters']
+    version = fixture['bible_version']
+    return [
+        ('home', 'GET', lambda s, i: ('/', None), {200}),
+        ('home_deep_page', 'GET', lambda s, i: (fixture['deep_page'], None), {200}),
+        ('post', 'GET', lambda s, i: (f'/post/{rng.choice(post_ids)}', None), {200}),
+        ('user_posts', 'GET', lambda s, i: (f'/user/{rng.choice(usernames)}', None), {200}),
+        ('search', 'GET', lambda s, i: ('/search?q=' + rng.choice(['grace', 'shepherd', 'covenant']), None), {200}),
+        ('about', 'GET', lambda s, i: ('/about', None), {200}),
+        ('bible_index', 'GET', lambda s, i: ('/bible', None), {200}),
+        ('bible_version', 'GET', lambda s, i: (f'/bible/{version}', None), {200}),
+        ('bible_chapter', 'GET', lambda s, i: ('/bible/{}/{}/{}'.format(version, *rng.choice(chapters)), None),
+         {200}),
+        ('register_form', 'GET', lambda s, i: ('/register', None), {200}),
+        ('register', 'POST', sign_up, {302}),
+        ('login_form', 'GET', lambda s, i: ('/login', None), {200}),
+        ('login', 'POST', lambda s, i: ('/login', {'username': s['username'], 'password': fixture['password']}),
+         {302}),
+        ('account', 'GET', lambda s, i: ('/account', None), {200}),
+        ('new_post', 'POST', lambda s, i: ('/post/new', {'title': f'Bench post {i}',
+                                                         'content': 'Bench content. See John 3:16.'}), {302}),
+        ('update_post', 'POST', lambda s, i: (f'/post/{s["own_posts"][i % len(s["own_posts"])]}/update',
+                                              {'title': f'Updated {i}', 'content': 'Updated. See Ps 23.'}), {302}),
+        ('delete_post', 'POST', lambda s, i: (f'/post/{s["own_posts"].pop()}/delete', None), {302}),
+        ('export_posts', 'GET', lambda s, i: ('/posts/export', None), {200}),
+        ('import_posts', 'POST', lambda s, i: ('/posts/import', IMPORT_BODY,
+                                               {'Content-Type': 'application/x-ndjson'}), {200}),
+        ('reset_request', 'POST', lambda s, i: ('/reset_password', {'email': s['email']}), {302}),
+        ('reset_token_form', 'GET', lambda s, i: (f'/reset_password/{s["reset_token"]}', None), {200}),
+        ('reset_token', 'POST', spend_reset_token, {302}),
+        ('metrics', 'GET', lambda s, i: ('/metrics', None, {'Authorization': f'Bearer {METRICS_TOKEN}'}), {200}),
+        # Last, as it ends the members' sessions; its req/s, like reset_token's, includes the untimed setup
+        ('logout', 'GET', log_out, {302}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--posts', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=300, help='requests per scenario and mode')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--modes', default='client,server')
+    parser.add_argument('--only', help='comma-separated scenario names to run')
+    parser.add_argument('--page-cache', default='null', help="PAGE_CACHE_TYPE to run with ('null' measures real work)")
+    parser.add_argument('--metrics', default='1', choices=['0', '1'], help='METRICS_ENABLED to run with')
+    parser.add_argument('--database', help='existing DATABASE_URL to use instead of seeding a fresh one')
+    parser.add_argument('--output', default='bench_routes.json')
+    args = parser.parse_args()
+
+    os.environ['PAGE_CACHE_TYPE'] = args.page_cache
+    os.environ['METRICS_ENABLED'] = args.metrics
+    os.environ['METRICS_TOKEN'] = METRICS_TOKEN
+    os.environ['DATABASE_URL'] = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    # Imported only now: the app reads its configuration when flask_block is first imported
+    from sqlalchemy import insert
+    from bench_bible import synthetic_verses
+    from flask_block import app, db, mail, rate_limiter, bible_library
+    from flask_block.bible import BOOKS, book_slug, write_version
+    from flask_block.modules import User, Post, refresh_post_stats
+    from flask_block.seed import seed_database
+
+    # Forms are posted directly and login is hammered on purpose
+    app.config['WTF_CSRF_ENABLED'] = False
+    rate_limiter.enabled = False
+    # Reset emails go through the outbox and workers as usual, but never reach an SMTP server
+    mail.state.suppress = True
+
+    # The synthetic translation stands in for the default version, so cited passages are resolved too
+    bible_version = app.config['BIBLE_DEFAULT_VERSION']
+    verses = list(synthetic_verses(random.Random(1)))
+    write_version(bible_library.path_for(bible_version), verses)
+    chapters = sorted({(book_slug(BOOKS[b - 1]), c) for b, c, _, _ in verses})
+
+    # Define a function minting a password reset token, as the emailed link would carry
+    def new_reset_token(user_id):
+        with app.app_context():
+            return db.session.get(User, user_id).get_reset_token()
+
+    password = 'password'
+    with app.app_context():
+        if not args.database:
+            begin = time.perf_counter()
+            seed_database(args.users, args.posts, seed=1, password=password)
+            print(f'Seeded {args.users} users and {args.posts} posts in {time.perf_counter() - begin:.1f} s')
+        post_ids = [row[0] for row in db.session.query(Post.id).order_by(Post.id.desc()).limit(5000)]
+        accounts = db.session.query(User.id, User.username, User.email).filter(
+            User.username.like('seed%')).order_by(User.id).limit(max(args.concurrency, 50)).all()
+        if len(accounts) < args.concurrency:
+            sys.exit('Not enough seeded users; run "flask seed" first or drop --database')
+
+    # Each worker logs in as its own user and owns enough posts to update and delete
+    modes = [m for m in args.modes.split(',') if m]
+    needed = args.requests // args.concurrency + 2
+    worker_accounts = accounts[:args.concurrency]
+    own_posts = {}
+    with app.app_context():
+        for user_id, _, _ in worker_accounts:
+            own_posts[user_id] = []
+            for _ in modes:
+                rows = [{'title': 'Bench seed', 'content': 'Bench seed.', 'user_id': user_id,
+                         'date_posted': datetime(2019, 1, 1)} for _ in range(needed)]
+                db.session.execute(insert(Post), rows)
+            refresh_post_stats([user_id])
+            db.session.commit()
+            own_posts[user_id] = [row[0] for row in db.session.query(Post.id).filter_by(
+                user_id=user_id, title='Bench seed').order_by(Post.id)]
+
+    server = None
+    results = {}
+    for mode in modes:
+        if mode == 'server':
+            from werkzeug.serving import make_server
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def new_session(keep_cookies=True):
+            if mode == 'client':
+                return ClientSession(app, keep_cookies)
+            return HttpSession('127.0.0.1', server.server_port, keep_cookies)
+
+        # One anonymous and one logged-in session per worker
+        anonymous = [(new_session(), {'email': email, 'reset_token': new_reset_token(user_id),
+                                      'new_reset_token': lambda user_id=user_id: new_reset_token(user_id)})
+                     for user_id, _, email in worker_accounts]
+        members = []
+        for user_id, username, email in worker_accounts:
+            session = new_session()
+            log_in = lambda session=session, username=username: session.request(
+                'POST', '/login', {'username': username, 'password': password})
+            status, _ = log_in()
+            if status != 302:
+                sys.exit(f'Could not log in as {username} ({status})')
+            posts = own_posts[user_id][:needed]
+            own_posts[user_id] = own_posts[user_id][needed:]
+            members.append((session, {'username': username, 'email': email, 'own_posts': posts, 'log_in': log_in}))
+
+        # Find a page well into the feed by following 'Older' links
+        status, page = anonymous[0][0].request('GET', '/')
+        deep_page = '/'
+        for _ in range(20):
+            match = re.search(r'href="(/(?:home)?\?(?:after|page)=[^"]+)"[^>]*>\s*Older', page) \
+                or re.search(r'href="([^"]*(?:after|page)=[^"]+)"', page)
+            if not match:
+                break
+            deep_page = match.group(1).replace('&amp;', '&')
+            status, page = anonymous[0][0].request('GET', deep_page)
+
+        fixture = {'post_ids': post_ids, 'usernames': [a[1] for a in accounts], 'password': password,
+                   'deep_page': deep_page, 'chapters': chapters, 'bible_version': bible_version}
+        results[mode] = {}
+        for scenario in build_scenarios(fixture):
+            name = scenario[0]
+            if (args.only and name not in args.only.split(',')) or (name == 'metrics' and args.metrics != '1'):
+                continue
+            authenticated = name in ('account', 'new_post', 'update_post', 'delete_post', 'export_posts',
+                                     'import_posts', 'logout')
+            sessions = members if authenticated else anonymous
+            if name == 'login':
+                # Cookie-less sessions, so every attempt checks the password instead of redirecting
+                sessions = [(new_session(keep_cookies=False), state) for _, state in members]
+            results[mode][name] = summary = run_scenario(sessions, scenario, args.requests)
+            print(f'{mode:6} {name:16} p50 {summary["p50_ms"]:8.2f} ms  p99 {summary["p99_ms"]:8.2f} ms  '
+                  f'{summary["throughput_rps"]:8.1f} req/s  errors {summary["errors"]}')
+
+        if server is not None:
+            server.shutdown()
+            server = None
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'users': args.users if not args.database else None,
+            'posts': args.posts if not args.database else None,
+            'requests_per_scenario': args.requests,
+            'concurrency': args.concurrency,
+            'page_cache': args.page_cache,
+            'metrics': args.metrics == '1',
+            'bcrypt_rounds': app.config['BCRYPT_LOG_ROUNDS'],
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Compare FTS5 search latency with a LIKE '%term%' scan as the post table grows
+#
+# Usage: python benchmarks/bench_search.py [--rows 100000 1000000] [--repeat 20]
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from sqlalchemy import create_engine
+from flask_block import db
+from flask_block.search import SCHEMA, TITLE_WEIGHT, to_match_query
+
+# A Zipf-distributed vocabulary, so common words are everywhere and rarer ones are selective like real text
+VOCABULARY = [f'w{n}x{n * 7919 % 9973}' for n in range(20000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+QUERIES = [VOCABULARY[300], VOCABULARY[3000], f'{VOCABULARY[50]} {VOCABULARY[800]}', VOCABULARY[12000][:5]]
+
+
+# Define a function to bulk-load posts of random words with the index triggers in place
+def build_database(path, rows, rng):
+    engine = create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.execute("INSERT INTO user (id, username, email, image_file, password) "
+                 "VALUES (1, 'bench', 'bench@demo.com', 'default.jpg', 'x')")
+    batch = []
+    for i in range(rows):
+        title = ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=4))
+        content = ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=60))
+        batch.append((title, '2024-01-01 00:00:00', content, 1))
+        if len(batch) == 20000:
+            conn.executemany("INSERT INTO post (title, date_posted, content, user_id) VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO post (title, date_posted, content, user_id) VALUES (?, ?, ?, ?)", batch)
+    conn.execute("INSERT INTO post_fts (post_fts) VALUES ('optimize')")
+    conn.commit()
+    return conn
+
+
+# Define a function to time a query, returning the median latency in milliseconds
+def timed(conn, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - begin) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    fts_sql = ("SELECT rowid, snippet(post_fts, 1, '[', ']', '…', 32) FROM post_fts WHERE post_fts MATCH ? "
+               f"ORDER BY bm25(post_fts, {TITLE_WEIGHT}, 1.0) LIMIT 10")
+    like_sql = "SELECT id, content FROM post WHERE title LIKE ? OR content LIKE ? LIMIT 10"
+
+    print(f"{'rows':>9} {'query':>18} {'fts5 ms':>9} {'like ms':>9}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = build_database(os.path.join(tmp, 'search.db'), rows, random.Random(rows))
+            for query in QUERIES:
+                fts_ms = timed(conn, fts_sql, (to_match_query(query),), args.repeat)
+                # LIKE cannot rank, so this baseline stops at the first ten hits and is still slower
+                pattern = '%' + query.split()[-1] + '%'
+                like_ms = timed(conn, like_sql, (pattern, pattern), max(1, args.repeat // 4))
+                print(f'{rows:>9} {query:>18} {fts_ms:>9.2f} {like_ms:>9.2f}')
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
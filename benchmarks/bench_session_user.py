@@ -0,0 +1,73 @@
+# Count the queries and time spent loading the session user on authenticated requests
+#
+# Usage: python benchmarks/bench_session_user.py [--requests 200] [--user-id 1]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from sqlalchemy import event
+from flask_block import app, db
+from flask_block.modules import _session_users
+
+# Statements issued since the counter was last reset
+statements = []
+
+
+# Define a function to log in a test client without going through the password check
+def logged_in_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+# Define a function to measure one authenticated request, returning (queries, milliseconds)
+def measure(client, url):
+    statements.clear()
+    begin = time.perf_counter()
+    response = client.get(url)
+    elapsed = (time.perf_counter() - begin) * 1000
+    assert response.status_code == 200, response.status_code
+    return len(statements), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--user-id', type=int, default=1)
+    args = parser.parse_args()
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    client = logged_in_client(args.user_id)
+
+    # The /account page touches only the session user, so its queries are the loader's
+    _session_users.clear()
+    cold_queries, cold_ms = measure(client, '/account')
+    warm_queries, warm_ms = measure(client, '/account')
+    assert cold_queries == 1, f'cold load issued {cold_queries} queries'
+    assert warm_queries == 0, f'cached load issued {warm_queries} queries'
+    print(f'cold load: {cold_queries} query, {cold_ms:.2f} ms')
+    print(f'cache hit: {warm_queries} queries, {warm_ms:.2f} ms')
+
+    for label, ttl in (('uncached', 0), ('cached', app.config['SESSION_USER_CACHE_SECONDS'])):
+        app.config['SESSION_USER_CACHE_SECONDS'] = ttl
+        _session_users.clear()
+        total_queries = 0
+        begin = time.perf_counter()
+        for _ in range(args.requests):
+            total_queries += measure(client, '/account')[0]
+        elapsed = time.perf_counter() - begin
+        print(f'{label:>8}: {args.requests / elapsed:8.1f} req/s, '
+              f'{total_queries / args.requests:.2f} queries/request')
+
+
+if __name__ == '__main__':
+    main()
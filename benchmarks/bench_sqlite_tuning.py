@@ -0,0 +1,126 @@
+# Stress concurrent readers and writers against Post/User with default and tuned SQLite settings
+#
+# Each worker process stands in for a gunicorn worker running a few threads.
+# Usage: python benchmarks/bench_sqlite_tuning.py [--processes 4] [--threads 4] [--seconds 5]
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from sqlalchemy import create_engine, select, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+from flask_block import db
+from flask_block.database import DEFAULTS, sqlite_engine_options, configure_sqlite_engine
+from flask_block.modules import Post, User
+
+# Settings matching a bare site.db: rollback journal, full sync, no busy handling, no pooling
+BASELINE = dict(DEFAULTS, SQLITE_JOURNAL_MODE='DELETE', SQLITE_SYNCHRONOUS='FULL',
+                SQLITE_BUSY_TIMEOUT=0, SQLITE_CACHE_SIZE=-2000, SQLITE_MMAP_SIZE=0)
+
+
+# Define a function to create an engine the way the app would for the given settings
+def make_engine(path, config, tuned):
+    if tuned:
+        engine = create_engine('sqlite:///' + path, **sqlite_engine_options(config))
+    else:
+        engine = create_engine('sqlite:///' + path, poolclass=NullPool, connect_args={'timeout': 0})
+    configure_sqlite_engine(engine, config)
+    return engine
+
+
+# Define a function to seed a database with a few users and posts
+def seed(path, posts):
+    engine = create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO user (id, username, email, image_file, password) VALUES (?, ?, ?, 'default.jpg', 'x')",
+                     [(i, f'user{i}', f'user{i}@demo.com') for i in range(1, 101)])
+    conn.executemany("INSERT INTO post (title, date_posted, content, user_id) VALUES (?, ?, ?, ?)",
+                     [(f'Post {i}', datetime(2024, 1, 1).isoformat(' '), 'Lorem ipsum ' * 50, i % 100 + 1)
+                      for i in range(posts)])
+    conn.commit()
+    conn.close()
+
+
+# Define one worker process running reader and writer threads until the deadline
+def worker(path, config, tuned, threads, seconds, write_ratio, results):
+    engine = make_engine(path, config, tuned)
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def run(n):
+        local = {'reads': 0, 'writes': 0, 'locked': 0}
+        i = 0
+        while time.time() < deadline:
+            i += 1
+            try:
+                with engine.begin() as conn:
+                    if i % write_ratio == 0:
+                        conn.execute(insert(Post.__table__).values(
+                            title='Stress', content='Lorem ipsum', user_id=n % 100 + 1, date_posted=datetime.utcnow()))
+                        local['writes'] += 1
+                    else:
+                        conn.execute(select(Post.__table__, User.__table__.c.username)
+                                     .join(User.__table__).order_by(Post.__table__.c.date_posted.desc())
+                                     .limit(5)).fetchall()
+                        local['reads'] += 1
+            except OperationalError as exc:
+                if 'locked' not in str(exc):
+                    raise
+                local['locked'] += 1
+        with lock:
+            for key in counts:
+                counts[key] += local[key]
+
+    pool = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    engine.dispose()
+    results.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=int, default=10, help='one write every N operations')
+    parser.add_argument('--posts', type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f"{'mode':>9} {'reads/s':>10} {'writes/s':>10} {'locked':>8}")
+    for mode, config in (('baseline', BASELINE), ('tuned', dict(DEFAULTS))):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stress.db')
+            seed(path, args.posts)
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=worker, args=(path, config, mode == 'tuned', args.threads,
+                                                                  args.seconds, args.write_ratio, results))
+                     for _ in range(args.processes)]
+            for p in procs:
+                p.start()
+            totals = {'reads': 0, 'writes': 0, 'locked': 0}
+            for _ in procs:
+                for key, value in results.get().items():
+                    totals[key] += value
+            for p in procs:
+                p.join()
+            print(f"{mode:>9} {totals['reads'] / args.seconds:>10.1f} "
+                  f"{totals['writes'] / args.seconds:>10.1f} {totals['locked']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,13 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_mail import Mail
+from flask_block.cache import PageCache
+from flask_block.mail_queue import MailQueue
+from flask_block.bible import BibleLibrary
+from flask_block.hashing import PasswordHasher
+from flask_block.ratelimit import RateLimiter
+from flask_block.metrics import Metrics
+from flask_block.database import load_sqlite_config, sqlite_engine_options, configure_sqlite_engine
 
 # Create a Flask application instance
 app = Flask(__name__)
@@ -13,28 +20,142 @@ app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get('SECRET_KEY')
 
 # Configure the URI for the SQLite database using the app's root path
-app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite:///' + os.path.join(os.path.dirname(app.root_path), 'flask_block', 'site.db')
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(os.path.dirname(app.root_path), 'flask_block', 'site.db'))
+
+# Configure SQLite for concurrent workers: WAL, pragmas, busy handling and a per-process pool
+load_sqlite_config(app.config)
+if app.config["SQLALCHEMY_DATABASE_URI"].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(app.config)
+
+# Configure how post listings are paginated: 'keyset' (cursor) or 'offset' (page numbers)
+app.config['FEED_PAGINATION'] = os.environ.get('FEED_PAGINATION', 'keyset')
+# Configure how long listing totals are cached before being recounted (0 disables caching)
+app.config['FEED_COUNT_CACHE_SECONDS'] = int(os.environ.get('FEED_COUNT_CACHE_SECONDS', 60))
+
+# Configure how long a logged-in user is served from the per-process cache (0 disables caching)
+app.config['SESSION_USER_CACHE_SECONDS'] = int(os.environ.get('SESSION_USER_CACHE_SECONDS', 30))
+
+# Configure how many posts NDJSON imports commit per transaction and exports fetch per round trip
+app.config['POST_TRANSFER_BATCH_SIZE'] = int(os.environ.get('POST_TRANSFER_BATCH_SIZE', 1000))
 
 # Create a SQLAlchemy database instance
 db = SQLAlchemy(app)
+with app.app_context():
+    configure_sqlite_engine(db.engine, app.config)
+
+# Configure the bcrypt work factor; stored hashes at another cost are upgraded on login
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+# Configure the hashing pool: concurrent hashes, and how many more may wait before refusing
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+app.config['PASSWORD_HASH_QUEUE_DEPTH'] = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 8))
 
 # Create a Bcrypt instance for password hashing
 bcrypt = Bcrypt(app)
 
+# Create a PasswordHasher instance running bcrypt off the request thread in a bounded pool
+password_hasher = PasswordHasher(app, bcrypt)
+
+# Configure the token buckets limiting login, sign-up and reset attempts per IP and username
+app.config['RATE_LIMIT_BURST'] = int(os.environ.get('RATE_LIMIT_BURST', 10))
+app.config['RATE_LIMIT_PER_MINUTE'] = int(os.environ.get('RATE_LIMIT_PER_MINUTE', 10))
+# Configure where the buckets live: 'sqlite' shares them between worker processes through one file,
+# 'memory' keeps them per process, so the real limit is the burst times the number of workers
+app.config['RATE_LIMIT_STORAGE'] = os.environ.get('RATE_LIMIT_STORAGE', 'sqlite')
+app.config['RATE_LIMIT_PATH'] = os.environ.get('RATE_LIMIT_PATH', os.path.join(app.instance_path, 'rate_limit.db'))
+
+# Create a RateLimiter instance rejecting floods before any password is hashed
+rate_limiter = RateLimiter(app)
+
 # Create a LoginManager instance for managing user login sessions
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
 # Configure the email server settings for Flask-Mail
-app.config['MAIL_SERVER'] = 'smtp.googlemail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') == '1'
 app.config['MAIL_USERNAME'] = os.environ.get('EMAIL_USER')
 app.config['MAIL_PASSWORD'] = os.environ.get('EMAIL_PASS')
 
 # Create a Mail instance for sending emails
 mail = Mail(app)
 
-# Import routes module from the flask_block package
-from flask_block import routes
+# Configure background delivery: queued messages live in a local SQLite outbox
+app.config['MAIL_QUEUE_ASYNC'] = os.environ.get('MAIL_QUEUE_ASYNC', '1') == '1'
+app.config['MAIL_QUEUE_PATH'] = os.environ.get('MAIL_QUEUE_PATH', os.path.join(app.instance_path, 'mail_queue.db'))
+app.config['MAIL_QUEUE_WORKERS'] = int(os.environ.get('MAIL_QUEUE_WORKERS', 2))
+
+# Configure the profile picture pipeline: derived square sizes in pixels and output format
+app.config['PROFILE_IMAGE_SIZES'] = {'sm': 65, 'md': 125, 'lg': 250}
+app.config['PROFILE_IMAGE_FORMAT'] = os.environ.get('PROFILE_IMAGE_FORMAT', 'webp')
+app.config['PROFILE_IMAGE_MAX_PIXELS'] = int(os.environ.get('PROFILE_IMAGE_MAX_PIXELS', 40_000_000))
+app.config['PROFILE_IMAGE_ASYNC'] = os.environ.get('PROFILE_IMAGE_ASYNC', '1') == '1'
+app.config['PROFILE_IMAGE_WORKERS'] = int(os.environ.get('PROFILE_IMAGE_WORKERS', 2))
+# Configure how long an upload may wait for the process pool before it is refused
+app.config['PROFILE_IMAGE_TIMEOUT'] = float(os.environ.get('PROFILE_IMAGE_TIMEOUT', 30))
+
+# Create a MailQueue instance for sending emails off the request thread
+mail_queue = MailQueue(app, mail)
+
+# Configure the rendered page cache: 'simple' (in-process LRU), 'redis' or 'null' (disabled)
+app.config['PAGE_CACHE_TYPE'] = os.environ.get('PAGE_CACHE_TYPE', 'simple')
+app.config['PAGE_CACHE_SECONDS'] = int(os.environ.get('PAGE_CACHE_SECONDS', 300))
+app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 1024))
+app.config['PAGE_CACHE_REDIS_URL'] = os.environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+# Each process keeps its own 'simple' cache; they share invalidations through this file
+app.config['PAGE_CACHE_INVALIDATION_LOG'] = os.environ.get('PAGE_CACHE_INVALIDATION_LOG',
+                                                           os.path.join(app.instance_path, 'page_cache_invalidations.log'))
+
+# Create a PageCache instance for serving rendered pages to anonymous visitors
+page_cache = PageCache(app)
+
+# Configure where imported Bible translations are stored
+app.config['BIBLE_DATA_DIR'] = os.environ.get('BIBLE_DATA_DIR', os.path.join(app.instance_path, 'bible'))
+
+# Configure the version used to show passages cited in posts
+app.config['BIBLE_DEFAULT_VERSION'] = os.environ.get('BIBLE_DEFAULT_VERSION', 'kjv')
+
+# Create a BibleLibrary instance for memory-mapped verse lookups
+bible_library = BibleLibrary(app.config['BIBLE_DATA_DIR'])
+
+# Configure opt-in instrumentation: request and query timings, N+1 detection and sampled profiles
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'
+# Configure the bearer token required to read /metrics; without one the endpoint is not served
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Configure how often one SELECT may repeat within a request before it is flagged as N+1
+app.config['METRICS_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 5))
+# Configure the share of requests run under cProfile, and the duration at which a profile is kept
+app.config['METRICS_PROFILE_SAMPLE_RATE'] = float(os.environ.get('METRICS_PROFILE_SAMPLE_RATE', 0.0))
+app.config['METRICS_SLOW_REQUEST_SECONDS'] = float(os.environ.get('METRICS_SLOW_REQUEST_SECONDS', 0.5))
+
+# Create a Metrics instance exposing per-process measurements at /metrics
+metrics = Metrics(app, db)
+
+
+# Define a collector adding the page cache and mail outbox figures to /metrics
+def cache_and_outbox_metrics():
+    lines = ['# TYPE bible_block_page_cache_requests_total counter']
+    stats = page_cache.stats()
+    for result in ('hits', 'misses'):
+        lines.append(f'bible_block_page_cache_requests_total{{result="{result}"}} {stats.get(result, 0)}')
+    lines.append('# TYPE bible_block_mail_outbox_messages gauge')
+    for status, count in sorted(mail_queue.stats().items()):
+        lines.append(f'bible_block_mail_outbox_messages{{status="{status}"}} {count}')
+    return lines
+
+
+metrics.register_collector(cache_and_outbox_metrics)
+
+# Configure `flask serve`: the server, address, and processes times threads handling requests
+app.config['SERVE_SERVER'] = os.environ.get('SERVE_SERVER')
+app.config['SERVE_HOST'] = os.environ.get('SERVE_HOST', '127.0.0.1')
+app.config['SERVE_PORT'] = int(os.environ.get('PORT', 8000))
+app.config['SERVE_WORKERS'] = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 2))
+app.config['SERVE_THREADS'] = int(os.environ.get('WEB_THREADS', 4))
+
+# Configure how long browsers may cache fingerprinted static assets, in seconds
+app.config['ASSETS_MAX_AGE'] = int(os.environ.get('ASSETS_MAX_AGE', 31536000))
+
+# Import routes, the static asset pipeline and command-line modules from the flask_block package
+from flask_block import routes, assets, commands
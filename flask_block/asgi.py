@@ -0,0 +1,7 @@
+# ASGI entry point, e.g. `uvicorn flask_block.asgi:application --workers 4`
+from a2wsgi import WSGIMiddleware
+from flask_block import app
+
+# Flask is a WSGI app; the adapter runs requests concurrently on a pool of WEB_THREADS threads.
+# (asgiref's WsgiToAsgi would run every request of a process on one shared thread.)
+application = WSGIMiddleware(app, workers=app.config['SERVE_THREADS'])
@@ -0,0 +1,185 @@
+# Import necessary modules for the static asset pipeline
+import gzip
+import hashlib
+import json
+import os
+import re
+from flask import request, send_from_directory
+from flask.sessions import SecureCookieSessionInterface
+from flask_block import app
+
+# brotli is optional; without it only gzip variants are written
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Stylesheets and scripts the build fingerprints, relative to the static folder
+ASSETS = ['vendor/bootstrap.min.css', 'main.css',
+          'vendor/jquery.min.js', 'vendor/popper.min.js', 'vendor/bootstrap.min.js']
+
+# Folder under static/ the build writes into, and its manifest of source name -> fingerprinted name
+BUILD_DIR = 'dist'
+MANIFEST = os.path.join(app.static_folder, BUILD_DIR, 'manifest.json')
+
+# Precompressed variants by Content-Encoding, most preferred first
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+# Source map references; the maps are not vendored, so browsers would only request missing files
+SOURCE_MAP = re.compile(r'\n?(?:/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S*)\s*$')
+
+# Built files and the encodings each was precompressed with, loaded from the manifest. The previous
+# build's files are kept and still served: pages rendered before a rebuild, in browsers or the page
+# cache, keep asking for them.
+manifest = {'files': {}, 'encodings': {}, 'previous': {}}
+
+# Modification time of the manifest this process loaded, to notice a rebuild made by another process
+_manifest_mtime = None
+
+
+# Define a function to minify CSS conservatively: comments (except /*! licences */) and whitespace
+def minify_css(text):
+    text = re.sub(r'/\*(?!!).*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+# Define a function to prepare one source for shipping; files already minified upstream are left alone
+def minify(name, text):
+    text = SOURCE_MAP.sub('\n', text)
+    if name.endswith('.css') and not name.endswith('.min.css'):
+        return minify_css(text)
+    return text
+
+
+# Define a function to write the precompressed variants of a built file, returning the encodings kept
+def compress(path, data):
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)
+    kept = []
+    for encoding in ENCODINGS:
+        # A variant no smaller than the original is not worth the extra header
+        if encoding in variants and len(variants[encoding]) < len(data):
+            with open(path + ENCODINGS[encoding], 'wb') as f:
+                f.write(variants[encoding])
+            kept.append(encoding)
+    return kept
+
+
+# Define a function to build every asset: minify, fingerprint by content, precompress, write the manifest
+def build_assets():
+    output = os.path.join(app.static_folder, BUILD_DIR)
+    last = read_manifest()
+    built = {'files': {}, 'encodings': {}}
+    for name in ASSETS:
+        with open(os.path.join(app.static_folder, name), encoding='utf-8') as f:
+            data = minify(name, f.read()).encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        target = f'{BUILD_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(app.static_folder, target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        built['files'][name] = target
+        built['encodings'][target] = compress(path, data)
+
+    # The build replaced keeps its files; anything older is dropped, so the folder only holds what the
+    # manifest names
+    built['previous'] = {target: encodings for target, encodings in last['encodings'].items()
+                         if target not in built['encodings']}
+    keep = {os.path.join(app.static_folder, target) + suffix
+            for target, encodings in (*built['encodings'].items(), *built['previous'].items())
+            for suffix in ('', *(ENCODINGS[encoding] for encoding in encodings))}
+    for root, _, files in os.walk(output):
+        for file in files:
+            path = os.path.join(root, file)
+            if path not in keep and path != MANIFEST:
+                os.remove(path)
+
+    # Replace the manifest atomically, so running workers never read half of it
+    with open(MANIFEST + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(built, f, indent=1, sort_keys=True)
+    os.replace(MANIFEST + '.tmp', MANIFEST)
+    load_manifest()
+    return built
+
+
+# Define a function to read the manifest from disk; without a build it is empty
+def read_manifest():
+    try:
+        with open(MANIFEST, encoding='utf-8') as f:
+            return dict({'files': {}, 'encodings': {}, 'previous': {}}, **json.load(f))
+    except (OSError, ValueError):
+        return {'files': {}, 'encodings': {}, 'previous': {}}
+
+
+# Define a function to load the manifest; without a build the sources are served as they are
+def load_manifest():
+    global _manifest_mtime
+    try:
+        _manifest_mtime = os.stat(MANIFEST).st_mtime_ns
+    except OSError:
+        _manifest_mtime = None
+    manifest.update(read_manifest())
+    return manifest
+
+
+# Define a hook reloading the manifest once per request when `flask assets` rebuilt it since, so every
+# worker links the new files without a restart
+@app.before_request
+def refresh_manifest():
+    try:
+        mtime = os.stat(MANIFEST).st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime != _manifest_mtime:
+        load_manifest()
+
+
+# Define a function reporting whether any source is newer than the last build
+def assets_stale():
+    if not os.path.exists(MANIFEST):
+        return True
+    built = os.path.getmtime(MANIFEST)
+    return any(os.path.getmtime(os.path.join(app.static_folder, name)) > built for name in ASSETS)
+
+
+# Define a hook pointing url_for('static', filename=...) at the fingerprinted file when one was built
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = manifest['files'].get(values['filename'], values['filename'])
+
+
+# Define the static view: fingerprinted files go out precompressed and cached for a year, the rest as before
+def send_static(filename):
+    encodings = manifest['encodings'].get(filename, manifest['previous'].get(filename))
+    if encodings is None:
+        return app.send_static_file(filename)
+
+    encoding = next((e for e in ENCODINGS if e in encodings and request.accept_encodings[e]), None)
+    mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+    response = send_from_directory(app.static_folder, filename + (ENCODINGS[encoding] if encoding else ''),
+                                   mimetype=mimetype, max_age=app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# Define a session interface that never saves the session for static files; Flask-Login reads it on
+# every request, which would otherwise add Vary: Cookie and keep shared caches from storing them
+class StaticSessionInterface(SecureCookieSessionInterface):
+    def save_session(self, app, session, response):
+        if request.endpoint != 'static':
+            super().save_session(app, session, response)
+
+
+app.view_functions['static'] = send_static
+app.session_interface = StaticSessionInterface()
+load_manifest()
@@ -0,0 +1,239 @@
+# Import necessary modules for the local Bible verse store
+import csv
+import mmap
+import os
+import re
+import struct
+import threading
+
+# Canonical order of the 66 books; a book's id is its position in this list plus one
+BOOKS = [
+    'Genesis', 'Exodus', 'Leviticus', 'Numbers', 'Deuteronomy', 'Joshua', 'Judges', 'Ruth',
+    '1 Samuel', '2 Samuel', '1 Kings', '2 Kings', '1 Chronicles', '2 Chronicles', 'Ezra', 'Nehemiah',
+    'Esther', 'Job', 'Psalms', 'Proverbs', 'Ecclesiastes', 'Song of Solomon', 'Isaiah', 'Jeremiah',
+    'Lamentations', 'Ezekiel', 'Daniel', 'Hosea', 'Joel', 'Amos', 'Obadiah', 'Jonah', 'Micah', 'Nahum',
+    'Habakkuk', 'Zephaniah', 'Haggai', 'Zechariah', 'Malachi',
+    'Matthew', 'Mark', 'Luke', 'John', 'Acts', 'Romans', '1 Corinthians', '2 Corinthians', 'Galatians',
+    'Ephesians', 'Philippians', 'Colossians', '1 Thessalonians', '2 Thessalonians', '1 Timothy',
+    '2 Timothy', 'Titus', 'Philemon', 'Hebrews', 'James', '1 Peter', '2 Peter', '1 John', '2 John',
+    '3 John', 'Jude', 'Revelation',
+]
+
+# Upper bounds sizing the fixed chapter table (Psalms has 150 chapters)
+MAX_BOOKS = len(BOOKS)
+MAX_CHAPTERS = 150
+
+# File layout: header, then a (first record, verse count) slot for every possible (book, chapter),
+# then one (text offset, text length) record per verse in canonical order, then the UTF-8 text
+MAGIC = b'BBLK'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHxxI')
+SLOT = struct.Struct('<II')
+RECORD = struct.Struct('<II')
+SLOTS_OFFSET = HEADER.size
+RECORDS_OFFSET = SLOTS_OFFSET + (MAX_BOOKS + 1) * (MAX_CHAPTERS + 1) * SLOT.size
+
+# Version names double as file names, so keep them to simple identifiers
+VERSION_NAME = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+
+# Define a function to turn a book name into its URL form, e.g. '1 John' -> '1-john'
+def book_slug(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+# Lookup of book ids by number, canonical name and URL slug
+_BOOK_IDS = {}
+for _id, _name in enumerate(BOOKS, start=1):
+    _BOOK_IDS[str(_id)] = _id
+    _BOOK_IDS[_name.lower()] = _id
+    _BOOK_IDS[book_slug(_name)] = _id
+
+
+# Define a function to resolve a book number, name or slug to its id, or None
+def book_id(name):
+    return _BOOK_IDS.get(str(name).strip().lower())
+
+
+# Define a verse returned by lookups
+class Verse:
+    __slots__ = ('book', 'chapter', 'verse', 'text')
+
+    def __init__(self, book, chapter, verse, text):
+        self.book = book
+        self.chapter = chapter
+        self.verse = verse
+        self.text = text
+
+    @property
+    def book_name(self):
+        return BOOKS[self.book - 1]
+
+    def __repr__(self):
+        return f"Verse('{self.book_name} {self.chapter}:{self.verse}')"
+
+
+# Define an imported translation, read through a memory map of its index and text
+class BibleVersion:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            status = os.fstat(f.fileno())
+        # Identifies this import of the version; a re-import swaps in a new file with a new time
+        self.stamp = status.st_mtime_ns
+        self.identity = (status.st_ino, status.st_mtime_ns)
+        magic, fmt, self.verse_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a Bible Block verse file')
+        self._text_offset = RECORDS_OFFSET + self.verse_count * RECORD.size
+
+    def close(self):
+        self._map.close()
+
+    # Return (first record index, verse count) for a chapter in constant time
+    def _slot(self, book, chapter):
+        if not (1 <= book <= MAX_BOOKS and 1 <= chapter <= MAX_CHAPTERS):
+            return 0, 0
+        return SLOT.unpack_from(self._map, SLOTS_OFFSET + (book * (MAX_CHAPTERS + 1) + chapter) * SLOT.size)
+
+    def _text(self, record):
+        offset, length = RECORD.unpack_from(self._map, RECORDS_OFFSET + record * RECORD.size)
+        start = self._text_offset + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    # Define a function returning the number of verses in a chapter (0 if it does not exist)
+    def verse_count_in(self, book, chapter):
+        return self._slot(book, chapter)[1]
+
+    # Define a function returning the chapters a book has in this version
+    def chapters(self, book):
+        return [c for c in range(1, MAX_CHAPTERS + 1) if self._slot(book, c)[1]]
+
+    # Define a function returning the books present in this version
+    def books(self):
+        return [b for b in range(1, MAX_BOOKS + 1) if self._slot(b, 1)[1]]
+
+    # Define a function returning one verse, or None if it does not exist
+    def verse(self, book, chapter, verse):
+        first, count = self._slot(book, chapter)
+        if not 1 <= verse <= count:
+            return None
+        text = self._text(first + verse - 1)
+        return Verse(book, chapter, verse, text) if text else None
+
+    # Define a function returning verses from (chapter, verse) to (end_chapter, end_verse) inclusive,
+    # or only the first `limit` of them
+    def passage(self, book, chapter, verse=1, end_chapter=None, end_verse=None, limit=None):
+        end_chapter = end_chapter or chapter
+        verses = []
+        for c in range(chapter, end_chapter + 1):
+            first, count = self._slot(book, c)
+            start = verse if c == chapter else 1
+            stop = min(count, end_verse) if (c == end_chapter and end_verse) else count
+            for v in range(max(start, 1), stop + 1):
+                text = self._text(first + v - 1)
+                # Empty records stand for verses this translation omits
+                if text:
+                    verses.append(Verse(book, c, v, text))
+                    if limit is not None and len(verses) >= limit:
+                        return verses
+        return verses
+
+    # Define a function returning every verse of a chapter
+    def chapter(self, book, chapter):
+        return self.passage(book, chapter)
+
+
+# Define the set of translations available in a directory, each opened once per process and reopened
+# when `flask bible-import` swaps in a new file
+class BibleLibrary:
+    def __init__(self, directory):
+        self.directory = directory
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, name):
+        return os.path.join(self.directory, f'{name.lower()}.bbl')
+
+    # Define a function listing the versions that have been imported
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f[:-4] for f in os.listdir(self.directory) if f.endswith('.bbl'))
+
+    # Define a function returning an open version, or None if it has not been imported. A stat()
+    # per call notices a re-import made by another process.
+    def get(self, name):
+        name = name.lower()
+        if not VERSION_NAME.match(name):
+            return None
+        try:
+            status = os.stat(self.path_for(name))
+        except FileNotFoundError:
+            return None
+        version = self._versions.get(name)
+        if version is not None and version.identity == (status.st_ino, status.st_mtime_ns):
+            return version
+        with self._lock:
+            version = self._versions.get(name)
+            if version is None or version.identity != (status.st_ino, status.st_mtime_ns):
+                # The old map is not closed: requests still reading it let it go when they finish
+                version = self._versions[name] = BibleVersion(self.path_for(name))
+            return version
+
+    # Define a function to drop an open version so a re-import is picked up
+    def reload(self, name):
+        with self._lock:
+            self._versions.pop(name.lower(), None)
+
+
+# Define a function to read verses from a CSV/TSV file with book, chapter, verse and text columns
+def read_verses(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        dialect = csv.excel_tab if path.endswith(('.tsv', '.txt')) else csv.excel
+        for row in csv.reader(f, dialect):
+            if not row or row[0].strip().lower() in ('book', 'b', '#'):
+                continue
+            book = book_id(row[0])
+            if book is None:
+                raise ValueError(f'Unknown book {row[0]!r} in {path}')
+            yield book, int(row[1]), int(row[2]), row[3].strip()
+
+
+# Define a function to write verses into the compact on-disk format, returning the verse count
+def write_version(path, verses):
+    verses = sorted(verses, key=lambda v: v[:3])
+    slots = {}
+    records = []
+    text = bytearray()
+    for book, chapter, verse, body in verses:
+        if chapter > MAX_CHAPTERS:
+            raise ValueError(f'{BOOKS[book - 1]} {chapter} is beyond the supported chapter range')
+        first, count = slots.get((book, chapter), (len(records), 0))
+        if verse <= count:
+            raise ValueError(f'{BOOKS[book - 1]} {chapter}:{verse} appears more than once')
+        # Translations that omit a verse keep its number with an empty record
+        records.extend((len(text), 0) for _ in range(verse - count - 1))
+        slots[(book, chapter)] = (first, verse)
+        encoded = body.encode('utf-8')
+        records.append((len(text), len(encoded)))
+        text += encoded
+
+    imported = len(verses)
+    table = bytearray((MAX_BOOKS + 1) * (MAX_CHAPTERS + 1) * SLOT.size)
+    for (book, chapter), (first, count) in slots.items():
+        SLOT.pack_into(table, (book * (MAX_CHAPTERS + 1) + chapter) * SLOT.size, first, count)
+
+    # Write to a temporary file and swap it in, so readers never see a partial file
+    tmp_path = path + '.tmp'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records)))
+        f.write(table)
+        for record in records:
+            f.write(RECORD.pack(*record))
+        f.write(text)
+    os.replace(tmp_path, path)
+    return imported
@@ -0,0 +1,384 @@
+# Import necessary modules for the rendered page cache
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, session, make_response
+from flask_login import current_user
+
+# Redis is optional; the in-process backend is used when it is not installed
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# File locking keeps the shared invalidation log from being rotated under a writer; POSIX only
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Response headers stored with a cached body, so hits keep answering conditional requests
+STORED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+
+# Define functions to store a body with its validator headers as one value any backend can hold
+def _pack(body, headers):
+    return json.dumps(headers).encode('utf-8') + b'\n' + body
+
+
+def _unpack(value):
+    headers, _, body = value.partition(b'\n')
+    return body, json.loads(headers)
+
+
+# Define a log of invalidated tags shared through a file, so a page dropped in one worker process is
+# dropped in the others too. Each process appends "pid tag" lines and, before serving a hit, applies
+# whatever the others appended since it last looked; when nothing changed that costs one stat().
+class InvalidationLog:
+    # Tag meaning "drop everything", written by clear() and implied when the log was rotated
+    ALL = '*'
+
+    def __init__(self, path, max_bytes=1 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Pages cached from now on are all newer than what the log holds so far
+        with open(path, 'ab'):
+            pass
+        status = os.stat(path)
+        self._inode, self._offset = status.st_ino, status.st_size
+
+    # Define a function appending tags for the other processes to apply
+    def publish(self, tags):
+        data = ''.join(f'{os.getpid()} {tag}\n' for tag in tags).encode('utf-8')
+        while True:
+            with open(self.path, 'ab') as f:
+                if fcntl is None:
+                    f.write(data)
+                    return
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # Another process may have rotated the file while this one waited for the lock
+                try:
+                    current = os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if not current:
+                    continue
+                f.write(data)
+                f.flush()
+                if f.tell() > self.max_bytes:
+                    # Start a new file; readers notice the new inode and drop all their pages once
+                    with open(self.path + '.tmp', 'wb'):
+                        pass
+                    os.replace(self.path + '.tmp', self.path)
+                return
+
+    # Define a function returning the tags other processes invalidated since the last call
+    def poll(self):
+        try:
+            status = os.stat(self.path)
+        except FileNotFoundError:
+            # Removed by hand: start a new file, treated below like a rotated one
+            with open(self.path, 'ab'):
+                pass
+            status = os.stat(self.path)
+        if status.st_ino != self._inode:
+            self._inode, self._offset = status.st_ino, 0
+            return {self.ALL}
+        if status.st_size <= self._offset:
+            return set()
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(status.st_size - self._offset)
+        # Leave a line still being written for the next call
+        data = data[:data.rfind(b'\n') + 1]
+        self._offset += len(data)
+        own = str(os.getpid())
+        tags = set()
+        for line in data.decode('utf-8', 'replace').splitlines():
+            pid, _, tag = line.partition(' ')
+            if pid != own:
+                tags.add(tag)
+        return tags
+
+
+# Define an in-process LRU backend bounded by entry count and age, kept in step with the other
+# worker processes through an optional InvalidationLog
+class LRUBackend:
+    # Recently invalidated tags remembered to refuse pages rendered before them
+    MAX_INVALIDATED = 4096
+
+    def __init__(self, max_entries, ttl, log=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.log = log
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        # Invalidations applied so far, the count when each recent tag was last invalidated, and the
+        # newest count forgotten from that record
+        self._generation = 0
+        self._invalidated = OrderedDict()
+        self._forgotten = 0
+
+    def get(self, key):
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                self._discard(key)
+                return None
+            # Mark the entry as most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    # Define a function returning a token to pass to set(), taken before a page is rendered
+    def generation(self):
+        with self._lock:
+            self._sync()
+            return self._generation
+
+    # Store a page, unless one of its tags was invalidated, here or in another process, after the
+    # `since` generation: the page may have been rendered from data that changed meanwhile
+    def set(self, key, value, tags, since=None):
+        with self._lock:
+            self._sync()
+            if since is not None and self._invalidated_since(tags, since):
+                return
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            # Evict the least recently used entries past the size bound
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._record(tags)
+            self._drop(tags)
+        if self.log is not None:
+            self.log.publish(tags)
+
+    def clear(self):
+        with self._lock:
+            self._record([InvalidationLog.ALL])
+            self._entries.clear()
+            self._tags.clear()
+        if self.log is not None:
+            self.log.publish([InvalidationLog.ALL])
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Apply invalidations made by other processes; the caller holds the lock
+    def _sync(self):
+        if self.log is None:
+            return
+        tags = self.log.poll()
+        if tags:
+            self._record(tags)
+        if InvalidationLog.ALL in tags:
+            self._entries.clear()
+            self._tags.clear()
+        elif tags:
+            self._drop(tags)
+
+    # Count an invalidation of the tags; the caller holds the lock
+    def _record(self, tags):
+        self._generation += 1
+        for tag in tags:
+            self._invalidated[tag] = self._generation
+            self._invalidated.move_to_end(tag)
+        while len(self._invalidated) > self.MAX_INVALIDATED:
+            self._forgotten = self._invalidated.popitem(last=False)[1]
+
+    # Report whether any of the tags was invalidated after the generation; when that is no longer
+    # remembered, assume it was. The caller holds the lock.
+    def _invalidated_since(self, tags, since):
+        if since < self._forgotten:
+            return True
+        return any(self._invalidated.get(tag, 0) > since for tag in (*tags, InvalidationLog.ALL))
+
+    # Remove every key carrying any of the tags; the caller holds the lock
+    def _drop(self, tags):
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self._discard(key)
+
+    # Remove a key and its tag memberships; the caller holds the lock
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Define a backend storing pages in a Redis-compatible server shared by all workers
+class RedisBackend:
+    def __init__(self, url, ttl, prefix='bible_block:page:'):
+        if redis is None:
+            raise RuntimeError("PAGE_CACHE_TYPE 'redis' requires the redis package")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        # Counter bumped by every invalidation; each invalidated tag keeps the value it was given
+        self._generation_key = prefix + 'generation'
+
+    def get(self, key):
+        return self._client.get(self.prefix + key)
+
+    # Define a function returning a token to pass to set(), taken before a page is rendered
+    def generation(self):
+        return int(self._client.get(self._generation_key) or 0)
+
+    # Store a page, unless one of its tags was invalidated after the `since` generation; the tags'
+    # stamps are watched, so an invalidation between the check and the write also cancels it
+    def set(self, key, value, tags, since=None):
+        stamps = [self.prefix + 'invalidated:' + tag for tag in (*tags, '*')]
+        with self._client.pipeline() as pipe:
+            try:
+                if since is not None:
+                    pipe.watch(*stamps)
+                    if any(int(stamp or 0) > since for stamp in pipe.mget(stamps)):
+                        return
+                    pipe.multi()
+                pipe.setex(self.prefix + key, self.ttl, value)
+                for tag in tags:
+                    # Tag sets outlive their pages slightly so invalidation never misses a key
+                    pipe.sadd(self.prefix + 'tag:' + tag, key)
+                    pipe.expire(self.prefix + 'tag:' + tag, self.ttl * 2)
+                pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def invalidate(self, tags):
+        self._stamp(tags)
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = self._client.smembers(tag_key)
+            pipe = self._client.pipeline()
+            for key in keys:
+                pipe.delete(self.prefix + key.decode('utf-8'))
+            pipe.delete(tag_key)
+            pipe.execute()
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            if key.decode('utf-8') != self._generation_key:
+                self._client.delete(key)
+        self._stamp(['*'])
+
+    # Record the invalidation of the tags for renders still in progress; a stamp only has to outlive
+    # the slowest render
+    def _stamp(self, tags):
+        generation = self._client.incr(self._generation_key)
+        pipe = self._client.pipeline()
+        for tag in tags:
+            pipe.setex(self.prefix + 'invalidated:' + tag, self.ttl, generation)
+        pipe.execute()
+
+
+# Define the page cache extension serving rendered pages to anonymous visitors
+class PageCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.store_hooks = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_TYPE', 'simple')
+        app.config.setdefault('PAGE_CACHE_SECONDS', 300)
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('PAGE_CACHE_INVALIDATION_LOG',
+                              os.path.join(app.instance_path, 'page_cache_invalidations.log'))
+
+        cache_type = app.config['PAGE_CACHE_TYPE']
+        if cache_type == 'simple':
+            self.backend = LRUBackend(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_SECONDS'],
+                                      InvalidationLog(app.config['PAGE_CACHE_INVALIDATION_LOG']))
+        elif cache_type == 'redis':
+            self.backend = RedisBackend(app.config['PAGE_CACHE_REDIS_URL'], app.config['PAGE_CACHE_SECONDS'])
+        elif cache_type == 'null':
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown PAGE_CACHE_TYPE '{cache_type}'")
+
+    # Define a decorator caching a view's rendered body per endpoint and arguments
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self._cacheable():
+                return view(*args, **kwargs)
+
+            key = self._key()
+            value = self.backend.get(key)
+            if value is not None:
+                self.hits += 1
+                body, headers = _unpack(value)
+                response = make_response(body)
+                response.headers.update(headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response.make_conditional(request)
+
+            self.misses += 1
+            g.page_cache_tags = set()
+            # Taken before reading anything, so an edit committed during the render keeps the page out
+            since = self.backend.generation()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and response.mimetype == 'text/html':
+                # Let other extensions finish the response first, so headers they add are stored too
+                for hook in self.store_hooks:
+                    response = hook(response)
+                headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+                self.backend.set(key, _pack(response.get_data(), headers), g.page_cache_tags, since)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+
+    # Define a function views call to record what the page being rendered depends on
+    def tag(self, *tags):
+        tag_set = g.get('page_cache_tags')
+        if tag_set is not None:
+            tag_set.update(tags)
+
+    # Define a function to drop every cached page depending on any of the given tags
+    def invalidate(self, *tags):
+        if self.backend is not None:
+            self.backend.invalidate(tags)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.backend) if isinstance(self.backend, LRUBackend) else None}
+
+    # Only anonymous GETs without pending flash messages see the same page as everyone else
+    def _cacheable(self):
+        return (self.backend is not None
+                and request.method == 'GET'
+                and '_flashes' not in session
+                and not current_user.is_authenticated)
+
+    @staticmethod
+    def _key():
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        return f'{request.endpoint}:{request.path}?{args}'
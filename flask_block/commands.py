@@ -0,0 +1,177 @@
+# Import necessary modules for the flask command-line interface
+import os
+import time
+import click
+from flask_block import app, db, mail_queue, bible_library, page_cache
+from flask_block.bible import VERSION_NAME, read_verses, write_version
+from flask_block.search import rebuild_search_index
+from flask_block.seed import seed_database
+from flask_block.transfer import export_posts, import_posts
+from flask_block.server import SERVERS, serve as serve_app, default_server
+from flask_block.assets import ENCODINGS, build_assets, assets_stale
+from flask_block.migrations import applied_versions, discover, pending, upgrade
+from flask_block.migrations.verify import check_schema, check_query_plans
+from flask_block.modules import User
+
+
+# Define a command that delivers queued mail, once or as a long-running worker
+@app.cli.command('send-mail')
+@click.option('--watch', is_flag=True, help='Keep running and deliver mail as it is queued.')
+def send_mail(watch):
+    if watch:
+        mail_queue.start()
+        click.echo('Delivering queued mail; press Ctrl+C to stop.')
+        try:
+            while True:
+                click.echo(f'Queue: {mail_queue.stats()}')
+                time.sleep(60)
+        except KeyboardInterrupt:
+            mail_queue.stop()
+    else:
+        click.echo(f'Sent {mail_queue.drain()} message(s).')
+
+
+# Define a command that rebuilds the full-text search index from existing posts
+@app.cli.command('search-index')
+def search_index():
+    click.echo(f'Indexed {rebuild_search_index()} post(s).')
+
+
+# Define a command that imports a translation from a CSV/TSV file of book, chapter, verse, text rows
+@app.cli.command('bible-import')
+@click.argument('version')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def bible_import(version, path):
+    if not VERSION_NAME.match(version):
+        raise click.BadParameter('use letters, digits, dashes or underscores', param_hint='VERSION')
+    count = write_version(bible_library.path_for(version), read_verses(path))
+    bible_library.reload(version)
+    # Running workers reopen the file on their next lookup; their cached pages go through the shared log
+    page_cache.invalidate(f'bible:{version.lower()}')
+    click.echo(f'Imported {count} verse(s) into {version.lower()}.')
+
+
+# Define a command that fills the database with synthetic users and posts for load testing
+@app.cli.command('seed')
+@click.option('--users', default=1000, show_default=True, help='Number of users to add.')
+@click.option('--posts', default=10000, show_default=True, help='Number of posts to add.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per insert and commit.')
+@click.option('--seed', 'rng_seed', default=1, show_default=True, help='Random seed, for reproducible data.')
+@click.option('--password', default='password', show_default=True, help='Password of every seeded user.')
+def seed(users, posts, batch_size, rng_seed, password):
+    begin = time.perf_counter()
+    users, posts = seed_database(users, posts, batch_size, rng_seed, password)
+    click.echo(f'Added {users} user(s) and {posts} post(s) in {time.perf_counter() - begin:.1f} s.')
+
+
+# Define a command that writes posts as newline-delimited JSON, to a file or standard output
+@app.cli.command('posts-export')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='File to write (default: stdout).')
+@click.option('--user', 'username', help='Only export posts by this username.')
+@click.option('--batch-size', type=int, help='Rows fetched per round trip.')
+def posts_export(output, username, batch_size):
+    user_id = None
+    if username:
+        user_id = db.session.query(User.id).filter_by(username=username).scalar()
+        if user_id is None:
+            raise click.BadParameter(f'no user named {username!r}', param_hint='--user')
+    count = 0
+    for line in export_posts(user_id, batch_size or app.config['POST_TRANSFER_BATCH_SIZE']):
+        output.write(line)
+        count += 1
+    click.echo(f'Exported {count} post(s).', err=True)
+
+
+# Define a command that imports posts from newline-delimited JSON, one transaction per batch
+@app.cli.command('posts-import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--author', help='Attribute every post to this username instead of each record\'s "author".')
+@click.option('--batch-size', type=int, help='Posts inserted per transaction.')
+def posts_import(source, author, batch_size):
+    author_id = None
+    if author:
+        author_id = db.session.query(User.id).filter_by(username=author).scalar()
+        if author_id is None:
+            raise click.BadParameter(f'no user named {author!r}', param_hint='--author')
+    result = import_posts(source, author_id, batch_size or app.config['POST_TRANSFER_BATCH_SIZE'])
+    for line, error in result.errors[:50]:
+        click.echo(f'line {line}: {error}', err=True)
+    if len(result.errors) > 50:
+        click.echo(f'... and {len(result.errors) - 50} more problem(s)', err=True)
+    click.echo(f'Imported {result.imported} post(s), skipped {len(result.errors)}.')
+
+
+# Define a command that minifies, fingerprints and precompresses the stylesheets and scripts
+@app.cli.command('assets')
+def assets():
+    built = build_assets()
+    for name, target in built['files'].items():
+        path = os.path.join(app.static_folder, target)
+        sizes = [f'{os.path.getsize(path) / 1024:.1f} KB'] + [
+            f'{encoding} {os.path.getsize(path + ENCODINGS[encoding]) / 1024:.1f} KB'
+            for encoding in built['encodings'][target]]
+        click.echo(f'{name} -> {target} ({", ".join(sizes)})')
+
+
+# Define a command that applies pending schema migrations, backfilling rows in short batches
+@app.cli.command('db-upgrade')
+@click.option('--to', 'target', type=int, help='Stop after this migration version.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows updated per transaction in backfills.')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches, letting other writers in.')
+def db_upgrade(target, batch_size, pause):
+    ran = upgrade(db.engine, target, batch_size, pause, echo=click.echo)
+    click.echo(f'Applied {len(ran)} migration(s).' if ran else 'The database is up to date.')
+
+
+# Define a command that lists each migration and when it was applied
+@app.cli.command('db-status')
+def db_status():
+    done = applied_versions(db.engine)
+    for migration in discover():
+        applied = done.get(migration.version) or 'pending'
+        click.echo(f'{migration.version:04d} {migration.name:24} {applied}  {migration.description}')
+
+
+# Define a command that checks the schema and the query plan of every routes.py query
+@app.cli.command('db-verify')
+@click.option('--plans', is_flag=True, help='Print each query plan, not only the problems.')
+def db_verify(plans):
+    failures = 0
+    for result in check_schema() + check_query_plans():
+        click.echo(f'{"ok  " if result.ok else "FAIL"} {result.name}')
+        for problem in result.problems:
+            click.echo(f'       {problem}')
+        if plans or not result.ok:
+            for detail in result.details:
+                click.echo(f'       | {detail}')
+        failures += not result.ok
+    if failures:
+        raise click.ClickException(f'{failures} check(s) failed.')
+    click.echo('Schema and query plans match what the app expects.')
+
+
+# Define a command that serves the app under a production server
+@app.cli.command('serve')
+@click.option('--server', type=click.Choice(SERVERS), help='Server to use (default: the first one installed).')
+@click.option('--host', help='Address to bind.')
+@click.option('--port', type=int, help='Port to bind.')
+@click.option('--workers', type=int, help='Processes (gunicorn, uvicorn).')
+@click.option('--threads', type=int, help='Threads per process.')
+def serve(server, host, port, workers, threads):
+    server = server or app.config['SERVE_SERVER'] or default_server()
+    host = host or app.config['SERVE_HOST']
+    port = port or app.config['SERVE_PORT']
+    workers = workers or app.config['SERVE_WORKERS']
+    threads = threads or app.config['SERVE_THREADS']
+    waiting = pending(db.engine)
+    if waiting:
+        click.echo(f'Warning: {len(waiting)} migration(s) not applied; run `flask db-upgrade`.', err=True)
+    # Production serves fingerprinted assets, so build them first if the sources changed
+    if assets_stale():
+        build_assets()
+        click.echo('Built static assets.')
+    click.echo(f'Serving on http://{host}:{port} with {server}, {workers} worker(s) x {threads} thread(s)')
+    try:
+        serve_app(app, server, host, port, workers, threads)
+    except RuntimeError as exc:
+        raise click.ClickException(str(exc))
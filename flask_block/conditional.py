@@ -0,0 +1,74 @@
+# Import necessary modules for conditional GET support
+import hashlib
+import os
+from datetime import timezone
+from flask import g, request, session, make_response
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+from flask_block import app, page_cache
+
+
+# Define a function fingerprinting the deployed templates and code, so a release never serves stale 304s
+def _code_version():
+    latest = 0
+    for directory in (app.root_path, os.path.join(app.root_path, 'templates')):
+        for name in os.listdir(directory):
+            if name.endswith(('.py', '.html')):
+                latest = max(latest, os.stat(os.path.join(directory, name)).st_mtime_ns)
+    return str(latest)
+
+
+# Salt mixed into every ETag; set ETAG_SALT to pin it across hosts with differing file times
+app.config.setdefault('ETAG_SALT', os.environ.get('ETAG_SALT') or _code_version())
+
+
+# Define a function to drop sub-second precision, which HTTP dates cannot carry, and mark naive UTC times as UTC
+def _http_time(moment):
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.replace(microsecond=0)
+
+
+# Define a function views call before rendering: it records the page's validators and returns a
+# 304 response when the client's copy is still current, or None when the page must be rendered
+def not_modified(*parts, last_modified=None):
+    # A page carrying flash messages differs from the same page without them, so it gets no validators
+    if '_flashes' in session:
+        return None
+
+    viewer = current_user.id if current_user.is_authenticated else 'anon'
+    digest = hashlib.sha1(repr((app.config['ETAG_SALT'], viewer, request.full_path) + parts).encode('utf-8'))
+    etag = digest.hexdigest()[:20]
+    last_modified = _http_time(last_modified)
+    g.validators = (etag, last_modified)
+
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return _with_validators(make_response('', 304), etag, last_modified)
+
+
+def _with_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Let browsers keep the page but check back each time; only anonymous pages may sit in shared caches
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    response.vary.add('Cookie')
+    return response
+
+
+# Define a hook attaching the recorded validators to the rendered page
+@app.after_request
+def add_validators(response):
+    validators = g.pop('validators', None)
+    if validators is not None and response.status_code == 200 and 'ETag' not in response.headers:
+        _with_validators(response, *validators)
+    return response
+
+
+# Cached pages keep their validators, so cache hits can answer with 304s as well
+page_cache.store_hooks.append(add_validators)
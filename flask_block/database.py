@@ -0,0 +1,62 @@
+# Import necessary modules for configuring the SQLite engine
+import os
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Default tuning applied to every SQLite connection the app opens
+DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT': 5000,            # milliseconds to wait on a lock before failing
+    'SQLITE_CACHE_SIZE': -16000,            # negative values are KiB, so roughly 16 MB per connection
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,  # bytes of the database file mapped into memory
+    'SQLITE_POOL_SIZE': 5,
+    'SQLITE_MAX_OVERFLOW': 10,
+}
+
+
+# Define a function to fill in the SQLite settings, taking overrides from the environment
+def load_sqlite_config(config):
+    for key, default in DEFAULTS.items():
+        value = os.environ.get(key, default)
+        config.setdefault(key, type(default)(value))
+
+
+# Define the SQLAlchemy engine options for a pooled, thread-shared SQLite engine
+def sqlite_engine_options(config):
+    return {
+        'poolclass': QueuePool,
+        'pool_size': config['SQLITE_POOL_SIZE'],
+        'max_overflow': config['SQLITE_MAX_OVERFLOW'],
+        'pool_pre_ping': False,
+        'connect_args': {
+            # The driver-level timeout covers the locks taken while connecting
+            'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+            'check_same_thread': False,
+        },
+    }
+
+
+# Define a function to apply the pragmas to each new connection of an engine
+def configure_sqlite_engine(engine, config):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    # Forked workers (e.g. gunicorn --preload) must open their own pooled connections
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
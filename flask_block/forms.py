@@ -1,12 +1,49 @@
 # Import necessary modules and classes from Flask and WTForms
+import re
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from flask_login import current_user
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
+from sqlalchemy import exists, select
 from flask_block.modules import User
 from flask_block import db, app
 
+# Messages shown when a username or email already belongs to another account
+TAKEN = {
+    'username': 'That username is taken. Please choose a different one.',
+    'email': 'That email is taken. Please choose a different one.',
+}
+
+
+# Define a function checking a username and an email against other accounts in one query, using
+# the unique indexes on both columns; returns the names of the fields whose value is taken
+def taken_fields(username=None, email=None, exclude_id=None):
+    checks = {}
+    for field, column, value in (('username', User.username, username), ('email', User.email, email)):
+        if value is not None:
+            condition = column == value
+            if exclude_id is not None:
+                condition &= User.id != exclude_id
+            checks[field] = exists().where(condition)
+    if not checks:
+        return []
+    row = db.session.execute(select(*checks.values())).one()
+    return [field for field, taken in zip(checks, row) if taken]
+
+
+# Define a function to turn a unique-constraint failure from the database into form errors; the
+# up-front check can race with another sign-up, so the constraint is the final word. Returns False
+# if the error was not about a taken username or email.
+def add_unique_errors(form, error):
+    # SQLite names the column ('user.email'), PostgreSQL the constraint ('user_email_key')
+    message = str(error.orig)
+    fields = [field for field in TAKEN if re.search(rf'\buser[._]{field}(?![a-z])', message)]
+    for field in fields:
+        form[field].errors.append(TAKEN[field])
+    return bool(fields)
+
+
 # Define a registration form for user sign up
 class RegistrationForm(FlaskForm):
     # Username input field with validation
@@ -20,21 +57,14 @@ class RegistrationForm(FlaskForm):
     # Submit button for the form
     submit = SubmitField('Sign Up')
 
-    # Function to validate unique username
-    def validate_username(self, username):
-        # Check if the username is already in the database
-        with app.app_context():
-            user = User.query.filter_by(username=username.data).first()
-            if user:
-                raise ValidationError('That username is taken. Please choose a different one.')
-
-    # Function to validate unique email
-    def validate_email(self, email):
-        # Check if the email is already in the database
-        with app.app_context():
-            user = User.query.filter_by(email=email.data).first()
-            if user:
-                raise ValidationError('That email is taken. Please choose a different one.')
+    # Check the username and email together, once both are well-formed
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators)
+        if not (self.username.errors or self.email.errors):
+            for field in taken_fields(self.username.data, self.email.data):
+                self[field].errors.append(TAKEN[field])
+                valid = False
+        return valid
 
 
 # Define a login form for user login
@@ -60,23 +90,16 @@ class UpdateAccountForm(FlaskForm):
     # Submit button for the form
     submit = SubmitField('Update')
 
-    # Function to validate unique username, excluding the current user's username
-    def validate_username(self, username):
-        if username.data != current_user.username:
-            # Check if the username is already in the database
-            with app.app_context():
-                user = User.query.filter_by(username=username.data).first()
-                if user:
-                    raise ValidationError('That username is taken. Please choose a different one.')
-
-    # Function to validate unique email, excluding the current user's email
-    def validate_email(self, email):
-        if email.data != current_user.email:
-            # Check if the email is already in the database
-            with app.app_context():
-                user = User.query.filter_by(email=email.data).first()
-                if user:
-                    raise ValidationError('That email is taken. Please choose a different one.')
+    # Check whichever of the username and email changed, together, against other accounts
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators)
+        if not (self.username.errors or self.email.errors):
+            username = self.username.data if self.username.data != current_user.username else None
+            email = self.email.data if self.email.data != current_user.email else None
+            for field in taken_fields(username, email, exclude_id=current_user.id):
+                self[field].errors.append(TAKEN[field])
+                valid = False
+        return valid
 
 
 # Define a form for creating posts
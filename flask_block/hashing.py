@@ -0,0 +1,71 @@
+# Import necessary modules for the password hashing service
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as JobTimeout
+from flask_block.metrics import timed
+
+
+# Define the error raised when too many hashes are already running or waiting
+class HashingBusy(Exception):
+    pass
+
+
+# Define the password hashing service running bcrypt in a bounded worker pool
+class PasswordHasher:
+    def __init__(self, app=None, bcrypt=None):
+        self.bcrypt = bcrypt
+        self._pool = None
+        self._slots = None
+        self.rounds = 12
+        self.timeout = 30
+        if app is not None:
+            self.init_app(app, bcrypt)
+
+    def init_app(self, app, bcrypt=None):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_DEPTH', 8)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 30)
+        if bcrypt is not None:
+            self.bcrypt = bcrypt
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+
+        # bcrypt releases the GIL, so threads give real parallelism up to the worker count
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_HASH_QUEUE_DEPTH'])
+
+    # Run a hashing call in the pool, refusing at once when the queue is full or when the call takes
+    # longer than the timeout to come back
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash finishes, not until the caller stops waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            with timed('bcrypt'):
+                return future.result(timeout=self.timeout)
+        except JobTimeout:
+            # A call still waiting in the queue is dropped; one already running keeps its slot
+            future.cancel()
+            raise HashingBusy()
+
+    # Define a function to hash a password at the configured cost
+    def hash(self, password):
+        return self._run(self.bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    # Define a function to check a password against a stored hash
+    def check(self, pw_hash, password):
+        return self._run(self.bcrypt.check_password_hash, pw_hash, password)
+
+    # Define a function telling whether a hash was made at a different cost than configured
+    def needs_rehash(self, pw_hash):
+        try:
+            return int(pw_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
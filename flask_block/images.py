@@ -0,0 +1,132 @@
+# Import necessary modules for the profile picture pipeline
+import hashlib
+import io
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as JobTimeout
+from PIL import Image, ImageOps, features
+from flask import url_for, request
+from flask_block import app
+from flask_block.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Names produced by the pipeline: a 12-character content hash plus the output format
+PIPELINE_NAME = re.compile(r'^[0-9a-f]{12}\.(webp|jpg)$')
+# Names never reused for different content: content-addressed derived files, and the random
+# hex names pictures were saved under before the pipeline existed (default.jpg is neither)
+IMMUTABLE_PICTURE = re.compile(r'^(?:[0-9a-f]{12}_\w+\.(?:webp|jpg)|[0-9a-f]{16}\.(?:jpe?g|png|gif))$')
+
+# Process pool doing the CPU-heavy decode/resize/encode work, created on first upload
+_pool = None
+
+
+# Define a function to return the shared process pool, creating it lazily
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=app.config['PROFILE_IMAGE_WORKERS'])
+    return _pool
+
+
+# Define the output format: WebP when Pillow was built with it, optimized JPEG otherwise
+def output_format():
+    if app.config['PROFILE_IMAGE_FORMAT'] == 'webp' and features.check('webp'):
+        return 'webp'
+    return 'jpg'
+
+
+# Define a function to check an upload from its header alone, so oversized or unsupported files are
+# refused before any pixels are decoded; render_sizes decodes the rest
+def validate_picture(data):
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            fmt, (width, height) = img.format, img.size
+    except Image.DecompressionBombError:
+        raise ValueError('That picture is too large.')
+    except Exception:
+        raise ValueError('That file is not a valid image.')
+    if fmt not in ('JPEG', 'PNG'):
+        raise ValueError('Only JPG and PNG pictures are supported.')
+    if width * height > app.config['PROFILE_IMAGE_MAX_PIXELS']:
+        raise ValueError('That picture is too large.')
+
+
+# Define the worker task decoding one upload and writing every derived size
+def render_sizes(data, base, directory, sizes, fmt):
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        # Let the JPEG decoder downscale by DCT while decoding instead of afterwards
+        largest = max(sizes.values())
+        img.draft('RGB', (largest, largest))
+    # Decode every pixel before writing anything, so a truncated or corrupt file leaves no files behind
+    img.load()
+    img = ImageOps.exif_transpose(img).convert('RGB')
+
+    for label, size in sizes.items():
+        variant = ImageOps.fit(img, (size, size), Image.LANCZOS)
+        path = os.path.join(directory, f'{base}_{label}.{fmt}')
+        tmp_path = path + '.tmp'
+        if fmt == 'webp':
+            variant.save(tmp_path, 'WEBP', quality=80, method=4)
+        else:
+            variant.save(tmp_path, 'JPEG', quality=82, optimize=True, progressive=True)
+        # Publish each file atomically so a request never sees half an image
+        os.replace(tmp_path, path)
+    return base
+
+
+# Define a function to store an uploaded picture and return its image_file name
+def save_profile_picture(form_picture):
+    data = form_picture.read()
+    with timed('image_validate'):
+        validate_picture(data)
+
+    fmt = output_format()
+    base = hashlib.sha256(data).hexdigest()[:12]
+    directory = os.path.join(app.root_path, 'static/profiles')
+    sizes = app.config['PROFILE_IMAGE_SIZES']
+
+    # Identical uploads share their derived files, so skip work that is already done
+    if all(os.path.exists(os.path.join(directory, f'{base}_{label}.{fmt}')) for label in sizes):
+        return f'{base}.{fmt}'
+
+    # The picture is only accepted once every size has been written. In async mode the decoding runs
+    # in the process pool, so the other requests of this process keep the GIL while this one waits.
+    try:
+        with timed('image_render'):
+            if app.config['PROFILE_IMAGE_ASYNC']:
+                _get_pool().submit(render_sizes, data, base, directory, sizes, fmt).result(
+                    timeout=app.config['PROFILE_IMAGE_TIMEOUT'])
+            else:
+                render_sizes(data, base, directory, sizes, fmt)
+    except JobTimeout:
+        raise ValueError('That picture took too long to process. Please try a smaller one.')
+    except (OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        logger.info('Rejected profile picture %s: %s', base, exc)
+        raise ValueError('That file is not a valid image.')
+    return f'{base}.{fmt}'
+
+
+# Define a template helper returning the URL of a profile picture at a given size
+@app.template_global()
+def profile_image_url(image_file, size='sm'):
+    if PIPELINE_NAME.match(image_file):
+        base, fmt = image_file.split('.')
+        return url_for('static', filename=f'profiles/{base}_{size}.{fmt}')
+    # Pictures saved before the pipeline existed only have their original file
+    return url_for('static', filename='profiles/' + image_file)
+
+
+# Define a hook giving profile pictures that can never change a long-lived cache lifetime
+@app.after_request
+def cache_profile_pictures(response):
+    if request.endpoint == 'static' and response.status_code == 200:
+        filename = (request.view_args or {}).get('filename', '')
+        if filename.startswith('profiles/') and IMMUTABLE_PICTURE.match(filename[9:]):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+    return response
@@ -0,0 +1,214 @@
+# Import necessary modules for the persistent outgoing mail queue
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from flask_mail import Message
+from flask_block.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Schema of the outbox table holding messages until they are delivered
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    subject TEXT NOT NULL,
+    sender TEXT,
+    recipients TEXT NOT NULL,
+    body TEXT,
+    html TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+# Define the mail queue extension delivering messages from background workers
+class MailQueue:
+    def __init__(self, app=None, mail=None):
+        self.app = None
+        self.mail = mail
+        self._wakeup = threading.Event()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._stopping = False
+        if app is not None:
+            self.init_app(app, mail)
+
+    def init_app(self, app, mail=None):
+        app.config.setdefault('MAIL_QUEUE_ASYNC', True)
+        app.config.setdefault('MAIL_QUEUE_PATH', os.path.join(app.instance_path, 'mail_queue.db'))
+        app.config.setdefault('MAIL_QUEUE_WORKERS', 2)
+        app.config.setdefault('MAIL_QUEUE_BATCH_SIZE', 20)
+        app.config.setdefault('MAIL_QUEUE_MAX_ATTEMPTS', 5)
+        app.config.setdefault('MAIL_QUEUE_RETRY_SECONDS', 30)
+        app.config.setdefault('MAIL_QUEUE_STALE_SECONDS', 600)
+        self.app = app
+        if mail is not None:
+            self.mail = mail
+
+    # Open a short-lived connection to the queue database, creating it on first use
+    def _connect(self):
+        path = self.app.config['MAIL_QUEUE_PATH']
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        return conn
+
+    # Define a function to store a message for delivery and return immediately
+    def enqueue(self, msg):
+        if not self.app.config['MAIL_QUEUE_ASYNC']:
+            # Synchronous mode keeps the old inline behaviour, e.g. for debugging
+            self.mail.send(msg)
+            return None
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO outbox (subject, sender, recipients, body, html, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (msg.subject, _sender(msg.sender), json.dumps(msg.recipients), msg.body, msg.html, time.time()))
+            message_id = cursor.lastrowid
+        finally:
+            conn.close()
+
+        self.start()
+        self._wakeup.set()
+        return message_id
+
+    # Define a function to start the background worker threads once per process
+    def start(self):
+        with self._lock:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            if self._workers:
+                return
+            self._stopping = False
+            for n in range(self.app.config['MAIL_QUEUE_WORKERS']):
+                worker = threading.Thread(target=self._run, name=f'mail-queue-{n}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    # Define a function to stop the workers after their current batch
+    def stop(self, timeout=None):
+        self._stopping = True
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                sent = self.process_batch()
+            except Exception:
+                logger.exception('Mail queue worker failed')
+                sent = 0
+            if not sent:
+                # Sleep until new mail arrives or the next retry may be due
+                self._wakeup.wait(self.app.config['MAIL_QUEUE_RETRY_SECONDS'])
+                self._wakeup.clear()
+
+    # Define a function to claim due messages and deliver them over one SMTP connection
+    def process_batch(self):
+        batch = self._claim()
+        if not batch:
+            return 0
+
+        delivered = []
+        failed = []
+        with self.app.app_context():
+            try:
+                with timed('smtp'), self.mail.connect() as connection:
+                    for row in batch:
+                        try:
+                            connection.send(_message(row))
+                            delivered.append(row['id'])
+                        except Exception as exc:
+                            failed.append((row, exc))
+            except Exception as exc:
+                # The connection itself failed; every undelivered message is retried
+                done = set(delivered) | {row['id'] for row, _ in failed}
+                failed.extend((row, exc) for row in batch if row['id'] not in done)
+
+        self._finish(delivered, failed)
+        return len(delivered)
+
+    # Define a function to send everything that is currently due, e.g. from a CLI worker
+    def drain(self):
+        total = 0
+        while True:
+            sent = self.process_batch()
+            if not sent:
+                return total
+            total += sent
+
+    def _claim(self):
+        token = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Return messages abandoned by a worker that died mid-send to the queue
+            conn.execute("UPDATE outbox SET status = 'pending', claimed_by = NULL "
+                         "WHERE status = 'sending' AND claimed_at < ?",
+                         (now - self.app.config['MAIL_QUEUE_STALE_SECONDS'],))
+            conn.execute("UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ? "
+                         "WHERE id IN (SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                         "ORDER BY next_attempt_at LIMIT ?)",
+                         (token, now, now, self.app.config['MAIL_QUEUE_BATCH_SIZE']))
+            conn.execute('COMMIT')
+            return conn.execute("SELECT * FROM outbox WHERE claimed_by = ? AND status = 'sending'",
+                                (token,)).fetchall()
+        finally:
+            conn.close()
+
+    def _finish(self, delivered, failed):
+        max_attempts = self.app.config['MAIL_QUEUE_MAX_ATTEMPTS']
+        retry_seconds = self.app.config['MAIL_QUEUE_RETRY_SECONDS']
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in delivered])
+            for row, exc in failed:
+                attempts = row['attempts'] + 1
+                status = 'failed' if attempts >= max_attempts else 'pending'
+                # Back off exponentially between attempts
+                next_attempt = time.time() + retry_seconds * 2 ** (attempts - 1)
+                logger.warning('Mail delivery to %s failed (attempt %d): %s', row['recipients'], attempts, exc)
+                conn.execute("UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, "
+                             "claimed_by = NULL, last_error = ? WHERE id = ?",
+                             (status, attempts, next_attempt, str(exc), row['id']))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    # Define a function to count queued messages by status
+    def stats(self):
+        conn = self._connect()
+        try:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+        finally:
+            conn.close()
+
+
+# Flask-Mail accepts (name, address) tuples as senders; store them as one string
+def _sender(sender):
+    if isinstance(sender, (tuple, list)):
+        return f'{sender[0]} <{sender[1]}>'
+    return sender
+
+
+# Rebuild a Flask-Mail message from an outbox row
+def _message(row):
+    return Message(row['subject'], sender=row['sender'], recipients=json.loads(row['recipients']),
+                   body=row['body'], html=row['html'])
@@ -0,0 +1,261 @@
+# Import necessary modules for request and query instrumentation
+import cProfile
+import hmac
+import io
+import logging
+import pstats
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from flask import g, request, has_request_context, template_rendered, before_render_template
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Held while a sampled request is profiled: from Python 3.12 only one profiler may run per process,
+# so requests sampled meanwhile in other threads go unprofiled
+_profiling = threading.Lock()
+
+
+# Define a Prometheus-style histogram with one series per label value
+class Histogram:
+    def __init__(self, name, help_text, buckets, label='endpoint'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_value, (counts, total, count) in sorted(self._series.items()):
+                label = f'{self.label}="{_escape(label_value)}"'
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{label}}} {total}')
+                lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+# Define a labelled counter
+class CounterMetric:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+                lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Metrics shared by the whole process; recording is a no-op until Metrics.init_app enables it
+enabled = False
+request_duration = Histogram('bible_block_request_duration_seconds',
+                             'Time spent handling requests, by endpoint.', DURATION_BUCKETS)
+request_queries = Histogram('bible_block_request_queries',
+                            'SQL statements executed per request, by endpoint.', QUERY_BUCKETS)
+query_duration = Histogram('bible_block_query_duration_seconds',
+                           'Time spent in SQL statements, by endpoint.', DURATION_BUCKETS)
+operation_duration = Histogram('bible_block_operation_duration_seconds',
+                               'Time spent in slow operations such as template rendering, bcrypt, '
+                               'image processing and SMTP.', DURATION_BUCKETS, label='operation')
+n_plus_one = CounterMetric('bible_block_n_plus_one_total',
+                           'Requests repeating one SELECT statement past the N+1 threshold.',
+                           ('endpoint', 'table'))
+responses = CounterMetric('bible_block_responses_total', 'Responses sent, by endpoint and status.',
+                          ('endpoint', 'status'))
+
+
+# Define a function recording how long a named operation took
+def observe(operation, seconds):
+    if enabled:
+        operation_duration.observe(operation, seconds)
+
+
+# Define a context manager timing a named operation, e.g. `with timed('bcrypt'):`
+@contextmanager
+def timed(operation):
+    if not enabled:
+        yield
+        return
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation_duration.observe(operation, time.perf_counter() - begin)
+
+
+# Define the instrumentation extension: request hooks, engine events and the /metrics endpoint
+class Metrics:
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.collectors = []
+        self.slow_profiles = deque(maxlen=20)
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        global enabled
+        app.config.setdefault('METRICS_ENABLED', False)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('METRICS_PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('METRICS_SLOW_REQUEST_SECONDS', 0.5)
+        self.app = app
+        if not app.config['METRICS_ENABLED']:
+            return
+        enabled = True
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        # The remote address cannot tell a local caller from one behind a reverse proxy on the same
+        # host, so the endpoint only exists with a token; N+1 and slow request logs work without it
+        if app.config['METRICS_TOKEN']:
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        else:
+            logger.warning('METRICS_TOKEN is not set; /metrics is disabled')
+
+    # Define a function adding a callable that returns extra exposition lines
+    def register_collector(self, collector):
+        self.collectors.append(collector)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = Counter()
+        g.metrics_query_time = 0.0
+        g.metrics_profiler = None
+        if random.random() < self.app.config['METRICS_PROFILE_SAMPLE_RATE'] and _profiling.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiling tool, such as a debugger or coverage, is already active
+                _profiling.release()
+                return
+            g.metrics_profiler = profiler
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        statements = g.pop('metrics_queries', Counter())
+
+        request_duration.observe(endpoint, elapsed)
+        request_queries.observe(endpoint, sum(statements.values()))
+        query_duration.observe(endpoint, g.pop('metrics_query_time', 0.0))
+        responses.inc(endpoint, response.status_code)
+        self._check_n_plus_one(endpoint, statements)
+
+        profiler = self._stop_profiler()
+        if profiler is not None and elapsed >= self.app.config['METRICS_SLOW_REQUEST_SECONDS']:
+            self._keep_profile(endpoint, elapsed, profiler)
+        return response
+
+    # A request ended by an unhandled error skips _after_request; stop its profiler all the same
+    def _teardown_request(self, exc):
+        self._stop_profiler()
+
+    # Define a function stopping this request's profiler, if any, and letting the next request profile
+    def _stop_profiler(self):
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profiling.release()
+        return profiler
+
+    # The same SELECT run many times in one request is the signature of lazy loading in a loop
+    def _check_n_plus_one(self, endpoint, statements):
+        threshold = self.app.config['METRICS_N_PLUS_ONE_THRESHOLD']
+        for statement, count in statements.items():
+            if count >= threshold and statement.lstrip().upper().startswith('SELECT'):
+                match = re.search(r'\bFROM\s+"?(\w+)', statement, re.IGNORECASE)
+                table = match.group(1) if match else 'unknown'
+                n_plus_one.inc(endpoint, table)
+                logger.warning('Possible N+1 in %s: statement ran %d times: %s', endpoint, count, statement[:200])
+
+    def _keep_profile(self, endpoint, elapsed, profiler):
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+        self.slow_profiles.append((time.time(), endpoint, elapsed, out.getvalue()))
+        logger.info('Slow request to %s took %.3f s:\n%s', endpoint, elapsed, out.getvalue())
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.metrics_render_start = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        start = g.pop('metrics_render_start', None) if has_request_context() else None
+        if start is not None:
+            operation_duration.observe('jinja', time.perf_counter() - start)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['metrics_start'].pop()
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries[statement] += 1
+            g.metrics_query_time += time.perf_counter() - start
+
+    # Only callers holding the token may read metrics
+    def _authorized(self):
+        token = self.app.config['METRICS_TOKEN']
+        supplied = request.headers.get('Authorization', '')
+        return bool(token) and hmac.compare_digest(supplied, f'Bearer {token}')
+
+    # Define the view exposing every metric in the Prometheus text format
+    def metrics_view(self):
+        if not self._authorized():
+            return 'Forbidden', 403
+        lines = []
+        for metric in (request_duration, request_queries, query_duration, operation_duration,
+                       n_plus_one, responses):
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
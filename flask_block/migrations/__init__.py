@@ -0,0 +1,199 @@
+# Import necessary modules for running versioned schema migrations
+import importlib
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Scripts live in versions/ as NNNN_name.py, each defining `description` and `upgrade(ctx)`
+VERSIONS_DIR = os.path.join(os.path.dirname(__file__), 'versions')
+SCRIPT_NAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# Table recording which scripts have been applied to a database
+VERSION_TABLE = 'schema_migrations'
+
+# Upper bound of the last id range a batched step walks
+MAX_ID = 2 ** 63 - 1
+
+
+# Define one versioned migration script
+class Migration:
+    def __init__(self, version, name):
+        self.version = version
+        self.name = name
+        self.module = importlib.import_module(f'{__name__}.versions.{version:04d}_{name}')
+        self.description = self.module.description
+
+    def __repr__(self):
+        return f'Migration({self.version:04d}, {self.name!r})'
+
+
+# Define a function listing every migration script in version order
+def discover():
+    found = []
+    for filename in os.listdir(VERSIONS_DIR):
+        match = SCRIPT_NAME.match(filename)
+        if match:
+            found.append(Migration(int(match.group(1)), match.group(2)))
+    found.sort(key=lambda migration: migration.version)
+    versions = [migration.version for migration in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError('two migration scripts share a version number')
+    return found
+
+
+# Define the helpers a migration script works through. Every step is idempotent, so a script
+# interrupted half way (or run against a database altered by hand) can simply be run again.
+class MigrationContext:
+    def __init__(self, engine, batch_size=1000, pause=0.0, echo=None):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.echo = echo or (lambda message: None)
+        # A pooled connection keeps the app's pragmas (WAL, busy_timeout); transactions are managed
+        # by hand, since the driver would otherwise commit around every DDL statement
+        self._connection = engine.raw_connection()
+        self._sqlite = self._connection.driver_connection
+        self._isolation_level = self._sqlite.isolation_level
+        self._sqlite.isolation_level = None
+
+    def close(self):
+        self._sqlite.isolation_level = self._isolation_level
+        self._connection.close()
+
+    # Run statements as one transaction holding the write lock from the start; readers are never
+    # blocked in WAL mode and keep seeing the old schema until it commits
+    @contextmanager
+    def transaction(self):
+        cursor = self._sqlite.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+
+    def execute(self, sql, params=()):
+        with self.transaction() as cursor:
+            return cursor.execute(sql, params).fetchall()
+
+    def query(self, sql, params=()):
+        return self._sqlite.execute(sql, params).fetchall()
+
+    def has_table(self, name):
+        return bool(self.query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)))
+
+    def columns(self, table):
+        return {row[1] for row in self.query(f'PRAGMA table_info("{table}")')}
+
+    def index_columns(self, name):
+        return [row[2] for row in self.query(f'PRAGMA index_info("{name}")')]
+
+    # Add a column unless it exists; SQLite only rewrites the schema entry, never the table
+    def add_column(self, table, name, definition):
+        if name in self.columns(table):
+            return False
+        self.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {definition}')
+        self.echo(f'  added {table}.{name}')
+        return True
+
+    # Create an index, or rebuild it when it exists with other columns. The rebuild drops and
+    # creates it in one transaction, so concurrent readers never see the table without it.
+    def create_index(self, name, table, columns, replaces=()):
+        existing = self.index_columns(name)
+        stale = [old for old in replaces if self.index_columns(old)]
+        if existing == list(columns) and not stale:
+            return False
+        begin = time.perf_counter()
+        with self.transaction() as cursor:
+            for old in ([name] if existing else []) + stale:
+                cursor.execute(f'DROP INDEX "{old}"')
+            cursor.execute(f'CREATE INDEX "{name}" ON "{table}" ({", ".join(columns)})')
+        self.echo(f'  built index {name} in {time.perf_counter() - begin:.2f} s')
+        return True
+
+    # Define a generator walking a table's primary keys in chunks, yielding each (low, high] id range.
+    # It covers the rows present when it starts, then everything added since in one last range, so a
+    # busy table cannot keep it chasing new rows forever.
+    def _id_ranges(self, table):
+        last = 0
+        end = self.query(f'SELECT MAX(id) FROM "{table}"')[0][0] or 0
+        while last < end:
+            upper = self.query(f'SELECT MAX(id) FROM (SELECT id FROM "{table}" WHERE id > ? AND id <= ? '
+                               f'ORDER BY id LIMIT ?)', (last, end, self.batch_size))[0][0] or end
+            yield last, upper
+            last = upper
+            # Give other writers a turn between chunks
+            if self.pause:
+                time.sleep(self.pause)
+        yield last, MAX_ID
+
+    # Update rows with an SQL SET clause, one short transaction per chunk of ids
+    def update_in_batches(self, table, assignments, where='1'):
+        updated = 0
+        for low, high in self._id_ranges(table):
+            with self.transaction() as cursor:
+                cursor.execute(f'UPDATE "{table}" SET {assignments} WHERE id > ? AND id <= ? AND ({where})',
+                               (low, high))
+                updated += cursor.rowcount
+        self.echo(f'  updated {updated} {table} row(s)')
+        return updated
+
+    # Fill columns computed in Python. Each chunk is read and computed without holding the write
+    # lock; the write then skips any row whose inputs changed meanwhile, as the app recomputed it.
+    def backfill(self, table, reads, compute, where='1'):
+        updated = 0
+        for low, high in self._id_ranges(table):
+            rows = self.query(f'SELECT id, {", ".join(reads)} FROM "{table}" '
+                              f'WHERE id > ? AND id <= ? AND ({where})', (low, high))
+            values = [dict(compute(*row[1:]), id=row[0], **{f'_{c}': v for c, v in zip(reads, row[1:])})
+                      for row in rows]
+            if not values:
+                continue
+            assignments = ', '.join(f'"{column}" = :{column}' for column in values[0]
+                                    if column != 'id' and not column.startswith('_'))
+            unchanged = ' AND '.join(f'"{column}" IS :_{column}' for column in reads)
+            with self.transaction() as cursor:
+                cursor.executemany(f'UPDATE "{table}" SET {assignments} WHERE id = :id AND {unchanged}', values)
+            updated += len(values)
+        self.echo(f'  backfilled {updated} {table} row(s)')
+        return updated
+
+
+# Define a function returning {version: applied_at} for the scripts a database has run
+def applied_versions(engine):
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, VERSION_TABLE):
+            return {}
+        rows = connection.exec_driver_sql(f'SELECT version, applied_at FROM {VERSION_TABLE}').fetchall()
+    return {version: applied_at for version, applied_at in rows}
+
+
+# Define a function listing the scripts a database has not run yet
+def pending(engine):
+    done = applied_versions(engine)
+    return [migration for migration in discover() if migration.version not in done]
+
+
+# Define a function applying pending scripts in order, up to `target` when given, returning those run
+def upgrade(engine, target=None, batch_size=1000, pause=0.0, echo=None):
+    echo = echo or (lambda message: None)
+    ran = []
+    ctx = MigrationContext(engine, batch_size, pause, echo)
+    try:
+        ctx.execute(f'CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL PRIMARY KEY, '
+                    'name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)')
+        for migration in pending(engine):
+            if target is not None and migration.version > target:
+                break
+            echo(f'{migration.version:04d} {migration.name}: {migration.description}')
+            begin = time.perf_counter()
+            migration.module.upgrade(ctx)
+            ctx.execute(f'INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (?, ?, ?)',
+                        (migration.version, migration.name, datetime.utcnow().isoformat(' ')))
+            echo(f'  done in {time.perf_counter() - begin:.2f} s')
+            ran.append(migration)
+    finally:
+        ctx.close()
+    return ran
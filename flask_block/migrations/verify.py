@@ -0,0 +1,152 @@
+# Import necessary modules for checking a database against the schema and query plans the app expects
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+from flask_block import app, db
+from flask_block.forms import taken_fields
+from flask_block.migrations import pending
+from flask_block.modules import User, Post, load_user, invalidate_session_user
+from flask_block.pagination import keyset_paginate, cached_count, encode_cursor
+from flask_block.routes import card_query, author_card_query
+from flask_block.search import search_posts
+
+# The search index and the triggers keeping it in sync, which live outside the models
+SEARCH_OBJECTS = {'post_fts': 'table', 'post_fts_insert': 'trigger', 'post_fts_delete': 'trigger',
+                  'post_fts_update': 'trigger'}
+
+# Plan steps that read a whole table row by row, or sort rows an index should have ordered
+TABLE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+# Define the outcome of one check: a name, the plan or detail behind it, and what is wrong
+class CheckResult:
+    def __init__(self, name, details=(), problems=()):
+        self.name = name
+        self.details = list(details)
+        self.problems = list(problems)
+
+    @property
+    def ok(self):
+        return not self.problems
+
+
+# Define a function comparing the database with the models: tables, columns, indexes and search objects
+def check_schema():
+    results = []
+    waiting = pending(db.engine)
+    results.append(CheckResult('migrations applied', [f'{m.version:04d} {m.name}' for m in waiting],
+                               [f'{len(waiting)} migration(s) not applied; run `flask db-upgrade`'] if waiting else []))
+
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            results.append(CheckResult(f'table {table.name}', problems=['missing']))
+            continue
+        missing = {column.name for column in table.columns} - {c['name'] for c in inspector.get_columns(table.name)}
+        results.append(CheckResult(f'table {table.name}', problems=[f'missing column {c}' for c in sorted(missing)]))
+
+        actual = {index['name']: index['column_names'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            expected = [column.name for column in index.columns]
+            if index.name not in actual:
+                problem = ['missing']
+            elif actual[index.name] != expected:
+                problem = [f'has columns {actual[index.name]}, expected {expected}']
+            else:
+                problem = []
+            results.append(CheckResult(f'index {index.name}', [', '.join(expected)], problem))
+
+    found = dict(db.session.execute(db.text(
+        'SELECT name, type FROM sqlite_master WHERE name IN (%s)' % ', '.join(f"'{n}'" for n in SEARCH_OBJECTS))).all())
+    for name, kind in SEARCH_OBJECTS.items():
+        results.append(CheckResult(f'{kind} {name}', problems=[] if found.get(name) == kind else ['missing']))
+    return results
+
+
+# Define a context manager collecting the SELECT statements issued while it is open
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+# Define the queries routes.py issues, each run through the same helpers the views call, with the
+# index (or plan fragment) its plan must use
+def route_queries():
+    username = db.session.query(User.username).order_by(User.id).limit(1).scalar() or 'nobody'
+    newest = encode_cursor(SimpleNamespace(date_posted=datetime.utcnow(), id=0))
+    oldest = encode_cursor(SimpleNamespace(date_posted=datetime(2000, 1, 1), id=0))
+    user_index = 'INDEX sqlite_autoindex_user_'
+    return [
+        ('home: first page', lambda: keyset_paginate(card_query()), ['ix_post_feed_cards']),
+        ('home: older page', lambda: keyset_paginate(card_query(), after=newest), ['ix_post_feed_cards']),
+        ('home: newer page', lambda: keyset_paginate(card_query(), before=oldest), ['ix_post_feed_cards']),
+        ('home: numbered page', lambda: card_query().order_by(Post.date_posted.desc())
+            .paginate(page=2, per_page=5, error_out=False, count=False), ['ix_post_feed_cards']),
+        ('home: total', lambda: cached_count('verify', card_query(), ttl=0), []),
+        ('user_posts: first page', lambda: keyset_paginate(author_card_query(username)),
+            [user_index, 'ix_post_user_date']),
+        ('user_posts: older page', lambda: keyset_paginate(author_card_query(username), after=newest),
+            [user_index, 'ix_post_user_date']),
+        ('post, update_post, delete_post', lambda: Post.query.options(db.joinedload(Post.author)).get(1),
+            ['INTEGER PRIMARY KEY']),
+        ('login', lambda: User.query.filter_by(username=username).first(), [user_index]),
+        ('reset_request', lambda: User.query.filter_by(email='nobody@example.com').first(), [user_index]),
+        ('register, account: taken check', lambda: taken_fields(username, 'nobody@example.com'), [user_index]),
+        ('session user', lambda: (invalidate_session_user(1), load_user(1)), ['INTEGER PRIMARY KEY']),
+        ('search', lambda: search_posts('grace'), ['VIRTUAL TABLE', 'INTEGER PRIMARY KEY']),
+    ]
+
+
+# Define a function running each route query and checking its EXPLAIN QUERY PLAN
+def check_query_plans():
+    results = []
+    has_search = db.session.execute(db.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'")).first()
+    with app.test_request_context():
+        for name, run, expected in route_queries():
+            if name == 'search' and not has_search:
+                # Searching would create the index on the spot; its absence is reported with the schema
+                results.append(CheckResult(name, problems=['post_fts is missing']))
+                continue
+            db.session.expunge_all()
+            try:
+                with captured_selects() as statements:
+                    run()
+            except SQLAlchemyError as exc:
+                # Typically a column the migrations have not added yet, reported with the schema
+                db.session.rollback()
+                results.append(CheckResult(name, problems=[f'query failed: {getattr(exc, "orig", None) or exc}']))
+                continue
+
+            plan, problems = [], []
+            for statement, parameters in statements:
+                details = [row[-1] for row in db.session.connection().exec_driver_sql(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters)]
+                plan.extend(details)
+                for detail in details:
+                    scan = TABLE_SCAN.match(detail)
+                    if scan and scan.group(1) in ('post', 'user'):
+                        problems.append(f'reads every row of {scan.group(1)}')
+                # Ranked full-text matches can only be sorted; anything else should come in index order
+                if TEMP_SORT in details and not any('VIRTUAL TABLE' in detail for detail in details):
+                    problems.append('sorts rows instead of reading them in index order')
+            for fragment in expected:
+                if not any(fragment in detail for detail in plan):
+                    problems.append(f'does not use {fragment.replace("INDEX ", "").rstrip("_")}')
+            results.append(CheckResult(name, plan, problems))
+    db.session.rollback()
+    return results
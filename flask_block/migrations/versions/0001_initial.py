@@ -0,0 +1,23 @@
+# The user and post tables as the app first shipped them
+description = 'create the user and post tables'
+
+
+def upgrade(ctx):
+    with ctx.transaction() as cursor:
+        cursor.execute("""CREATE TABLE IF NOT EXISTS user (
+            id INTEGER NOT NULL,
+            username VARCHAR(20) NOT NULL,
+            email VARCHAR(120) NOT NULL,
+            image_file VARCHAR(20) NOT NULL,
+            password VARCHAR(60) NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (username),
+            UNIQUE (email))""")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS post (
+            id INTEGER NOT NULL,
+            title VARCHAR(100) NOT NULL,
+            date_posted DATETIME NOT NULL,
+            content TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES user (id))""")
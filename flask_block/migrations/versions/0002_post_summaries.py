@@ -0,0 +1,12 @@
+# Listing cards read a stored excerpt, word count and scripture references instead of the post body
+from flask_block.modules import summarize_content
+
+description = 'add post excerpt, word_count and scripture_refs, filled from each body'
+
+
+def upgrade(ctx):
+    ctx.add_column('post', 'excerpt', "VARCHAR(300) NOT NULL DEFAULT ''")
+    ctx.add_column('post', 'word_count', 'INTEGER NOT NULL DEFAULT 0')
+    ctx.add_column('post', 'scripture_refs', "VARCHAR(200) NOT NULL DEFAULT ''")
+    # Rows not summarized yet still have the column defaults; a rerun picks up where it stopped
+    ctx.backfill('post', ['content'], summarize_content, where="excerpt = '' AND word_count = 0")
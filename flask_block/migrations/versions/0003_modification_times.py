@@ -0,0 +1,7 @@
+# Conditional GETs need to know when a post or an author's profile last changed; NULL means never
+description = 'add post.updated_at and user.profile_updated_at'
+
+
+def upgrade(ctx):
+    ctx.add_column('post', 'updated_at', 'DATETIME')
+    ctx.add_column('user', 'profile_updated_at', 'DATETIME')
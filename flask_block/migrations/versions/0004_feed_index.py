@@ -0,0 +1,10 @@
+# Newest-first feed pages seek on (date_posted, id) and read every card column from the index itself
+description = 'build the covering feed index ix_post_feed_cards'
+
+
+def upgrade(ctx):
+    # Earlier hand-applied schemas carried the narrower (date_posted, id) index it supersedes
+    ctx.create_index('ix_post_feed_cards', 'post',
+                     ['date_posted', 'id', 'user_id', 'title', 'excerpt', 'word_count', 'scripture_refs',
+                      'updated_at'],
+                     replaces=['ix_post_date_posted_id'])
@@ -0,0 +1,13 @@
+# Author pages read a running post total instead of counting, and seek posts by (user_id, date_posted)
+description = 'add user.post_count and last_posted_at, build ix_post_user_date'
+
+
+def upgrade(ctx):
+    ctx.add_column('user', 'post_count', 'INTEGER NOT NULL DEFAULT 0')
+    ctx.add_column('user', 'last_posted_at', 'DATETIME')
+    # Build the index first: the backfill's per-author count and max are then index lookups
+    ctx.create_index('ix_post_user_date', 'post', ['user_id', 'date_posted', 'id'])
+    ctx.update_in_batches(
+        'user',
+        'post_count = (SELECT COUNT(*) FROM post WHERE post.user_id = user.id), '
+        'last_posted_at = (SELECT MAX(date_posted) FROM post WHERE post.user_id = user.id)')
@@ -0,0 +1,15 @@
+# Full-text search over post titles and bodies, kept in sync by triggers
+from flask_block.search import SCHEMA
+
+description = 'create the post_fts search index and its triggers'
+
+
+def upgrade(ctx):
+    if ctx.has_table('post_fts'):
+        return
+    # Filled in one transaction: an external-content index must not see trigger writes for rows
+    # it has not indexed yet, which a chunked fill would allow
+    with ctx.transaction() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO post_fts (post_fts) VALUES ('rebuild')")
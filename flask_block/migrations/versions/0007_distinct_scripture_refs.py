@@ -0,0 +1,10 @@
+# Stored reference lists used to repeat a passage for every citation; rebuild them with each listed once
+from flask_block.modules import summarize_references
+
+description = 'list each passage once in post.scripture_refs'
+
+
+def upgrade(ctx):
+    # Only a list with several entries can hold a repeat; recomputing one is harmless on a rerun
+    ctx.backfill('post', ['content'], lambda content: {'scripture_refs': summarize_references(content)},
+                 where="scripture_refs LIKE '%;%'")
@@ -1,16 +1,87 @@
+import hashlib
+import hmac
+import re
+import time
 from datetime import datetime, timedelta, timezone
 import jwt
+from sqlalchemy import case, func, select, update
 from flask_block import app, db, login_manager
+from flask_block.references import parse_references
 from flask_login import UserMixin
 
+# Longest excerpt stored for listing cards, and longest list of scripture references kept per post
+EXCERPT_LENGTH = 280
+SCRIPTURE_REFS_LENGTH = 200
+
+# Per-process cache of session users, stored as user_id -> (expires_at, SessionUser)
+_session_users = {}
+
+# Per-process cache of verified reset tokens, stored as token -> (expires_at, user_id, fingerprint)
+_reset_tokens = {}
+RESET_TOKEN_CACHE_SIZE = 4096
+
+# Define the lightweight user object Flask-Login keeps for the logged-in user
+class SessionUser(UserMixin):
+    def __init__(self, id, username, email, image_file):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.image_file = image_file
+
+    def __repr__(self):
+        return f"SessionUser('{self.username}', '{self.email}', '{self.image_file}')"
+
 # Define a user loader function for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    with app.app_context():
-        # Load user from the database using the provided user_id
-        user = User.query.get(int(user_id))
+    user_id = int(user_id)
+    now = time.monotonic()
+
+    # Serve the user from the identity cache while the entry is fresh
+    cached = _session_users.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    # Load only the columns Flask-Login and the templates need, never the posts
+    row = db.session.query(User.id, User.username, User.email, User.image_file)\
+            .filter(User.id == user_id).first()
+    if row is None:
+        _session_users.pop(user_id, None)
+        return None
+
+    user = SessionUser(*row)
+    ttl = app.config['SESSION_USER_CACHE_SECONDS']
+    if ttl > 0:
+        _session_users[user_id] = (now + ttl, user)
     return user
 
+# Define a function to drop a user from the identity cache after their account changes
+def invalidate_session_user(user_id):
+    _session_users.pop(int(user_id), None)
+
+# Define a function returning a reset token's (expires_at, user_id, fingerprint), or None if it is
+# invalid; the page is opened on GET and submitted on POST, so each token is verified once and reused
+def _decode_reset_token(token):
+    now = time.time()
+    claims = _reset_tokens.get(token)
+    if claims is not None:
+        return claims if claims[0] > now else None
+
+    try:
+        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        claims = (payload['exp'], int(payload['user_id']), str(payload['pw']))
+    except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
+        return None
+
+    if len(_reset_tokens) >= RESET_TOKEN_CACHE_SIZE:
+        # Drop expired tokens first, and start over if the cache is full of live ones
+        for key in [k for k, v in _reset_tokens.items() if v[0] <= now]:
+            _reset_tokens.pop(key, None)
+        if len(_reset_tokens) >= RESET_TOKEN_CACHE_SIZE:
+            _reset_tokens.clear()
+    _reset_tokens[token] = claims
+    return claims
+
 # Define the User class, inheriting from db.Model and UserMixin
 class User(db.Model, UserMixin):
     # Define user model fields
@@ -19,30 +90,43 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), unique=True, nullable=False)
     image_file = db.Column(db.String(20), nullable=False, default='default.jpg')
     password = db.Column(db.String(60), nullable=False)
-    posts = db.relationship('Post', backref='author', lazy='subquery')
+    # When the username or picture last changed; part of the validators of every page showing this author
+    profile_updated_at = db.Column(db.DateTime, nullable=True)
+    # Running totals kept in step by new_post/delete_post, so author pages never count posts
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_posted_at = db.Column(db.DateTime, nullable=True)
+    posts = db.relationship('Post', backref='author', lazy='select')
+
+    # Define a method returning a short keyed digest of the current password hash; it changes with
+    # every password change, so tokens carrying it stop working once they have been used
+    def password_fingerprint(self):
+        key = app.config['SECRET_KEY'].encode('utf-8')
+        return hmac.new(key, self.password.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
 
     # Define a method to generate a JWT token for password reset
     def get_reset_token(self, expires_sec=1800):
         key = app.config['SECRET_KEY']
         encoded = jwt.encode(
             {"exp": datetime.now(tz=timezone.utc) + timedelta(seconds=expires_sec), 
-            "user_id": self.id},
+            "user_id": self.id,
+            "pw": self.password_fingerprint()},
             key,
             algorithm="HS256"
             )
         return encoded
 
-    # Define a static method to verify a password reset token
+    # Define a static method to verify a password reset token with a single query
     @staticmethod
     def verify_reset_token(token):
-        key = app.config['SECRET_KEY']
-        try:
-            user_id = jwt.decode(token, key, algorithms="HS256")['user_id']
-        except:
+        claims = _decode_reset_token(token)
+        if claims is None:
             return None
-        with app.app_context():
-            # Load and return the user associated with the decoded token
-            return User.query.get(user_id)
+
+        # Load the user; a token minted before the password last changed no longer matches
+        user = db.session.get(User, claims[1])
+        if user is None or not hmac.compare_digest(claims[2], user.password_fingerprint()):
+            return None
+        return user
 
     # Define a representation method for the User class
     def __repr__(self):
@@ -56,7 +140,94 @@ class Post(db.Model):
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # When the post was last edited, or None if it never was
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    # Summary fields derived from content on every write, so listings never need the full body
+    excerpt = db.Column(db.String(EXCERPT_LENGTH + 20), nullable=False, default='', server_default='')
+    word_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    scripture_refs = db.Column(db.String(SCRIPTURE_REFS_LENGTH), nullable=False, default='', server_default='')
+
+    # Index backing newest-first cursor pagination on (date_posted, id); it also carries every
+    # listing-card column, so feed pages are read from the index without touching post bodies
+    # A second index on (user_id, date_posted, id) serves author pages the same way, and the
+    # per-author lookups that keep the User totals up to date
+    __table_args__ = (db.Index('ix_post_feed_cards', 'date_posted', 'id', 'user_id', 'title',
+                               'excerpt', 'word_count', 'scripture_refs', 'updated_at'),
+                      db.Index('ix_post_user_date', 'user_id', 'date_posted', 'id'))
+
+
+    # Define a property giving the time the post last changed, for conditional requests
+    @property
+    def last_modified(self):
+        return self.updated_at or self.date_posted
+
+    # Define a property telling whether the excerpt is shorter than the post; a cut always drops
+    # at least one word, while a post that merely ends in '…' keeps them all
+    @property
+    def is_truncated(self):
+        return self.word_count > len(self.excerpt.split())
 
     # Define a representation method for the Post class
     def __repr__(self):
         return f"Post('{self.title}', '{self.date_posted}')"
+
+# Define a function to cut content down to a listing excerpt at a word boundary
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    text = re.sub(r'[ \t]+', ' ', content.strip())
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(None, 1)[0].rstrip(' ,;:.') + '…'
+
+# Define a function to list the scripture a post cites, in canonical form, within the column width
+def summarize_references(content):
+    labels = []
+    total = 0
+    for reference in parse_references(content):
+        # A passage cited more than once is listed once
+        if reference.label in labels:
+            continue
+        total += len(reference.label) + 2
+        if total > SCRIPTURE_REFS_LENGTH:
+            break
+        labels.append(reference.label)
+    return '; '.join(labels)
+
+# Define a function returning the derived summary fields for a post body
+def summarize_content(content):
+    return {
+        'excerpt': make_excerpt(content),
+        'word_count': len(content.split()),
+        'scripture_refs': summarize_references(content),
+    }
+
+# Keep the summary fields in step whenever a post's content is assigned
+@db.event.listens_for(Post.content, 'set')
+def update_summary(target, value, oldvalue, initiator):
+    if value is not None:
+        for field, summary in summarize_content(value).items():
+            setattr(target, field, summary)
+
+# Define a function to count new posts in their author's totals, in the caller's transaction;
+# `posted_at` is the newest of them
+def record_new_post(user_id, posted_at, count=1):
+    latest = case((User.last_posted_at.is_(None) | (User.last_posted_at < posted_at), posted_at),
+                  else_=User.last_posted_at)
+    db.session.execute(update(User).where(User.id == user_id)
+                       .values(post_count=User.post_count + count, last_posted_at=latest))
+
+# Define a function to take a deleted post out of its author's totals; call it after the delete is flushed
+def record_deleted_post(user_id):
+    latest = select(func.max(Post.date_posted)).where(Post.user_id == user_id).scalar_subquery()
+    db.session.execute(update(User).where(User.id == user_id)
+                       .values(post_count=User.post_count - 1, last_posted_at=latest))
+
+# Define a function to recompute the totals from the post table, for some users or all of them,
+# after posts are written in bulk
+def refresh_post_stats(user_ids=None):
+    statement = update(User).values(
+        post_count=select(func.count()).where(Post.user_id == User.id).scalar_subquery(),
+        last_posted_at=select(func.max(Post.date_posted)).where(Post.user_id == User.id).scalar_subquery())
+    if user_ids is not None:
+        statement = statement.where(User.id.in_(list(user_ids)))
+    db.session.execute(statement)
@@ -0,0 +1,93 @@
+# Import necessary modules for cursor encoding and count caching
+import base64
+import time
+from datetime import datetime
+from flask import abort
+from sqlalchemy import tuple_
+from flask_block import app
+from flask_block.modules import Post
+
+# Cached totals keyed by listing, stored as key -> (expires_at, count)
+_count_cache = {}
+
+
+# Define a function to turn a (date_posted, id) pair into an opaque cursor token
+def encode_cursor(post):
+    raw = f"{post.date_posted.isoformat()}|{post.id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+# Define a function to turn a cursor token back into a (date_posted, id) pair
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        date_part, id_part = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeDecodeError):
+        # A tampered or truncated token is a client error
+        abort(400)
+
+
+# Define a page of posts fetched by cursor instead of by offset
+class KeysetPage:
+    def __init__(self, items, per_page, has_next, has_prev, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+
+    # Cursor for the page of older posts following this one
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return encode_cursor(self.items[-1])
+        return None
+
+    # Cursor for the page of newer posts preceding this one
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return encode_cursor(self.items[0])
+        return None
+
+
+# Define a function to count rows of a listing, reusing the result for a short while
+def cached_count(key, query, ttl=None):
+    if ttl is None:
+        ttl = app.config['FEED_COUNT_CACHE_SECONDS']
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    # Count on the primary key only so SQLite can answer from the smallest index
+    total = query.order_by(None).with_entities(Post.id).count()
+    if ttl > 0:
+        _count_cache[key] = (now + ttl, total)
+    return total
+
+
+# Define a function to forget cached totals after posts are added or removed
+def invalidate_counts():
+    _count_cache.clear()
+
+
+# Define a function to fetch one page of a newest-first post query by cursor
+def keyset_paginate(query, after=None, before=None, per_page=5):
+    # The key must match the composite (date_posted, id) index on Post
+    key = tuple_(Post.date_posted, Post.id)
+
+    if before is not None:
+        # Walk backwards towards newer posts, then restore newest-first order
+        rows = query.filter(key > tuple_(*decode_cursor(before)))\
+                .order_by(Post.date_posted.asc(), Post.id.asc()).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, per_page, has_next=True, has_prev=has_prev)
+
+    if after is not None:
+        query = query.filter(key < tuple_(*decode_cursor(after)))
+
+    # Fetch one extra row to learn whether an older page exists without counting
+    rows = query.order_by(Post.date_posted.desc(), Post.id.desc()).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], per_page, has_next=len(rows) > per_page, has_prev=after is not None)
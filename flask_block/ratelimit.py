@@ -0,0 +1,149 @@
+# Import necessary modules for the token-bucket rate limiter
+import os
+import sqlite3
+import threading
+import time
+
+# Schema of the table holding every key's bucket when buckets are shared between processes
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_bucket_updated_at ON bucket (updated_at);
+"""
+
+
+# Define in-process bucket storage; each worker process counts attempts on its own
+class MemoryBuckets:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    # Define a function that spends one token from every key's bucket, or none if any is empty
+    def take(self, keys, capacity, refill_rate):
+        now = time.monotonic()
+        with self._lock:
+            levels = [_level(self._buckets.get(key), now, capacity, refill_rate) for key in keys]
+            if min(levels) < 1:
+                return False
+            for key, level in zip(keys, levels):
+                self._buckets[key] = (level - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, capacity, refill_rate)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    # Forget buckets that have refilled completely; they behave like new ones
+    def _prune(self, now, capacity, refill_rate):
+        full = [key for key, bucket in self._buckets.items() if _level(bucket, now, capacity, refill_rate) >= capacity]
+        for key in full:
+            del self._buckets[key]
+
+
+# Define bucket storage in a SQLite file every worker process opens, so the limits hold across the
+# whole server rather than per process
+class SQLiteBuckets:
+    def __init__(self, path, prune_seconds=60):
+        self.path = path
+        self.prune_seconds = prune_seconds
+        self._pruned_at = 0.0
+        self._local = threading.local()
+
+    # Return this thread's connection to the bucket database, creating the database on first use.
+    # Connections are kept open: closing the last one checkpoints the WAL, which costs more than
+    # the attempt itself. One made before a fork is never reused by the child.
+    def _connection(self):
+        conn, pid = getattr(self._local, 'conn', None), getattr(self._local, 'pid', None)
+        if conn is not None and pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Losing the last few attempts in a power cut is harmless; skip the fsync on every commit
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # Define a function that spends one token from every key's bucket, or none if any is empty; the
+    # read and the write share one write transaction, so two processes cannot spend the same token
+    def take(self, keys, capacity, refill_rate):
+        names = [repr(key) for key in keys]
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Wall-clock time, since monotonic clocks are not comparable between processes
+            now = time.time()
+            rows = conn.execute(f'SELECT key, tokens, updated_at FROM bucket '
+                                f'WHERE key IN ({", ".join("?" * len(names))})', names)
+            stored = {name: (tokens, updated_at) for name, tokens, updated_at in rows}
+            levels = [_level(stored.get(name), now, capacity, refill_rate) for name in names]
+            allowed = min(levels) >= 1
+            if allowed:
+                conn.executemany('INSERT OR REPLACE INTO bucket (key, tokens, updated_at) VALUES (?, ?, ?)',
+                                 [(name, level - 1, now) for name, level in zip(names, levels)])
+                if now - self._pruned_at > self.prune_seconds:
+                    # Buckets that have refilled completely behave like new ones
+                    conn.execute('DELETE FROM bucket WHERE updated_at < ?', (now - capacity / refill_rate,))
+                    self._pruned_at = now
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return allowed
+
+    def clear(self):
+        self._connection().execute('DELETE FROM bucket')
+
+
+# Tokens a bucket has now, topped up for the time since it was last used; a new key starts full
+def _level(bucket, now, capacity, refill_rate):
+    if bucket is None:
+        return capacity
+    tokens, updated = bucket
+    return min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+
+
+# Define a rate limiter giving every key a bucket that refills at a steady rate
+class RateLimiter:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.capacity = 10
+        self.refill_rate = 10 / 60
+        self.storage = MemoryBuckets(100000)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMIT_BURST', 10)
+        app.config.setdefault('RATE_LIMIT_PER_MINUTE', 10)
+        app.config.setdefault('RATE_LIMIT_MAX_KEYS', 100000)
+        app.config.setdefault('RATE_LIMIT_STORAGE', 'sqlite')
+        app.config.setdefault('RATE_LIMIT_PATH', os.path.join(app.instance_path, 'rate_limit.db'))
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.capacity = app.config['RATE_LIMIT_BURST']
+        self.refill_rate = app.config['RATE_LIMIT_PER_MINUTE'] / 60
+
+        storage = app.config['RATE_LIMIT_STORAGE']
+        if storage == 'sqlite':
+            self.storage = SQLiteBuckets(app.config['RATE_LIMIT_PATH'])
+        elif storage == 'memory':
+            self.storage = MemoryBuckets(app.config['RATE_LIMIT_MAX_KEYS'])
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_STORAGE '{storage}'")
+
+    # Define a function that spends one token from every key's bucket, or none if any is empty
+    def allow(self, *keys):
+        if not self.enabled:
+            return True
+        return self.storage.take(keys, self.capacity, self.refill_rate)
+
+    def reset(self):
+        self.storage.clear()
@@ -0,0 +1,196 @@
+# Import necessary modules for parsing scripture references and resolving passages
+import re
+from functools import lru_cache
+from flask_block.bible import BOOKS, book_id, book_slug
+
+# Common abbreviations for each book, in addition to its full name; two-letter forms that are
+# also everyday words ('Is', 'Am', 'Re') are left out to avoid false matches
+ALIASES = {
+    'Genesis': ['Gen', 'Gn'], 'Exodus': ['Exod', 'Exo'], 'Leviticus': ['Lev', 'Lv'],
+    'Numbers': ['Num', 'Nu', 'Nm', 'Nb'], 'Deuteronomy': ['Deut', 'Dt'], 'Joshua': ['Josh', 'Jos'],
+    'Judges': ['Judg', 'Jdg', 'Jg'], 'Ruth': ['Rth'], '1 Samuel': ['1 Sam', '1 Sa', '1Sm'],
+    '2 Samuel': ['2 Sam', '2 Sa', '2Sm'], '1 Kings': ['1 Kgs', '1 Ki'], '2 Kings': ['2 Kgs', '2 Ki'],
+    '1 Chronicles': ['1 Chron', '1 Chr', '1 Ch'], '2 Chronicles': ['2 Chron', '2 Chr', '2 Ch'],
+    'Ezra': ['Ezr'], 'Nehemiah': ['Neh', 'Ne'], 'Esther': ['Esth', 'Est'], 'Job': ['Jb'],
+    'Psalms': ['Psalm', 'Pss', 'Psa', 'Ps'], 'Proverbs': ['Prov', 'Pro', 'Prv', 'Pr'],
+    'Ecclesiastes': ['Eccles', 'Eccl', 'Ecc', 'Qoh'], 'Song of Solomon': ['Song of Songs', 'Song', 'SoS', 'Sg'],
+    'Isaiah': ['Isa'], 'Jeremiah': ['Jer', 'Jr'], 'Lamentations': ['Lam'],
+    'Ezekiel': ['Ezek', 'Eze', 'Ezk'], 'Daniel': ['Dan', 'Dn'], 'Hosea': ['Hos'],
+    'Joel': ['Jl'], 'Amos': [], 'Obadiah': ['Obad'], 'Jonah': ['Jon', 'Jnh'],
+    'Micah': ['Mic', 'Mc'], 'Nahum': ['Nah'], 'Habakkuk': ['Hab', 'Hb'], 'Zephaniah': ['Zeph', 'Zep', 'Zp'],
+    'Haggai': ['Hag', 'Hg'], 'Zechariah': ['Zech', 'Zec', 'Zc'], 'Malachi': ['Mal', 'Ml'],
+    'Matthew': ['Matt', 'Mat', 'Mt'], 'Mark': ['Mrk', 'Mk'], 'Luke': ['Luk', 'Lk'],
+    'John': ['Joh', 'Jhn', 'Jn'], 'Acts': [], 'Romans': ['Rom', 'Rm'],
+    '1 Corinthians': ['1 Cor', '1 Co'], '2 Corinthians': ['2 Cor', '2 Co'], 'Galatians': ['Gal', 'Ga'],
+    'Ephesians': ['Eph', 'Ephes'], 'Philippians': ['Phil', 'Php'], 'Colossians': ['Col'],
+    '1 Thessalonians': ['1 Thess', '1 Thes', '1 Th'], '2 Thessalonians': ['2 Thess', '2 Thes', '2 Th'],
+    '1 Timothy': ['1 Tim', '1 Ti'], '2 Timothy': ['2 Tim', '2 Ti'], 'Titus': ['Tit'],
+    'Philemon': ['Philem', 'Phm'], 'Hebrews': ['Heb'], 'James': ['Jas', 'Jm'],
+    '1 Peter': ['1 Pet', '1 Pe', '1 Pt'], '2 Peter': ['2 Pet', '2 Pe', '2 Pt'],
+    '1 John': ['1 Jn', '1 Jhn'], '2 John': ['2 Jn', '2 Jhn'], '3 John': ['3 Jn', '3 Jhn'],
+    'Jude': [], 'Revelation': ['Rev', 'Rv', 'Revelations'],
+}
+
+# Map of every normalized alias to its book id
+_ALIAS_IDS = {}
+for _name in BOOKS:
+    for _alias in [_name] + ALIASES.get(_name, []):
+        _ALIAS_IDS[re.sub(r'\s+', '', _alias.lower())] = book_id(_name)
+        # Numbered books are also written with Roman numerals, e.g. 'II Kings'
+        if _alias[0] in '123':
+            roman = {'1': 'i', '2': 'ii', '3': 'iii'}[_alias[0]]
+            _ALIAS_IDS[roman + re.sub(r'\s+', '', _alias[1:].lower())] = book_id(_name)
+
+
+# Build one pattern matching any alias, longest first so 'John' wins over 'Jo'
+def _alias_pattern(numbered_only=False):
+    names = set()
+    for _name in BOOKS:
+        for alias in [_name] + ALIASES.get(_name, []):
+            words = alias.split(' ')
+            if words[0] in ('1', '2', '3'):
+                prefix = {'1': '(?:1|I)', '2': '(?:2|II)', '3': '(?:3|III)'}[words[0]]
+                tail = r'\s+'.join(map(re.escape, words[1:]))
+                names.add(tail if numbered_only else prefix + r'\s*' + tail)
+            elif not numbered_only:
+                names.add(r'\s+'.join(map(re.escape, words)))
+    return '|'.join(sorted(names, key=len, reverse=True))
+
+
+# Pattern for a capitalized book name followed by a chapter and optional verse range, e.g. 'Rom 8:28-30' or 'Ps 23'
+REFERENCE = re.compile(
+    r'\b(?P<book>' + _alias_pattern() + r')\.?\s*'
+    r'(?P<chapter>\d{1,3})(?::(?P<verse>\d{1,3}))?'
+    r'(?:\s*[-–]\s*(?:(?P<end_chapter>\d{1,3}):)?(?P<end_verse>\d{1,3}))?\b')
+
+# Pattern for a continuation after a reference: ', 18', ', 20-22' or '; 4:1-3' in the same book,
+# but not the number starting a new numbered book as in ', 2 Cor 5:17'
+CONTINUATION = re.compile(
+    r'\s*(?P<sep>[,;])\s*(?:(?P<chapter>\d{1,3}):)?(?P<verse>\d{1,3})'
+    r'(?:\s*[-–]\s*(?:(?P<end_chapter>\d{1,3}):)?(?P<end_verse>\d{1,3}))?\b'
+    r'(?!\s*(?:' + _alias_pattern(numbered_only=True) + r')\.?\s*\d)')
+
+
+# Define a parsed reference to a verse, a verse range or a whole chapter
+class Reference(tuple):
+    __slots__ = ()
+
+    def __new__(cls, book, chapter, verse=None, end_chapter=None, end_verse=None):
+        return super().__new__(cls, (book, chapter, verse, end_chapter or chapter, end_verse))
+
+    book = property(lambda self: self[0])
+    chapter = property(lambda self: self[1])
+    verse = property(lambda self: self[2])
+    end_chapter = property(lambda self: self[3])
+    end_verse = property(lambda self: self[4])
+
+    @property
+    def book_name(self):
+        return BOOKS[self.book - 1]
+
+    @property
+    def slug(self):
+        return book_slug(self.book_name)
+
+    # Human-readable form, e.g. 'John 3:16-18'
+    @property
+    def label(self):
+        text = f'{self.book_name} {self.chapter}'
+        if self.verse:
+            text += f':{self.verse}'
+        if self.end_chapter != self.chapter:
+            text += f'-{self.end_chapter}:{self.end_verse}' if self.end_verse else f'-{self.end_chapter}'
+        elif self.end_verse and self.end_verse != self.verse:
+            text += f'-{self.end_verse}'
+        return text
+
+    def __repr__(self):
+        return f"Reference('{self.label}')"
+
+
+# Define a function to find every scripture reference in a piece of text, in order of appearance
+def parse_references(text):
+    references = []
+    for match in REFERENCE.finditer(text):
+        book = _ALIAS_IDS.get(re.sub(r'[\s.]+', '', match.group('book').lower()))
+        if book is None:
+            continue
+        chapter = int(match.group('chapter'))
+        verse = int(match.group('verse')) if match.group('verse') else None
+        end_verse = int(match.group('end_verse')) if match.group('end_verse') else None
+        end_chapter = int(match.group('end_chapter')) if match.group('end_chapter') else None
+        if verse is None and end_verse is not None:
+            # 'Ps 23-24' is a chapter range
+            end_chapter, end_verse = end_verse, None
+        references.append(Reference(book, chapter, verse, end_chapter, end_verse or verse))
+
+        # Follow lists such as 'John 3:16, 18; 4:1' that keep the same book
+        position = match.end()
+        while True:
+            more = CONTINUATION.match(text, position)
+            if more is None:
+                break
+            if more.group('chapter'):
+                chapter = int(more.group('chapter'))
+            elif more.group('sep') == ';' or verse is None:
+                # After a semicolon or a bare chapter a lone number is another chapter
+                chapter, verse = int(more.group('verse')), None
+                references.append(Reference(book, chapter))
+                position = more.end()
+                continue
+            verse = int(more.group('verse'))
+            end_verse = int(more.group('end_verse')) if more.group('end_verse') else verse
+            end_chapter = int(more.group('end_chapter')) if more.group('end_chapter') else None
+            references.append(Reference(book, chapter, verse, end_chapter, end_verse))
+            position = more.end()
+    return tuple(references)
+
+
+# Define a memoized parse of a post's stored reference list; those are short and read on every listing,
+# unlike whole post bodies, which are parsed once per write and never cached
+@lru_cache(maxsize=4096)
+def parse_reference_list(refs):
+    return parse_references(refs)
+
+
+# Verses shown with a post for one passage; longer passages end with a link to the full text
+INLINE_VERSES = 12
+
+
+# Define a resolved passage ready for a template
+class Passage:
+    __slots__ = ('reference', 'version', 'verses', 'truncated')
+
+    def __init__(self, reference, version, verses, truncated=False):
+        self.reference = reference
+        self.version = version
+        self.verses = verses
+        self.truncated = truncated
+
+
+# Define a memoized function returning the (chapter, number, text) of the first verses of a reference
+# in one version, one more than are shown so callers can tell the passage goes on
+@lru_cache(maxsize=2048)
+def passage_verses(bible, reference):
+    verses = bible.passage(reference.book, reference.chapter, reference.verse or 1,
+                           reference.end_chapter, reference.end_verse, limit=INLINE_VERSES + 1)
+    return tuple((v.chapter, v.verse, v.text) for v in verses)
+
+
+# Define a function to resolve every reference cited by a page of posts in one pass
+def resolve_passages(posts, bible, limit_per_post=5):
+    if bible is None:
+        return {}
+
+    # Read each post's stored reference list, so listings never need the full body; a passage cited
+    # twice is shown once and takes one of the post's slots
+    cited = {post.id: list(dict.fromkeys(parse_reference_list(post.scripture_refs)))[:limit_per_post]
+             for post in posts}
+    resolved = {}
+    for reference in {r for refs in cited.values() for r in refs}:
+        verses = passage_verses(bible, reference)
+        if verses:
+            resolved[reference] = Passage(reference, bible.name, verses[:INLINE_VERSES],
+                                          truncated=len(verses) > INLINE_VERSES)
+
+    return {post_id: [resolved[r] for r in refs if r in resolved] for post_id, refs in cited.items()}
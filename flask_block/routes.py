@@ -1,26 +1,160 @@
-import os
-import secrets
-from PIL import Image
-from flask import render_template, url_for, flash, redirect, request, abort
-from flask_block import app, db, bcrypt, mail
-from sqlalchemy.orm import joinedload
-from flask_block.forms import RegistrationForm, LoginForm, UpdateAccountForm, PostForm, RequestResetForm, ResetPasswordForm
-from flask_block.modules import User, Post
+from datetime import datetime
+from flask import render_template, url_for, flash, redirect, request, abort, jsonify, Response, stream_with_context
+from flask_block import app, db, mail_queue, page_cache, bible_library, password_hasher, rate_limiter
+from flask_block.hashing import HashingBusy
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only, contains_eager
+from flask_block.forms import RegistrationForm, LoginForm, UpdateAccountForm, PostForm, RequestResetForm, ResetPasswordForm, add_unique_errors
+from flask_block.modules import User, Post, invalidate_session_user, record_new_post, record_deleted_post
+from flask_block.images import save_profile_picture, profile_image_url
+from flask_block.search import search_posts
+from flask_block.transfer import export_posts, import_posts
+from flask_block.bible import BOOKS, book_id, book_slug
+from flask_block.references import resolve_passages
+from flask_block.pagination import keyset_paginate, cached_count, invalidate_counts
+from flask_block.conditional import not_modified
 from flask_login import login_user, current_user, logout_user, login_required
 from flask_mail import Message
 
+# Columns a listing card shows for a post and for its author
+CARD_COLUMNS = (Post.id, Post.title, Post.date_posted, Post.user_id,
+                Post.excerpt, Post.word_count, Post.scripture_refs, Post.updated_at)
+AUTHOR_COLUMNS = (User.id, User.username, User.image_file, User.profile_updated_at, User.post_count)
+
+# Define a function to build a post query that loads only what a listing card shows
+def card_query():
+    return Post.query.options(load_only(*CARD_COLUMNS), joinedload(Post.author).load_only(*AUTHOR_COLUMNS))
+
+# Define a function to build the card query for one author's posts, loading the author with them;
+# the author is found by username through its unique index, and posts are then read newest-first
+# from the (user_id, date_posted) index
+def author_card_query(username):
+    return Post.query.join(Post.author).filter(User.username == username).options(
+        load_only(*CARD_COLUMNS),
+        contains_eager(Post.author).load_only(*AUTHOR_COLUMNS, User.last_posted_at))
+
+# Define a function returning what identifies the imported text of the default Bible version
+def bible_stamp():
+    bible = bible_library.get(app.config['BIBLE_DEFAULT_VERSION'])
+    return (bible.name, bible.stamp) if bible is not None else None
+
+# Define a function returning the ETag parts of a page of post cards: what each card shows, so a
+# listing is only re-rendered when one of its cards would look different. Listings send no
+# Last-Modified: deleting the newest post or a change to an author's counts would not move it
+# forward, and a client asking only If-Modified-Since would get a stale 304.
+def listing_validators(posts, *extra):
+    cards = tuple((p.id, p.last_modified, p.author.profile_updated_at, p.author.post_count) for p in posts.items)
+    return (cards, posts.total, posts.has_next, posts.has_prev, bible_stamp()) + extra
+
+# Define a function to resolve the scripture cited by a page of posts in the default version
+def cited_passages(posts):
+    bible = bible_library.get(app.config['BIBLE_DEFAULT_VERSION'])
+    if bible is not None:
+        page_cache.tag(f'bible:{bible.name}')
+    return resolve_passages(posts, bible)
+
 # Define the route for the home page
 @app.route("/")
 @app.route("/home")
+@page_cache.cached
 def home():
-    # Get the 'page' parameter from the request (default to 1 if not present)
-    page = request.args.get('page', 1, type=int)
-    
-    # Query posts from the database with pagination and order by date
-    posts = Post.query.options(joinedload(Post.author)).order_by(Post.date_posted.desc()).paginate(page=page, per_page=5)
+    query = card_query()
+
+    if app.config['FEED_PAGINATION'] == 'keyset':
+        # Seek to the page using the opaque 'after'/'before' cursors
+        posts = keyset_paginate(query, after=request.args.get('after'),
+                                before=request.args.get('before'), per_page=5)
+    else:
+        # Get the 'page' parameter from the request (default to 1 if not present)
+        page = request.args.get('page', 1, type=int)
+
+        # Query posts from the database with pagination and order by date, reusing a recent total
+        posts = query.order_by(Post.date_posted.desc()).paginate(page=page, per_page=5, count=False)
+        posts.total = cached_count('feed', query)
+
+    # Record what the cached page depends on
+    page_cache.tag('feed', *(f'post:{p.id}' for p in posts.items), *(f'user:{p.user_id}' for p in posts.items))
+
+    # Answer with 304 before rendering when the client already has this page
+    response = not_modified(*listing_validators(posts))
+    if response is not None:
+        return response
 
     # Render the home page template with the retrieved posts
-    return render_template('home.html', posts=posts)
+    return render_template('home.html', posts=posts, passages=cited_passages(posts.items))
+
+# Define the route for searching posts
+@app.route("/search")
+@page_cache.cached
+def search():
+    # Get the search terms and 'page' parameter from the request
+    terms = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+
+    # Query the full-text index for ranked matches
+    results = search_posts(terms, page=max(page, 1), per_page=10)
+
+    # Record what the cached page depends on: any new or edited post may match, and each hit
+    # shows its author's name and picture
+    page_cache.tag('search', *(f'post:{hit.post.id}' for hit in results.items),
+                   *(f'user:{hit.post.user_id}' for hit in results.items))
+
+    # Render the search page template with the results
+    return render_template('search.html', title='Search', terms=terms, results=results)
+
+# Define the route listing the imported Bible versions
+@app.route("/bible")
+def bible_index():
+    # Render the Bible index page with the available versions
+    return render_template('bible_index.html', title='Bible', versions=bible_library.names())
+
+# Define the route listing the books and chapters of a Bible version
+@app.route("/bible/<string:version>")
+@page_cache.cached
+def bible_version(version):
+    # Get the version from the verse store
+    bible = bible_library.get(version)
+    if bible is None:
+        abort(404)
+    page_cache.tag(f'bible:{bible.name}')
+
+    # Collect each book with its chapter numbers
+    books = [(BOOKS[b - 1], book_slug(BOOKS[b - 1]), bible.chapters(b)) for b in bible.books()]
+
+    # Render the version page template with its books
+    return render_template('bible_version.html', title=bible.name.upper(), version=bible.name, books=books)
+
+# Define the route for reading a chapter, optionally narrowed to a verse range such as ?verses=16-18
+@app.route("/bible/<string:version>/<string:book>/<int:chapter>")
+@page_cache.cached
+def bible_chapter(version, book, chapter):
+    # Get the version and book from the verse store
+    bible = bible_library.get(version)
+    book_number = book_id(book)
+    if bible is None or book_number is None:
+        abort(404)
+    page_cache.tag(f'bible:{bible.name}')
+
+    # Read the requested verse range, defaulting to the whole chapter
+    first, _, last = request.args.get('verses', '').partition('-')
+    try:
+        first = int(first) if first else 1
+        last = int(last) if last else (first if request.args.get('verses') else None)
+    except ValueError:
+        abort(400)
+    verses = bible.passage(book_number, chapter, first, chapter, last)
+    if not verses:
+        abort(404)
+
+    # Work out the neighbouring chapters for navigation
+    name = BOOKS[book_number - 1]
+    prev_chapter = chapter - 1 if bible.verse_count_in(book_number, chapter - 1) else None
+    next_chapter = chapter + 1 if bible.verse_count_in(book_number, chapter + 1) else None
+
+    # Render the chapter page template with the verses
+    return render_template('bible_chapter.html', title=f'{name} {chapter}', version=bible.name,
+                           book=name, slug=book_slug(name), chapter=chapter, verses=verses,
+                           prev_chapter=prev_chapter, next_chapter=next_chapter)
 
 # Define the route for the about page
 @app.route("/about")
@@ -28,6 +162,16 @@ def about():
     # Render the about page template
     return render_template('about.html', title='About')
 
+# Define a function to answer a rate-limited form submission
+def too_many_attempts(template, **context):
+    flash('Too many attempts. Please wait a minute and try again.', 'danger')
+    return render_template(template, **context), 429, {'Retry-After': '60'}
+
+# Define an error handler for when the password hashing pool is saturated
+@app.errorhandler(HashingBusy)
+def hashing_busy(error):
+    return 'The server is busy. Please try again shortly.', 503, {'Retry-After': '5'}
+
 # Define the route for user registration
 @app.route("/register", methods=['GET', 'POST'])
 def register():
@@ -38,15 +182,25 @@ def register():
     # Create a RegistrationForm instance
     form = RegistrationForm()
 
+    # Refuse floods of sign-ups from one address before doing any work
+    if request.method == 'POST' and not rate_limiter.allow(('ip', request.remote_addr)):
+        return too_many_attempts('register.html', title='Register', form=form)
+
     # Validate the form on submission
     if form.validate_on_submit():
         # Generate hashed password and create a new user
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = password_hasher.hash(form.password.data)
         user = User(username=form.username.data, email=form.email.data, password=hashed_password)
         
-        # Add the new user to the database
+        # Add the new user to the database; the unique constraints settle a race with another sign-up
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as exc:
+            db.session.rollback()
+            if not add_unique_errors(form, exc):
+                raise
+            return render_template('register.html', title='Register', form=form)
         
         # Flash a success message and redirect to login page
         flash('Your account has been created! You can now log in', 'success')
@@ -65,11 +219,21 @@ def login():
     # Create a LoginForm instance
     form = LoginForm()
 
+    # Refuse repeated attempts from one address or against one username before hashing anything
+    if request.method == 'POST' and not rate_limiter.allow(('ip', request.remote_addr),
+                                                           ('user', form.username.data or '')):
+        return too_many_attempts('login.html', title='Login', form=form)
+
     # Validate the form on submission
     if form.validate_on_submit():
         # Query the user from the database and check the password
         user = User.query.filter_by(username=form.username.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and password_hasher.check(user.password, form.password.data):
+            # Upgrade the stored hash if the configured cost has changed since it was made
+            if password_hasher.needs_rehash(user.password):
+                user.password = password_hasher.hash(form.password.data)
+                db.session.commit()
+
             # Log in the user and redirect to the next page or home
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
@@ -90,22 +254,8 @@ def logout():
 
 # Define a function to save the uploaded profile picture
 def save_picture(form_picture):
-    # Generate a random hex filename and get the file extension
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    
-    # Set the file path to save the picture
-    picture_path = os.path.join(app.root_path, 'static/profiles', picture_fn)
-
-    # Open the image, resize it, and save it to the specified path
-    output_size = (125, 125)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-    i.save(picture_path)
-
-    # Return the filename
-    return picture_fn
+    # Validate the upload here; decoding and resizing happen in the image process pool
+    return save_profile_picture(form_picture)
 
 # Define the route for the user account settings
 @app.route("/account", methods=['GET', 'POST'])
@@ -116,18 +266,34 @@ def account():
 
     # Validate the form on submission
     if form.validate_on_submit():
+        user = db.session.get(User, current_user.id)
         if form.picture.data:
             # Save the new profile picture if provided
-            picture_file = save_picture(form.picture.data)
-            user = User.query.filter_by(username=current_user.username).first()
+            try:
+                picture_file = save_picture(form.picture.data)
+            except ValueError as exc:
+                flash(str(exc), 'danger')
+                return redirect(url_for('account'))
             user.image_file = picture_file
-            db.session.commit()
+            user.profile_updated_at = datetime.utcnow()
         
-        # Update the user's username and email
-        user = User.query.filter_by(username=current_user.username).first()
+        # Update the user's username and email; the picture is saved with them or not at all
+        if user.username != form.username.data:
+            user.profile_updated_at = datetime.utcnow()
         user.username = form.username.data
         user.email = form.email.data
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as exc:
+            db.session.rollback()
+            if not add_unique_errors(form, exc):
+                raise
+            image_file = profile_image_url(current_user.image_file, 'md')
+            return render_template('account.html', title='Account', image_file=image_file, form=form)
+        invalidate_session_user(user.id)
+
+        # A new name or avatar changes every cached card by this author
+        page_cache.invalidate(f'user:{user.id}')
         
         # Flash a success message and redirect to the account page
         flash('Your account has been updated!', 'success')
@@ -139,7 +305,7 @@ def account():
         form.email.data = current_user.email
     
     # Get the URL for the user's profile picture
-    image_file = url_for('static', filename='profiles/' + current_user.image_file)
+    image_file = profile_image_url(current_user.image_file, 'md')
     
     # Render the account page with the form and profile picture URL
     return render_template('account.html', title='Account', image_file=image_file, form=form)
@@ -154,10 +320,13 @@ def new_post():
     # Validate the form on submission
     if form.validate_on_submit():
         # Create a new post and add it to the database
-        user = User.query.filter_by(username=current_user.username).first()
-        post = Post(title=form.title.data, content=form.content.data, user_id=user.id)
+        post = Post(title=form.title.data, content=form.content.data, user_id=current_user.id)
         db.session.add(post)
+        db.session.flush()
+        record_new_post(post.user_id, post.date_posted)
         db.session.commit()
+        invalidate_counts()
+        page_cache.invalidate('feed', 'search', f'user:{post.user_id}')
         
         # Flash a success message and redirect to the home page
         flash('Your post has been created!', 'success')
@@ -168,12 +337,20 @@ def new_post():
 
 # Define the route for viewing a single post
 @app.route("/post/<int:post_id>")
+@page_cache.cached
 def post(post_id):
     # Get the post with the specified ID from the database
     post = Post.query.options(joinedload(Post.author)).get_or_404(post_id)
+    page_cache.tag(f'post:{post.id}', f'user:{post.user_id}')
+
+    # Answer with 304 before rendering when neither the post nor its author has changed
+    changed = [post.last_modified, post.author.profile_updated_at or post.last_modified]
+    response = not_modified(post.id, *changed, bible_stamp(), last_modified=max(changed))
+    if response is not None:
+        return response
 
     # Render the post page with the retrieved post
-    return render_template('post.html', title=post.title, post=post)
+    return render_template('post.html', title=post.title, post=post, passages=cited_passages([post]))
 
 # Define the route for updating an existing post
 @app.route("/post/<int:post_id>/update", methods=['GET', 'POST'])
@@ -183,7 +360,7 @@ def update_post(post_id):
     post = Post.query.options(joinedload(Post.author)).get_or_404(post_id)
     
     # Check if the current user is the author of the post
-    if post.author != current_user:
+    if post.user_id != current_user.id:
         abort(403)
 
     # Create a PostForm instance
@@ -194,7 +371,10 @@ def update_post(post_id):
         # Update the post title and content in the database
         post.title = form.title.data
         post.content = form.content.data
+        post.updated_at = datetime.utcnow()
         db.session.commit()
+        # The edit can change which searches the post matches, not only the pages showing it
+        page_cache.invalidate('search', f'post:{post.id}')
         
         # Flash a success message and redirect to the updated post
         flash('Your post has been updated!', 'success')
@@ -216,12 +396,16 @@ def delete_post(post_id):
     post = Post.query.options(joinedload(Post.author)).get_or_404(post_id)
     
     # Check if the current user is the author of the post
-    if post.author != current_user:
+    if post.user_id != current_user.id:
         abort(403)
     
-    # Delete the post from the database
+    # Delete the post from the database and from its author's totals, in one transaction
     db.session.delete(post)
+    db.session.flush()
+    record_deleted_post(post.user_id)
     db.session.commit()
+    invalidate_counts()
+    page_cache.invalidate('feed', 'search', f'post:{post.id}', f'user:{post.user_id}')
     
     # Flash a success message and redirect to the home page
     flash('Your post has been deleted!', 'success')
@@ -229,19 +413,65 @@ def delete_post(post_id):
 
 # Define the route for viewing posts by a specific user
 @app.route("/user/<string:username>")
+@page_cache.cached
 def user_posts(username):
-    # Get the 'page' parameter from the request (default to 1 if not present)
-    page = request.args.get('page', 1, type=int)
-    
-    # Query the user from the database
-    user = User.query.filter_by(username=username).first_or_404()
-    
-    # Query posts by the user with pagination and order by date
-    posts = Post.query.options(joinedload(Post.author)).filter_by(author=user)\
-            .order_by(Post.date_posted.desc()).paginate(page=page, per_page=5)
+    query = author_card_query(username)
+
+    if app.config['FEED_PAGINATION'] == 'keyset':
+        # Seek to the page by cursor
+        posts = keyset_paginate(query, after=request.args.get('after'),
+                                before=request.args.get('before'), per_page=5)
+    else:
+        # Get the 'page' parameter from the request (default to 1 if not present)
+        page = request.args.get('page', 1, type=int)
+
+        # Query posts by the user with pagination and order by date, without counting them
+        posts = query.order_by(Post.date_posted.desc()).paginate(page=page, per_page=5, count=False)
+
+    # The author comes with the posts; only a page without any needs its own lookup
+    if posts.items:
+        user = posts.items[0].author
+    else:
+        user = User.query.filter_by(username=username).first_or_404()
+
+    # The author's running total stands in for a COUNT(*) over their posts
+    posts.total = user.post_count
+
+    # Record what the cached page depends on
+    page_cache.tag(f'user:{user.id}', *(f'post:{p.id}' for p in posts.items))
+
+    # Answer with 304 before rendering when the client already has this page
+    response = not_modified(*listing_validators(posts, user.username, user.profile_updated_at,
+                                                user.last_posted_at))
+    if response is not None:
+        return response
 
     # Render the user posts page with the retrieved posts and user
-    return render_template('user_posts.html', posts=posts, user=user)
+    return render_template('user_posts.html', posts=posts, user=user, passages=cited_passages(posts.items))
+
+# Define the route streaming the current user's posts as newline-delimited JSON
+@app.route("/posts/export")
+@login_required
+def export_my_posts():
+    lines = export_posts(current_user.id, batch_size=app.config['POST_TRANSFER_BATCH_SIZE'])
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename={current_user.username}-posts.ndjson'})
+
+# Define the route importing newline-delimited JSON posts, attributed to the current user
+@app.route("/posts/import", methods=['POST'])
+@login_required
+def import_my_posts():
+    # Browsers cannot send this content type cross-site without a preflight, which keeps forms from posting here
+    if request.mimetype != 'application/x-ndjson':
+        return jsonify(error='Send posts as application/x-ndjson, one JSON object per line.'), 415
+
+    # Read the body line by line, so large archives never sit in memory whole
+    result = import_posts(request.stream, author_id=current_user.id,
+                          batch_size=app.config['POST_TRANSFER_BATCH_SIZE'])
+    if result.imported:
+        invalidate_counts()
+        page_cache.invalidate('feed', 'search', f'user:{current_user.id}')
+    return jsonify(result.to_dict())
 
 # Define a function to send a password reset email
 def send_reset_email(user):
@@ -253,8 +483,8 @@ def send_reset_email(user):
 
 If you did not make this request then simply ignore this email and no changes will be made.
 '''
-    # Send the email
-    mail.send(msg)
+    # Queue the email for a background worker instead of waiting on SMTP
+    mail_queue.enqueue(msg)
 
 # Define the route for requesting a password reset
 @app.route("/reset_password", methods=['GET', 'POST'])
@@ -295,11 +525,14 @@ def reset_token(token):
     # Create a ResetPasswordForm instance
     form = ResetPasswordForm()
 
+    # Refuse floods of password changes from one address before hashing anything
+    if request.method == 'POST' and not rate_limiter.allow(('ip', request.remote_addr)):
+        return too_many_attempts('reset_token.html', title='Reset Password', form=form)
+
     # Validate the form on submission
     if form.validate_on_submit():
-        # Update the user's password in the database
-        user = User.query.filter_by(id=user.id).first()
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        # Update the password of the user the token was verified against; this also spends the token
+        hashed_password = password_hasher.hash(form.password.data)
         user.password = hashed_password
         db.session.commit()
         
@@ -0,0 +1,118 @@
+# Import necessary modules for full-text search over posts
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+from flask_block import db
+from flask_block.modules import Post
+
+# Statements creating the FTS5 index over post titles and bodies and the triggers keeping it in sync
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(
+        title, content, content='post', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts (post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF title, content ON post BEGIN
+        INSERT INTO post_fts (post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO post_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+# Relative weight of a title match over a body match when ranking with BM25
+TITLE_WEIGHT = 10.0
+
+# Control characters marking matches; they cannot appear in form input, so they survive escaping
+MARK_START, MARK_END = '\x02', '\x03'
+
+# Set once the index is known to exist in this process
+_index_ready = False
+
+
+# Define a function to create the index and its triggers if they are missing
+def ensure_search_index():
+    global _index_ready
+    if _index_ready:
+        return
+    exists = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'")).first()
+    if not exists:
+        for statement in SCHEMA:
+            db.session.execute(text(statement))
+        # Index every post written before the triggers existed
+        db.session.execute(text("INSERT INTO post_fts (post_fts) VALUES ('rebuild')"))
+        db.session.commit()
+    _index_ready = True
+
+
+# Define a function to rebuild the whole index from the post table
+def rebuild_search_index():
+    global _index_ready
+    for statement in SCHEMA:
+        db.session.execute(text(statement))
+    db.session.execute(text("INSERT INTO post_fts (post_fts) VALUES ('rebuild')"))
+    db.session.execute(text("INSERT INTO post_fts (post_fts) VALUES ('optimize')"))
+    db.session.commit()
+    _index_ready = True
+    return db.session.execute(text("SELECT COUNT(*) FROM post_fts")).scalar()
+
+
+# Define a function to turn free text into an FTS5 query matching every word
+def to_match_query(terms):
+    words = re.findall(r'\w+', terms)
+    if not words:
+        return None
+    # Quote each word so FTS5 operators typed by users are taken literally; the last one matches as a prefix
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+# Define a function to escape a highlighted fragment and mark up its matches
+def _markup(fragment):
+    return Markup(str(escape(fragment)).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+# Define one page of ranked search results
+class SearchPage:
+    def __init__(self, items, page, per_page, has_next):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = page > 1
+
+
+# Define a search hit: the post plus its highlighted title and snippet
+class SearchHit:
+    def __init__(self, post, title, snippet):
+        self.post = post
+        self.title = title
+        self.snippet = snippet
+
+
+# Define a function to search posts, best BM25 matches first
+def search_posts(terms, page=1, per_page=10):
+    match = to_match_query(terms)
+    if match is None:
+        return SearchPage([], page, per_page, has_next=False)
+    ensure_search_index()
+
+    rows = db.session.execute(text(
+        "SELECT rowid, highlight(post_fts, 0, :start, :end), "
+        "snippet(post_fts, 1, :start, :end, '…', 32) "
+        "FROM post_fts WHERE post_fts MATCH :match "
+        "ORDER BY bm25(post_fts, :title_weight, 1.0) LIMIT :limit OFFSET :offset"),
+        {'start': MARK_START, 'end': MARK_END, 'match': match, 'title_weight': TITLE_WEIGHT,
+         'limit': per_page + 1, 'offset': (page - 1) * per_page}).fetchall()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    # Load the matching posts and their authors in one query, then restore rank order
+    posts = {p.id: p for p in Post.query.options(joinedload(Post.author))
+             .filter(Post.id.in_([row[0] for row in rows])).all()}
+    hits = [SearchHit(posts[row[0]], _markup(row[1]), _markup(row[2])) for row in rows if row[0] in posts]
+    return SearchPage(hits, page, per_page, has_next)
@@ -0,0 +1,80 @@
+# Import necessary modules for generating synthetic users and posts
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from flask_block import db, password_hasher
+from flask_block.modules import User, Post, summarize_content, refresh_post_stats
+
+# Vocabulary for generated bodies; words are drawn with Zipf-like weights so search behaves as on real text
+WORDS = ('the and of to in that is for he his with as faith grace lord god love hope mercy prayer '
+         'church spirit word light life peace truth kingdom heart gospel covenant shepherd psalm '
+         'promise wisdom glory praise servant blessing righteous strength joy comfort harvest '
+         'wilderness temple prophet disciple parable sabbath salvation redemption forgiveness').split()
+WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+# References sprinkled into bodies so listings resolve cited passages
+REFERENCES = ['John 3:16', 'Ps 23', 'Rom 8:28-30', 'Gen 1:1', 'Matt 5:3-12', 'Isa 40:31', 'Phil 4:13',
+              'Heb 11:1', 'Prov 3:5-6', '1 Cor 13:4-7', 'Jer 29:11', 'Eph 2:8-9']
+
+# Number of distinct bodies generated and reused; summarizing each once keeps seeding fast
+BODY_POOL = 500
+
+
+# Define a function to generate a post body of a few paragraphs
+def make_body(rng, words=(80, 600)):
+    count = rng.randint(*words)
+    tokens = rng.choices(WORDS, WEIGHTS, k=count)
+    paragraphs = []
+    for start in range(0, count, 120):
+        paragraph = ' '.join(tokens[start:start + 120]).capitalize() + '.'
+        if rng.random() < 0.3:
+            paragraph += f' See {rng.choice(REFERENCES)}.'
+        paragraphs.append(paragraph)
+    return '\n\n'.join(paragraphs)
+
+
+# Define a function bulk-inserting users and posts with executemany, returning the (users, posts) added
+def seed_database(users=1000, posts=10000, batch_size=5000, seed=1, password='password', start=None):
+    rng = random.Random(seed)
+    start = start or datetime(2020, 1, 1)
+    db.create_all()
+
+    # Every seeded account shares one hash, so seeding never waits on bcrypt
+    pw_hash = password_hasher.hash(password)
+    first_user = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    user_ids = range(first_user, first_user + users)
+    for offset in range(0, users, batch_size):
+        db.session.execute(insert(User), [
+            {'id': user_id, 'username': f'seed{user_id}', 'email': f'seed{user_id}@example.com',
+             'password': pw_hash}
+            for user_id in user_ids[offset:offset + batch_size]])
+        db.session.commit()
+
+    if not user_ids:
+        user_ids = [row[0] for row in db.session.query(User.id).all()]
+    if not user_ids:
+        return users, 0
+
+    bodies = []
+    for _ in range(BODY_POOL):
+        body = make_body(rng)
+        bodies.append((body, summarize_content(body)))
+
+    # Spread posts evenly up to now, oldest first, so keyset pages cover a realistic history
+    step = (datetime.utcnow() - start) / max(posts, 1)
+    rows = []
+    for i in range(posts):
+        body, summary = bodies[i % BODY_POOL]
+        rows.append(dict(title=f'{rng.choice(WORDS[20:]).capitalize()} devotional {i}', content=body,
+                         date_posted=start + step * i + timedelta(seconds=rng.random()),
+                         user_id=rng.choice(user_ids), **summary))
+        if len(rows) == batch_size:
+            db.session.execute(insert(Post), rows)
+            db.session.commit()
+            rows = []
+    if rows:
+        db.session.execute(insert(Post), rows)
+    # Bring every author's totals up to date in one statement, rather than per row
+    refresh_post_stats()
+    db.session.commit()
+    return users, posts
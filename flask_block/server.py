@@ -0,0 +1,63 @@
+# Import necessary modules for serving the app in production
+import os
+import importlib.util
+
+# Servers `flask serve` can run the app under, best first; only werkzeug ships with Flask
+SERVERS = ('gunicorn', 'uvicorn', 'waitress', 'werkzeug')
+
+
+# Define a function returning whether a server's package is installed
+def available(server):
+    if server == 'werkzeug':
+        return True
+    if server == 'uvicorn':
+        return bool(importlib.util.find_spec('uvicorn') and importlib.util.find_spec('a2wsgi'))
+    return importlib.util.find_spec(server) is not None
+
+
+# Define a function picking the first installed server
+def default_server():
+    return next(server for server in SERVERS if available(server))
+
+
+# Define a function to serve the app with the given number of processes and threads per process
+def serve(app, server, host, port, workers, threads):
+    if not available(server):
+        package = 'uvicorn a2wsgi' if server == 'uvicorn' else server
+        raise RuntimeError(f"{server} is not installed; try 'pip install {package}'")
+
+    if server == 'gunicorn':
+        from gunicorn.app.base import BaseApplication
+
+        # Define a gunicorn application loading this app instead of parsing a module path
+        class Application(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', f'{host}:{port}')
+                self.cfg.set('workers', workers)
+                self.cfg.set('threads', threads)
+                # gthread workers keep idle keep-alive connections from pinning a thread
+                self.cfg.set('worker_class', 'gthread' if threads > 1 else 'sync')
+                # Load once and fork; the SQLite pool is reset in each child (see database.py)
+                self.cfg.set('preload_app', True)
+
+            def load(self):
+                return app
+
+        Application().run()
+
+    elif server == 'uvicorn':
+        import uvicorn
+        # The ASGI adapter sizes its thread pool from WEB_THREADS, read when each worker imports the app
+        os.environ['WEB_THREADS'] = str(threads)
+        uvicorn.run('flask_block.asgi:application', host=host, port=port, workers=workers,
+                    log_level='warning', lifespan='off')
+
+    elif server == 'waitress':
+        import waitress
+        # waitress is a single process; scale it with threads, or run several behind a proxy
+        waitress.serve(app, host=host, port=port, threads=threads)
+
+    else:
+        from werkzeug.serving import run_simple
+        # The development server can use threads or processes, not both
+        run_simple(host, port, app, threaded=threads > 1, processes=workers if threads <= 1 else 1)
@@ -0,0 +1,118 @@
+# Import necessary modules for streaming posts in and out as newline-delimited JSON
+import json
+from datetime import datetime, timezone
+from sqlalchemy import insert, select
+from flask_block import db
+from flask_block.modules import User, Post, summarize_content, record_new_post
+
+# Longest title the Post model accepts
+TITLE_LENGTH = Post.title.property.columns[0].type.length
+
+
+# Define a function yielding one NDJSON line per post, oldest first, reading rows in fixed-size batches
+def export_posts(user_id=None, batch_size=1000):
+    statement = (select(Post.id, Post.title, Post.content, Post.date_posted, User.username)
+                 .join(User, Post.user_id == User.id)
+                 .order_by(Post.date_posted, Post.id))
+    if user_id is not None:
+        statement = statement.where(Post.user_id == user_id)
+
+    # yield_per streams from the cursor, so memory stays flat however many posts there are
+    for row in db.session.execute(statement.execution_options(yield_per=batch_size)):
+        yield json.dumps({'id': row.id, 'title': row.title, 'content': row.content,
+                          'date_posted': row.date_posted.isoformat(), 'author': row.username},
+                         ensure_ascii=False) + '\n'
+
+
+# Define the outcome of an import: rows added and the line-numbered problems that were skipped
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+
+    def to_dict(self, max_errors=20):
+        return {'imported': self.imported, 'skipped': len(self.errors),
+                'errors': [{'line': line, 'error': error} for line, error in self.errors[:max_errors]]}
+
+
+# Define a function to turn one decoded record into a row for the post table, or raise ValueError
+def _post_row(record, author_id):
+    title = record.get('title')
+    content = record.get('content')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError('missing title')
+    if len(title) > TITLE_LENGTH:
+        raise ValueError(f'title is longer than {TITLE_LENGTH} characters')
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError('missing content')
+
+    row = {'title': title, 'content': content, 'user_id': author_id, **summarize_content(content)}
+    if record.get('date_posted'):
+        try:
+            row['date_posted'] = datetime.fromisoformat(str(record['date_posted']).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError('date_posted is not an ISO 8601 timestamp')
+        # Stored dates are naive UTC like the model default
+        if row['date_posted'].tzinfo is not None:
+            row['date_posted'] = row['date_posted'].astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        row['date_posted'] = datetime.utcnow()
+    return row
+
+
+# Define a function to import NDJSON lines in chunks, each committed as one transaction.
+# With author_id set every post is attributed to that user; otherwise the record's 'author' username is used.
+def import_posts(lines, author_id=None, batch_size=1000):
+    result = ImportResult()
+    author_ids = {}
+    chunk = []
+
+    def flush():
+        # Resolve the chunk's unknown usernames in one query, then insert its rows with executemany
+        if author_id is None:
+            missing = {record.get('author') for _, record in chunk
+                       if isinstance(record, dict) and isinstance(record.get('author'), str)} - author_ids.keys()
+            if missing:
+                found = dict(db.session.execute(
+                    select(User.username, User.id).where(User.username.in_(missing))).all())
+                author_ids.update({name: found.get(name) for name in missing})
+
+        rows = []
+        for line_no, record in chunk:
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError('expected a JSON object')
+                author = record.get('author')
+                owner = author_id or (author_ids.get(author) if isinstance(author, str) else None)
+                if owner is None:
+                    raise ValueError(f'unknown author {author!r}')
+                rows.append(_post_row(record, owner))
+            except ValueError as exc:
+                result.errors.append((line_no, str(exc)))
+        if rows:
+            db.session.execute(insert(Post), rows)
+            # Add the chunk to its authors' totals rather than recounting every post they have
+            added = {}
+            for row in rows:
+                count, latest = added.get(row['user_id'], (0, row['date_posted']))
+                added[row['user_id']] = (count + 1, max(latest, row['date_posted']))
+            for owner, (count, latest) in added.items():
+                record_new_post(owner, latest, count)
+            db.session.commit()
+            result.imported += len(rows)
+        chunk.clear()
+
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            chunk.append((line_no, json.loads(line)))
+        except json.JSONDecodeError as exc:
+            result.errors.append((line_no, f'invalid JSON: {exc.msg}'))
+        except UnicodeDecodeError:
+            result.errors.append((line_no, 'not valid UTF-8'))
+        if len(chunk) >= batch_size:
+            flush()
+    if chunk:
+        flush()
+    return result
@@ -1,4 +1,5 @@
 from flask_block import app
 
+# Development server only; in production use `flask --app flask_block serve` (see flask_block/server.py)
 if __name__ == '__main__':
     app.run(debug=True)
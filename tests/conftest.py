@@ -0,0 +1,57 @@
+# Shared fixtures: the app runs against a throwaway SQLite database, configured before it is imported
+import os
+import shutil
+import tempfile
+
+import pytest
+
+DATA_DIR = tempfile.mkdtemp(prefix='flask_block_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DATA_DIR, 'test.db')
+os.environ.setdefault('SECRET_KEY', 'tests')
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+os.environ['PAGE_CACHE_TYPE'] = 'null'
+os.environ['MAIL_QUEUE_ASYNC'] = '0'
+os.environ['MAIL_QUEUE_PATH'] = os.path.join(DATA_DIR, 'mail_queue.db')
+os.environ['PROFILE_IMAGE_ASYNC'] = '0'
+os.environ['RATE_LIMIT_PATH'] = os.path.join(DATA_DIR, 'rate_limit.db')
+
+from flask_block import app as flask_app, db, bcrypt
+from flask_block.modules import User, _session_users
+
+
+# Define a fixture giving the app on an empty database. Tests open their own app context around
+# direct database work, so each request gets a fresh one (and a fresh `g`), as in production.
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+    _session_users.clear()
+    yield flask_app
+    with flask_app.app_context():
+        db.drop_all()
+
+
+# Define a fixture adding one account, returning its id
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        user = User(username='alice', email='alice@example.com',
+                    password=bcrypt.generate_password_hash('secret').decode('utf-8'))
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+# Define a fixture for a test client already logged in as the `user_id` account
+@pytest.fixture
+def client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
@@ -0,0 +1,52 @@
+# Tests for updating the account settings in one transaction
+import io
+
+import pytest
+
+from flask_block import db, bcrypt
+from flask_block import forms, routes
+from flask_block.modules import User, load_user
+
+
+@pytest.fixture
+def saved_pictures(monkeypatch):
+    # The image pipeline is not under test; pretend every upload was stored under one name
+    monkeypatch.setattr(routes, 'save_picture', lambda picture: 'abcdef012345.webp')
+
+
+def account_form(**fields):
+    data = {'username': 'alice', 'email': 'alice@example.com',
+            'picture': (io.BytesIO(b'picture'), 'me.png')}
+    data.update(fields)
+    return data
+
+
+def test_picture_is_not_saved_when_the_details_are_rejected(client, app, user_id, saved_pictures, monkeypatch):
+    with app.app_context():
+        db.session.add(User(username='bob', email='bob@example.com',
+                            password=bcrypt.generate_password_hash('secret').decode('utf-8')))
+        db.session.commit()
+    # Another request takes the email after the form validated, so only the constraint catches it
+    monkeypatch.setattr(forms, 'taken_fields', lambda *args, **kwargs: [])
+
+    response = client.post('/account', data=account_form(email='bob@example.com'),
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert b'That email is taken' in response.data
+    with app.app_context():
+        assert db.session.get(User, user_id).image_file == 'default.jpg'
+
+
+def test_picture_and_details_are_saved_together(client, app, user_id, saved_pictures):
+    client.get('/account')
+
+    response = client.post('/account', data=account_form(username='alicia'),
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 302
+    with app.app_context():
+        saved = db.session.get(User, user_id)
+        assert (saved.username, saved.image_file) == ('alicia', 'abcdef012345.webp')
+        # The cached session user was dropped, so the next request sees the new details
+        assert load_user(user_id).image_file == 'abcdef012345.webp'
@@ -0,0 +1,39 @@
+# Tests for keeping fingerprinted assets reachable across a rebuild
+import os
+import shutil
+from flask import url_for
+from flask_block import assets
+
+
+def test_rebuild_keeps_the_previous_files_and_workers_follow_it(app, tmp_path, monkeypatch):
+    static = tmp_path / 'static'
+    shutil.copytree(app.static_folder, static, ignore=shutil.ignore_patterns('dist', 'profiles'))
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    monkeypatch.setattr(assets, 'MANIFEST', str(static / 'dist' / 'manifest.json'))
+    monkeypatch.setattr(assets, 'manifest', {'files': {}, 'encodings': {}, 'previous': {}})
+    monkeypatch.setattr(assets, '_manifest_mtime', None)
+
+    first = assets.build_assets()['files']['main.css']
+    # What a worker that loaded this build still holds after another process rebuilt
+    loaded, loaded_mtime = dict(assets.manifest), assets._manifest_mtime
+    with open(static / 'main.css', 'a') as f:
+        f.write('\n.changed { color: red; }\n')
+    second = assets.build_assets()['files']['main.css']
+    assets.manifest.update(loaded)
+    assets._manifest_mtime = loaded_mtime
+
+    client = app.test_client()
+    # Pages rendered before the rebuild still find the old file
+    assert client.get(f'/static/{first}').status_code == 200
+    assert client.get(f'/static/{second}').status_code == 200
+    # The worker noticed the new manifest on its next request and links the new build
+    with app.test_request_context():
+        app.preprocess_request()
+        assert url_for('static', filename='main.css') == f'/static/{second}'
+
+    # The next rebuild drops the first build
+    with open(static / 'main.css', 'a') as f:
+        f.write('\n.again { color: blue; }\n')
+    assets.build_assets()
+    assert not os.path.exists(static / first)
+    assert os.path.exists(static / second)
@@ -0,0 +1,35 @@
+# Tests for picking up a re-imported Bible version in processes that already opened the old one
+from flask_block import bible_library, page_cache
+from flask_block.bible import BibleLibrary, write_version
+from flask_block.cache import LRUBackend
+
+
+def test_library_reopens_a_version_replaced_by_another_process(tmp_path):
+    library = BibleLibrary(str(tmp_path))
+    write_version(library.path_for('test'), [(43, 3, 16, 'For God so loved the world')])
+    old = library.get('test')
+    assert library.get('test') is old
+
+    # Another process imports a new text, without this library being told
+    write_version(library.path_for('test'), [(43, 3, 16, 'For God so loved the world, that he gave')])
+    new = library.get('test')
+
+    assert new is not old
+    assert new.stamp != old.stamp
+    assert new.verse(43, 3, 16).text.endswith('that he gave')
+    # Requests still holding the old version can finish reading it
+    assert old.verse(43, 3, 16).text == 'For God so loved the world'
+
+
+def test_bible_import_drops_cached_pages_of_the_version(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(bible_library, 'directory', str(tmp_path / 'bible'))
+    monkeypatch.setattr(page_cache, 'backend', LRUBackend(16, 300))
+    page_cache.backend.set('bible_chapter:/bible/test/john/3?', b'old page', {'bible:test'})
+    source = tmp_path / 'test.csv'
+    source.write_text('book,chapter,verse,text\nJohn,3,16,For God so loved the world\n')
+
+    result = app.test_cli_runner().invoke(args=['bible-import', 'TEST', str(source)])
+
+    assert result.exit_code == 0, result.output
+    assert page_cache.backend.get('bible_chapter:/bible/test/john/3?') is None
+    assert bible_library.get('test').verse(43, 3, 16).text == 'For God so loved the world'
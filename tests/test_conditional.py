@@ -0,0 +1,28 @@
+# Tests for the validators listings send to conditional GETs
+from datetime import datetime, timedelta
+
+from flask_block import db
+from flask_block.modules import Post, record_new_post
+
+
+def test_listing_changes_after_deleting_the_newest_post(client, app, user_id):
+    with app.app_context():
+        posted = datetime(2024, 1, 1)
+        for n, title in enumerate(['Older', 'Newest']):
+            post = Post(title=title, content='Notes', user_id=user_id, date_posted=posted + timedelta(days=n))
+            db.session.add(post)
+            db.session.commit()
+            record_new_post(user_id, post.date_posted)
+        newest = post.id
+    visitor = app.test_client()
+    before = visitor.get('/')
+    assert 'Last-Modified' not in before.headers
+
+    client.post(f'/post/{newest}/delete')
+
+    # Neither a client revalidating by the old newest date nor one sending the old ETag gets a 304
+    assert visitor.get('/', headers={'If-Modified-Since': 'Tue, 02 Jan 2024 00:00:00 GMT'}).status_code == 200
+    response = visitor.get('/', headers={'If-None-Match': before.headers['ETag']})
+    assert response.status_code == 200
+    assert b'Newest' not in response.data
+    assert visitor.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
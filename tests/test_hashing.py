@@ -0,0 +1,38 @@
+# Tests for the bounded password hashing pool
+import threading
+
+import pytest
+from flask import Flask
+
+from flask_block.hashing import HashingBusy, PasswordHasher
+
+
+# Define a stand-in for Flask-Bcrypt whose hashes wait until the test lets them finish
+class SlowBcrypt:
+    def __init__(self):
+        self.finish = threading.Event()
+        self.finished = threading.Event()
+
+    def generate_password_hash(self, password, rounds):
+        self.finish.wait(10)
+        self.finished.set()
+        return b'$2b$04$hash'
+
+
+def test_a_timed_out_hash_keeps_its_slot_until_it_finishes():
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_DEPTH=0, PASSWORD_HASH_TIMEOUT=0.05)
+    bcrypt = SlowBcrypt()
+    hasher = PasswordHasher(app, bcrypt)
+
+    # The caller gives up, which the error handler answers with a 503
+    with pytest.raises(HashingBusy):
+        hasher.hash('secret')
+    # The abandoned hash is still running, so the pool stays full
+    with pytest.raises(HashingBusy):
+        hasher.hash('secret')
+
+    bcrypt.finish.set()
+    bcrypt.finished.wait(10)
+    hasher._pool.shutdown(wait=True)
+    assert hasher._slots.acquire(blocking=False)
@@ -0,0 +1,39 @@
+# Tests for accepting profile pictures only once every derived size has been written
+import io
+
+import pytest
+from PIL import Image
+
+from flask_block import app
+from flask_block.images import save_profile_picture
+
+
+def png_bytes(size=300):
+    buffer = io.BytesIO()
+    Image.radial_gradient('L').resize((size, size)).convert('RGB').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture(params=[False, True], ids=['sync', 'async'])
+def profiles(request, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILE_IMAGE_ASYNC', request.param)
+    monkeypatch.setattr(app, 'root_path', str(tmp_path))
+    directory = tmp_path / 'static' / 'profiles'
+    directory.mkdir(parents=True)
+    return directory
+
+
+def test_picture_is_saved_in_every_size(profiles):
+    image_file = save_profile_picture(io.BytesIO(png_bytes()))
+
+    base, fmt = image_file.split('.')
+    assert sorted(p.name for p in profiles.iterdir()) == sorted(
+        f'{base}_{label}.{fmt}' for label in app.config['PROFILE_IMAGE_SIZES'])
+
+
+def test_truncated_picture_is_refused(profiles):
+    data = png_bytes()
+
+    with pytest.raises(ValueError, match='not a valid image'):
+        save_profile_picture(io.BytesIO(data[:len(data) // 2]))
+    assert list(profiles.iterdir()) == []
@@ -0,0 +1,83 @@
+# Tests for who may read /metrics; metrics are configured at import, so each case runs the app afresh
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Print the status of /metrics for a caller on the loopback address, with and without the token
+PROBE = """
+from flask_block import app
+client = app.test_client()
+local = {'REMOTE_ADDR': '127.0.0.1'}
+print(client.get('/metrics', environ_base=local).status_code,
+      client.get('/metrics', environ_base=local, headers={'Authorization': 'Bearer s3cret'}).status_code)
+"""
+
+
+def probe(tmp_path, **env):
+    env = dict({k: v for k, v in os.environ.items() if k != 'METRICS_TOKEN'}, METRICS_ENABLED='1',
+               DATABASE_URL=f'sqlite:///{tmp_path / "metrics.db"}', PAGE_CACHE_TYPE='null', **env)
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def test_metrics_are_not_served_without_a_token(tmp_path):
+    assert probe(tmp_path) == ['404', '404']
+
+
+def test_local_callers_need_the_token_too(tmp_path):
+    assert probe(tmp_path, METRICS_TOKEN='s3cret') == ['403', '200']
+
+
+# Print the statuses of overlapping sampled requests, of one while another profiler is active and of
+# one failing, then the endpoints whose profiles were kept
+PROFILE_PROBE = """
+import cProfile
+import threading
+from flask_block import app, metrics
+
+app.config['PROPAGATE_EXCEPTIONS'] = False
+started, finish = threading.Event(), threading.Event()
+
+def slow():
+    started.set()
+    finish.wait(10)
+    return 'done'
+
+def fail():
+    raise RuntimeError('boom')
+
+app.add_url_rule('/slow', 'slow', slow)
+app.add_url_rule('/fail', 'fail', fail)
+statuses = []
+worker = threading.Thread(target=lambda: statuses.append(app.test_client().get('/slow').status_code))
+worker.start()
+started.wait(10)
+statuses.append(app.test_client().get('/about').status_code)
+finish.set()
+worker.join()
+
+# What Python 3.12 raises when another profiling tool is active
+class Busy(cProfile.Profile):
+    def enable(self):
+        raise ValueError('Another profiling tool is already active')
+
+cProfile.Profile, real = Busy, cProfile.Profile
+statuses.append(app.test_client().get('/about').status_code)
+cProfile.Profile = real
+statuses.append(app.test_client().get('/fail').status_code)
+statuses.append(app.test_client().get('/about').status_code)
+print(*statuses, *(endpoint for _, endpoint, _, _ in metrics.slow_profiles))
+"""
+
+
+def test_sampled_requests_never_start_a_second_profiler(tmp_path):
+    env = dict(os.environ, METRICS_ENABLED='1', METRICS_PROFILE_SAMPLE_RATE='1', METRICS_SLOW_REQUEST_SECONDS='0',
+               DATABASE_URL=f'sqlite:///{tmp_path / "metrics.db"}', PAGE_CACHE_TYPE='null')
+    result = subprocess.run([sys.executable, '-c', PROFILE_PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    # Neither the /about overlapping /slow nor the one under another profiler is profiled, and both
+    # are served; the failed request still lets the last one be profiled
+    assert result.stdout.split() == ['200', '200', '200', '500', '200', 'slow', 'fail', 'about']
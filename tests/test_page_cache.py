@@ -0,0 +1,125 @@
+# Tests for the page cache's in-process backend and the invalidation log its worker processes share
+import multiprocessing
+
+import pytest
+
+from flask_block import db, page_cache
+from flask_block.cache import InvalidationLog, LRUBackend
+from flask_block.modules import Post
+
+fork = multiprocessing.get_context('fork')
+
+
+# Define a function running `action` in a forked child, as another worker process would
+def in_other_process(action):
+    process = fork.Process(target=action)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+def make_backend(tmp_path, **log_options):
+    return LRUBackend(16, 300, InvalidationLog(str(tmp_path / 'invalidations.log'), **log_options))
+
+
+def test_invalidation_in_another_process_drops_tagged_pages(tmp_path):
+    backend = make_backend(tmp_path)
+    backend.set('home', b'feed page', {'feed'})
+    backend.set('about', b'about page', {'about'})
+
+    in_other_process(lambda: backend.invalidate(['feed']))
+
+    assert backend.get('home') is None
+    assert backend.get('about') == b'about page'
+
+
+def test_own_invalidations_are_not_applied_twice(tmp_path):
+    backend = make_backend(tmp_path)
+    backend.invalidate(['feed'])
+    # Re-rendered after the invalidation, so it must survive the next poll of the log
+    backend.set('home', b'new feed page', {'feed'})
+
+    assert backend.get('home') == b'new feed page'
+
+
+def test_page_rendered_before_an_invalidation_is_not_stored(tmp_path):
+    backend = make_backend(tmp_path)
+    since = backend.generation()
+    # The post is edited while the feed is being rendered from the old data
+    backend.invalidate(['post:1'])
+    backend.set('home', b'stale feed page', {'feed', 'post:1'}, since)
+    backend.set('about', b'about page', {'about'}, since)
+
+    assert backend.get('home') is None
+    assert backend.get('about') == b'about page'
+
+
+def test_invalidation_in_another_process_during_a_render_keeps_the_page_out(tmp_path):
+    backend = make_backend(tmp_path)
+    since = backend.generation()
+
+    in_other_process(lambda: backend.invalidate(['feed']))
+    backend.set('home', b'stale feed page', {'feed'}, since)
+
+    assert backend.get('home') is None
+    # Rendered after the invalidation, it is stored
+    backend.set('home', b'new feed page', {'feed'}, backend.generation())
+    assert backend.get('home') == b'new feed page'
+
+
+def test_forgotten_invalidations_keep_old_renders_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(LRUBackend, 'MAX_INVALIDATED', 2)
+    backend = make_backend(tmp_path)
+    since = backend.generation()
+    backend.invalidate(['post:1'])
+    backend.invalidate(['post:2'])
+    backend.invalidate(['post:3'])
+
+    backend.set('home', b'stale feed page', {'feed', 'post:1'}, since)
+
+    assert backend.get('home') is None
+
+
+def test_clear_in_another_process_drops_everything(tmp_path):
+    backend = make_backend(tmp_path)
+    backend.set('home', b'feed page', {'feed'})
+
+    in_other_process(backend.clear)
+
+    assert backend.get('home') is None
+    assert len(backend) == 0
+
+
+def test_rotated_log_drops_everything_once(tmp_path):
+    backend = make_backend(tmp_path, max_bytes=64)
+    backend.set('about', b'about page', {'about'})
+
+    in_other_process(lambda: backend.invalidate([f'user:{n}' for n in range(10)]))
+
+    assert backend.get('about') is None
+    backend.set('about', b'about page', {'about'})
+    assert backend.get('about') == b'about page'
+
+
+@pytest.fixture
+def cached_pages(app, monkeypatch):
+    monkeypatch.setattr(page_cache, 'backend', LRUBackend(16, 300))
+
+
+def test_editing_a_post_refreshes_cached_searches(client, app, user_id, cached_pages):
+    with app.app_context():
+        post = Post(title='Psalm notes', content='The Lord is my shepherd', user_id=user_id)
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+    visitor = app.test_client()
+    assert visitor.get('/search?q=still+waters').headers['X-Cache'] == 'MISS'
+    assert visitor.get('/search?q=still+waters').headers['X-Cache'] == 'HIT'
+
+    updated = client.post(f'/post/{post_id}/update',
+                          data={'title': 'Psalm notes', 'content': 'He leadeth me beside the still waters'})
+    response = visitor.get('/search?q=still+waters')
+
+    assert updated.status_code == 302
+    assert response.headers['X-Cache'] == 'MISS'
+    assert b'Psalm notes' in response.data
@@ -0,0 +1,30 @@
+# Tests for the summary fields derived from a post's content
+from flask_block.modules import Post, EXCERPT_LENGTH, summarize_references
+
+
+def test_summarize_references_lists_each_passage_once():
+    content = 'See John 3:16 and Rom 8:28. Again, John 3:16! And Romans 8:28 too.'
+
+    assert summarize_references(content) == 'John 3:16; Romans 8:28'
+
+
+def make_post(content):
+    return Post(title='Title', content=content, user_id=1)
+
+
+def test_short_post_ending_in_ellipsis_is_not_truncated():
+    assert not make_post('And then there was silence…').is_truncated
+
+
+def test_long_post_is_truncated():
+    post = make_post('word ' * (EXCERPT_LENGTH // 2))
+
+    assert post.excerpt.endswith('…')
+    assert post.is_truncated
+
+
+def test_post_filling_the_excerpt_is_not_truncated():
+    post = make_post(('abcd ' * EXCERPT_LENGTH)[:EXCERPT_LENGTH - 1])
+
+    assert post.excerpt == post.content
+    assert not post.is_truncated
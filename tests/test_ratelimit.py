@@ -0,0 +1,57 @@
+# Tests for the token-bucket rate limiter and the bucket storage its worker processes share
+import multiprocessing
+
+import pytest
+
+from flask_block.ratelimit import MemoryBuckets, SQLiteBuckets
+
+fork = multiprocessing.get_context('fork')
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBuckets(100)
+    return SQLiteBuckets(str(tmp_path / 'rate_limit.db'))
+
+
+def test_burst_is_allowed_then_refused(buckets):
+    results = [buckets.take([('ip', '10.0.0.1')], 3, 1 / 60) for _ in range(5)]
+
+    assert results == [True, True, True, False, False]
+
+
+def test_refused_attempt_spends_no_token_from_other_keys(buckets):
+    assert buckets.take([('ip', '10.0.0.1')], 1, 1 / 60)
+    assert not buckets.take([('user', 'alice'), ('ip', '10.0.0.1')], 1, 1 / 60)
+
+    assert buckets.take([('user', 'alice')], 1, 1 / 60)
+
+
+def test_clear_refills_every_bucket(buckets):
+    buckets.take([('ip', '10.0.0.1')], 1, 1 / 60)
+    buckets.clear()
+
+    assert buckets.take([('ip', '10.0.0.1')], 1, 1 / 60)
+
+
+# Define a function taking `attempts` tokens in a forked child, as another worker process would
+def attempt_in_other_process(buckets, attempts, results):
+    def run():
+        results.put([buckets.take([('ip', '10.0.0.1')], 10, 1 / 60) for _ in range(attempts)])
+    process = fork.Process(target=run)
+    process.start()
+    return process
+
+
+def test_sqlite_buckets_hold_the_limit_across_processes(tmp_path):
+    buckets = SQLiteBuckets(str(tmp_path / 'rate_limit.db'))
+    # The parent's open connection must not be used by the forked children
+    assert buckets.take([('ip', '10.0.0.1')], 10, 1 / 60)
+    results = fork.Queue()
+    processes = [attempt_in_other_process(buckets, 6, results) for _ in range(4)]
+    allowed = sum(sum(results.get()) for _ in processes)
+    for process in processes:
+        process.join()
+
+    assert allowed == 9
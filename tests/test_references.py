@@ -0,0 +1,42 @@
+# Tests for resolving the scripture references a page of posts cites
+from types import SimpleNamespace
+
+from flask_block.references import INLINE_VERSES, resolve_passages
+
+
+# Define a stand-in Bible where every chapter has 30 verses
+class FakeBible:
+    name = 'test'
+
+    def passage(self, book, chapter, verse, end_chapter=None, end_verse=None, limit=None):
+        verses = [SimpleNamespace(chapter=c, verse=v, text=f'{book}:{c}:{v}')
+                  for c in range(chapter, (end_chapter or chapter) + 1) for v in range(1, 31)
+                  if (c, v) >= (chapter, verse) and (c, v) <= (end_chapter or chapter, end_verse or 30)]
+        return verses[:limit]
+
+
+def test_repeated_references_are_shown_once_in_order():
+    post = SimpleNamespace(id=1, scripture_refs='John 3:16; Rom 8:28; John 3:16; Ps 23:1; Rom 8:28')
+
+    passages = resolve_passages([post], FakeBible())
+
+    assert [p.reference.label for p in passages[1]] == ['John 3:16', 'Romans 8:28', 'Psalms 23:1']
+
+
+def test_repeats_do_not_use_up_the_limit():
+    post = SimpleNamespace(id=1, scripture_refs='Gen 1:1; Gen 1:1; Gen 1:1; Exod 3:14; Ps 23:1')
+
+    passages = resolve_passages([post], FakeBible(), limit_per_post=3)
+
+    assert len(passages[1]) == 3
+
+
+def test_long_passages_are_cut_short():
+    post = SimpleNamespace(id=1, scripture_refs='Ps 1-150; John 3:16')
+
+    psalms, john = resolve_passages([post], FakeBible())[1]
+
+    assert len(psalms.verses) == INLINE_VERSES
+    assert psalms.truncated
+    assert [v[1] for v in john.verses] == [16]
+    assert not john.truncated
@@ -0,0 +1,86 @@
+# Tests for the session-user identity cache behind Flask-Login's user loader
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from flask_block import db
+from flask_block.modules import User, load_user, invalidate_session_user
+
+
+# Define a context manager collecting the statements issued while it is open
+@contextmanager
+def counted_statements(app):
+    statements = []
+
+    def capture(conn, cursor, statement, *rest):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+
+def rename(app, user_id, username):
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.id == user_id).values(username=username))
+        db.session.commit()
+
+
+def test_load_user_queries_once_then_serves_from_cache(app, user_id):
+    with app.app_context():
+        with counted_statements(app) as cold:
+            loaded = load_user(user_id)
+        with counted_statements(app) as warm:
+            again = load_user(str(user_id))
+
+    assert loaded.username == 'alice'
+    assert len(cold) == 1
+    assert len(warm) == 0
+    assert again is loaded
+
+
+def test_invalidate_session_user_reloads_changed_row(app, user_id):
+    with app.app_context():
+        load_user(user_id)
+    rename(app, user_id, 'alicia')
+
+    with app.app_context():
+        assert load_user(user_id).username == 'alice'
+        invalidate_session_user(user_id)
+        with counted_statements(app) as statements:
+            assert load_user(user_id).username == 'alicia'
+    assert len(statements) == 1
+
+
+def test_load_user_missing_row(app):
+    with app.app_context():
+        with counted_statements(app) as statements:
+            assert load_user(999) is None
+    assert len(statements) == 1
+
+
+def test_account_request_with_cached_user_issues_no_query(client, app):
+    # The account page reads only the session user, so the first request's one query is the loader's
+    with counted_statements(app) as cold:
+        assert client.get('/account').status_code == 200
+    with counted_statements(app) as warm:
+        assert client.get('/account').status_code == 200
+
+    assert len(cold) == 1
+    assert warm == []
+
+
+def test_account_update_survives_rename_by_another_worker(client, app, user_id):
+    client.get('/account')
+    # Another worker renames the user; this process still holds the old name in its cache
+    rename(app, user_id, 'renamed')
+
+    response = client.post('/account', data={'username': 'alice2', 'email': 'alice@example.com'})
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(User, user_id).username == 'alice2'
@@ -0,0 +1,30 @@
+# Tests for importing posts as newline-delimited JSON
+import json
+from datetime import datetime
+
+from flask_block import db, bcrypt
+from flask_block.modules import User, Post, record_new_post
+from flask_block.transfer import import_posts
+
+
+def test_import_adds_each_chunk_to_the_authors_totals(app, user_id):
+    with app.app_context():
+        db.session.add(User(username='bob', email='bob@example.com',
+                            password=bcrypt.generate_password_hash('secret').decode('utf-8')))
+        post = Post(title='Already here', content='Notes', user_id=user_id, date_posted=datetime(2024, 6, 1))
+        db.session.add(post)
+        record_new_post(user_id, post.date_posted)
+        db.session.commit()
+
+        records = [('alice', '2024-01-01T00:00:00'), ('bob', '2024-03-01T00:00:00'),
+                   ('alice', '2024-07-01T00:00:00'), ('bob', '2024-02-01T00:00:00'),
+                   ('nobody', '2024-08-01T00:00:00')]
+        lines = [json.dumps({'title': f'Post {n}', 'content': 'Notes', 'author': author, 'date_posted': posted})
+                 for n, (author, posted) in enumerate(records)]
+        result = import_posts(lines, batch_size=2)
+
+        assert result.to_dict()['imported'] == 4
+        assert result.errors == [(5, "unknown author 'nobody'")]
+        alice, bob = db.session.get(User, user_id), User.query.filter_by(username='bob').one()
+        assert (alice.post_count, alice.last_posted_at) == (3, datetime(2024, 7, 1))
+        assert (bob.post_count, bob.last_posted_at) == (2, datetime(2024, 3, 1))